@@ -7,6 +7,7 @@ import cv2
 import numpy
 import time
 from experiment.VideoHandler import VideoHandler
+from camera.recording_paths import list_recordings
 
 
 class AnalysisDialog(QDialog, Ui_Dialog):
@@ -61,6 +62,10 @@ class AnalysisDialog(QDialog, Ui_Dialog):
 
         self.checkbox_analyze.toggled.connect(lambda x: self.analyze_checked(x))
 
+        # Analysis of a whole video in the background, independent of playback
+        self.analysis_worker = None
+        self.btn_analyze_video.clicked.connect(self.analyze_video_clicked)
+
     def analyze_checked(self, analyze):
         """
         Run when checkbox 'analyze' is toggled, sets flag indicating if analysis should be performed or not.
@@ -69,6 +74,56 @@ class AnalysisDialog(QDialog, Ui_Dialog):
         """
         self.video_handler.set_analyze(analyze)
 
+    def analyze_video_clicked(self):
+        """
+        User clicks analyze video button, starts analysing the selected video in the background, or cancels the running
+        analysis
+        :return: None
+        """
+        if self.analysis_worker is not None and self.analysis_worker.isRunning():
+            self.analysis_worker.cancel()
+            self.btn_analyze_video.setEnabled(False)
+            return
+        # both write the same result files, playback analysis stays off until the background analysis is done
+        self.checkbox_analyze.setChecked(False)
+        worker = self.video_handler.new_analysis_worker()
+        if worker is None:
+            return
+        self.analysis_worker = worker
+        self.analysis_worker.signal_progress.connect(lambda x: self.update_analysis_progress(x))
+        self.analysis_worker.signal_analysis_done.connect(lambda x: self.analysis_done(x))
+        self.progress_analysis.setValue(0)
+        self.label_analysis_eta.setText("Starting...")
+        self.btn_analyze_video.setText("Cancel Analysis")
+        self.checkbox_analyze.setEnabled(False)
+        self.analysis_worker.start()
+
+    def update_analysis_progress(self, progress):
+        """
+        Show progress of the background analysis
+        :param progress: Dictionary object formatted as {'frames': int, 'total': int, 'fps': float, 'eta': float}
+        :return: None
+        """
+        self.progress_analysis.setMaximum(max(progress["total"], 1))
+        self.progress_analysis.setValue(progress["frames"])
+        eta = int(progress["eta"])
+        if eta >= 0:
+            self.label_analysis_eta.setText("%d fps, %02d:%02d:%02d left" % (progress["fps"], eta // 3600,
+                                                                             eta // 60 % 60, eta % 60))
+
+    def analysis_done(self, result):
+        """
+        Background analysis finished, failed or was cancelled
+        :param result: Dictionary object formatted as {'video': str, 'success': bool, 'message': str}
+        :return: None
+        """
+        if result["success"]:
+            self.progress_analysis.setValue(self.progress_analysis.maximum())
+        self.label_analysis_eta.setText(result["video"] + ": " + result["message"])
+        self.btn_analyze_video.setText("Analyze Video")
+        self.btn_analyze_video.setEnabled(True)
+        self.checkbox_analyze.setEnabled(True)
+
     def keypress_play_pause(self):
         """
         Pauses or plays video when user presses appropriate key (defined in class constructor)
@@ -213,10 +268,10 @@ class AnalysisDialog(QDialog, Ui_Dialog):
         self.video_handler.current_video.set(cv2.CAP_PROP_POS_FRAMES, index)
         if index >= self.prev_playback_slider_index:
             self.video_handler.skip_frame_forward(slider=True)
-            self.format_label_current_run_time({"label_val" : int(index/self.video_handler.fps)})
+            self.format_label_current_run_time({"label_val" : int(self.video_handler.frame_to_seconds(index))})
         else:
             self.video_handler.skip_frame_backwards(slider=True)
-            self.format_label_current_run_time({"label_val": int(index / self.video_handler.fps)})
+            self.format_label_current_run_time({"label_val": int(self.video_handler.frame_to_seconds(index))})
 
         self.prev_playback_slider_index = index
 
@@ -236,6 +291,7 @@ class AnalysisDialog(QDialog, Ui_Dialog):
         """
         print(event)
         self.video_handler.is_alive = False
+        self.shutdown_analysis_worker()
 
     def shutdown_video_handler(self):
         """
@@ -244,15 +300,24 @@ class AnalysisDialog(QDialog, Ui_Dialog):
         """
         self.video_handler.is_alive = False
 
+    def shutdown_analysis_worker(self):
+        """
+        Cancel a running background analysis and wait for it to stop, its processes stop within 100 frames
+        :return: None
+        """
+        if self.analysis_worker is not None:
+            self.analysis_worker.cancel()
+            self.analysis_worker.wait()
+
     def populate_video_list(self):
         """
-        Loads all .avi recordings from the current video path and displays in list
+        Loads all .avi recordings and striped recording manifests from the current video path and displays in list,
+        proxy recordings and individual stripes are left out
         :return: None
         """
         self.list_recordings.clear()
-        for v in os.listdir(self.video_path):
-            if v[-4:len(v)] == ".avi":
-                self.list_recordings.addItem(v)
+        for v in list_recordings(self.video_path):
+            self.list_recordings.addItem(v)
 
     def format_label_current_run_time(self, run_time):
         """
@@ -16,7 +16,8 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
                  stimulus_path="stimulus/stimulus_profiles/",
                  experiments_path="experiment/experiment_profiles/",
                  video_path="experiment/videos/",
-                 logs_path="experiment/logs/"):
+                 logs_path="experiment/logs/",
+                 analysis_queue=None):
         """
 
         :param settings_dialog: Instance of SettingsDialog.py
@@ -29,6 +30,8 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
         :param experiments_path: string indicating path to load experiment profiles from
         :param video_path: string indicating path to load videos from
         :param logs_path: string indicating path to load logs from (NOT IN USE)
+        :param analysis_queue: instance of AnalysisQueue.py recordings are analysed by after an experiment, None to not
+        analyse automatically
         """
 
         super().__init__()
@@ -45,6 +48,7 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
         self.camera = camera
         self.camera.cam_connected_signal.connect(self.show_camera_status)
         self.camera.emit_cam_status()
+        self.analysis_queue = analysis_queue
 
         """Init Run Settings"""
         self.thread_pool = QThreadPool()
@@ -54,6 +58,8 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
         self.experiments_path = experiments_path
         self.show_experiment_profile_names()
         self.current_experiment = None
+        # ROIs of the current experiment, there is no editor for them, they are kept as set in the profile
+        self.rois = []
         self.list_exp_profiles.itemDoubleClicked.connect(self.add_experiment_to_run)
 
         self.list_experiments_to_run.itemClicked.connect(self.view_experiment_to_run)
@@ -72,6 +78,13 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
         self.spin_duration_sec.valueChanged.connect(self.format_duration_text)
 
         self.btn_run.clicked.connect(self.run_experiment)
+        # Arming the recorder creates the video file, so it is only armed once the video path and the save video setting
+        # have not changed for a moment
+        self.arm_timer = QTimer()
+        self.arm_timer.setSingleShot(True)
+        self.arm_timer.setInterval(2000)
+        self.arm_timer.timeout.connect(self.arm_recorder)
+        self.checkbox_save_video.toggled.connect(self.rearm_recorder)
 
         self.running_experiment_dialog = running_experiment_dialog
         self.running_experiment_dialog.buttonBox.accepted.connect(self.abort_experiment_run)
@@ -277,6 +290,7 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
         self.checkbox_drugs.setChecked(settings["drugs"])
         self.line_edit_drug_name.setText(settings["drug_name"])
         self.spin_crowdsize.setValue(settings["crowd_size"])
+        self.rois = settings.get("rois", [])
 
     def set_video_path(self):
         """
@@ -292,6 +306,7 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
             if self.camera.set_video_path(path):
                 self.video_path = path + "/"
                 self.line_edit_video_path.setText(path + "/")
+        self.rearm_recorder()
 
     def set_video_path_no_dialog(self, path):
         """
@@ -303,6 +318,28 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
             if self.camera.set_video_path(path, self.video_name):
                 self.video_path = path
                 self.line_edit_video_path.setText(path + "/" + self.video_name)
+        self.rearm_recorder()
+
+    def rearm_recorder(self):
+        """
+        Release the camera's video writer and open it again for the current video path once the settings have not
+        changed for the interval of arm_timer, so it is ready before the experiment is started. Does nothing while an
+        experiment is running.
+        :return: None
+        """
+        if self.experiment_in_progress:
+            return
+        self.camera.disarm_recording()
+        self.arm_timer.start()
+
+    def arm_recorder(self):
+        """
+        Open the camera's video writer if the video is to be saved, called by arm_timer. An experiment started before
+        then arms the recorder itself.
+        :return: None
+        """
+        if not self.experiment_in_progress and self.checkbox_save_video.isChecked():
+            self.camera.arm_recording()
 
     def view_experiment_to_run(self):
         """
@@ -361,6 +398,26 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
         :return:
         """
         self.experiment_in_progress = done_signal
+        if self.analysis_queue is not None:
+            # keep background analysis from competing with capture while an experiment runs
+            self.analysis_queue.set_paused(done_signal)
+        if not done_signal:
+            self.rearm_recorder()
+
+    def queue_recorded_experiment(self):
+        """
+        Queue the recording of the experiment that has just finished for analysis with the analysis settings of the
+        analysis dialog and the crowd size and ROIs of the experiment. Detection thresholds tuned for the recording
+        are applied when it is analysed, see experiment/batch.py.
+        :return: None
+        """
+        if self.analysis_queue is None or self.runner.recorded_path is None:
+            return
+        video_handler = self.analysis_dialog.video_handler
+        settings = video_handler.make_analysis_settings(self.spin_crowdsize.value() or
+                                                        video_handler.default_population_size)
+        settings["background_sample_size"] = video_handler.background_sample_size
+        self.analysis_queue.add_recording(self.runner.recorded_path, settings, self.rois)
 
     def run_experiment(self):
         """
@@ -374,6 +431,7 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
                                            recording_experiment=self.checkbox_save_video.isChecked())
 
             self.runner.signal_experiment_in_progress.connect(lambda x: self.grab_experiment_done_signal(x))
+            self.runner.signal_experiment_done.connect(lambda x: self.queue_recorded_experiment())
             if self.checkbox_view_live.isChecked():
                 self.settings_dialog.show()
             self.runner.run()
@@ -451,7 +509,8 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
                 "dechorionated": self.checkbox_dechorionated.isChecked(),
                 "hatching_date_time": self.get_hatching_date_time(), "genetics": self.checkbox_genetics.isChecked(),
                 "geno_type": self.line_edit_geno_type.text(), "drugs": self.checkbox_drugs.isChecked(),
-                "drug_name": self.line_edit_drug_name.text(), "crowd_size": self.spin_crowdsize.value()}
+                "drug_name": self.line_edit_drug_name.text(), "crowd_size": self.spin_crowdsize.value(),
+                "rois": self.rois}
 
     def format_duration_text(self):
         """
@@ -679,10 +738,16 @@ class MainWindow(QMainWindow, Ui_MainWindow, QWidget):
         :param event: QCloseEvent
         :return: None
         """
+        self.arm_timer.stop()
         self.camera.stop_cam()
         self.camera.shutdown()
         self.analysis_dialog.shutdown_video_handler()
+        self.analysis_dialog.shutdown_analysis_worker()
+        if self.analysis_queue is not None:
+            self.analysis_queue.shutdown()
         time.sleep(1) # give components on separate threads time to complete, consider using wait() instead
+        self.camera.disarm_recording()
+        self.camera.wait_for_finalize()
         if self.camera.out is not None:
             self.camera.out.release()
         if self.camera.capture_device is not None:
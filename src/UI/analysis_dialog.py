@@ -184,6 +184,22 @@ class Ui_Dialog(object):
 
         self.horizontalLayout_5.addWidget(self.checkbox_analyze)
 
+        self.btn_analyze_video = QPushButton(Dialog)
+        self.btn_analyze_video.setObjectName(u"btn_analyze_video")
+
+        self.horizontalLayout_5.addWidget(self.btn_analyze_video)
+
+        self.progress_analysis = QProgressBar(Dialog)
+        self.progress_analysis.setObjectName(u"progress_analysis")
+        self.progress_analysis.setValue(0)
+
+        self.horizontalLayout_5.addWidget(self.progress_analysis)
+
+        self.label_analysis_eta = QLabel(Dialog)
+        self.label_analysis_eta.setObjectName(u"label_analysis_eta")
+
+        self.horizontalLayout_5.addWidget(self.label_analysis_eta)
+
         self.buttonBox = QDialogButtonBox(Dialog)
         self.buttonBox.setObjectName(u"buttonBox")
         sizePolicy3.setHeightForWidth(self.buttonBox.sizePolicy().hasHeightForWidth())
@@ -272,6 +288,11 @@ class Ui_Dialog(object):
         self.btn_frame_skip_fwd.setText(QCoreApplication.translate("Dialog", u">", None))
         self.label_video_fps.setText(QCoreApplication.translate("Dialog", u"Selected Video FPS:", None))
         self.checkbox_analyze.setText(QCoreApplication.translate("Dialog", u"Analyze", None))
+#if QT_CONFIG(tooltip)
+        self.btn_analyze_video.setToolTip(QCoreApplication.translate("Dialog", u"Analyze the whole video in the background, as fast as possible", None))
+#endif // QT_CONFIG(tooltip)
+        self.btn_analyze_video.setText(QCoreApplication.translate("Dialog", u"Analyze Video", None))
+        self.label_analysis_eta.setText("")
         self.label_vid_time.setText(QCoreApplication.translate("Dialog", u"00:00:00", None))
         self.label_3.setText(QCoreApplication.translate("Dialog", u"/", None))
         self.label_vid_total_time.setText(QCoreApplication.translate("Dialog", u"00:00:00", None))
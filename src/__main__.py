@@ -7,6 +7,7 @@ from UI.AnalysisDialog import AnalysisDialog
 from UI.SettingsDialog import SettingsDialog
 from UI.RunningExperimentDialog import RunningExperimentDialog
 from camera.camera import *
+from experiment.AnalysisQueue import AnalysisQueue
 
 
 class Main(QApplication):
@@ -22,11 +23,20 @@ class Main(QApplication):
     logs_path : str
         path to recorded videos on the system, relative by default
         NOTE: currently not in use
+    record_proxy : bool
+        record a low resolution proxy next to each recording, used for playback in the analysis dialog
+    stripe_dirs : list
+        additional directories, preferably on separate disks, to stripe recordings across. Empty disables striping
+    analysis_queue_path : str
+        path to the queue of recordings analysed in the background after experiments, None disables automatic analysis
     """
     video_path = "experiment/videos/"
     stimulus_path = "stimulus/stimulus_profiles/"
     logs_path = "experiment/logs/"
     experiment_profiles_path = "experiment/experiment_profiles/"
+    record_proxy = True
+    stripe_dirs = []
+    analysis_queue_path = "experiment/analysis_queue.json"
 
     def __init__(self):
         """
@@ -38,9 +48,16 @@ class Main(QApplication):
         self.serial_interface = SerialInterface()
 
         # Init Camera
-        self.camera = Camera(video_path=self.video_path)
+        self.camera = Camera(video_path=self.video_path, record_proxy=self.record_proxy,
+                             stripe_dirs=self.stripe_dirs)
         self.camera.start()
 
+        # Init background analysis of recorded experiments
+        self.analysis_queue = None
+        if self.analysis_queue_path is not None:
+            self.analysis_queue = AnalysisQueue(self.analysis_queue_path)
+            self.analysis_queue.start()
+
         # init UI
         self.settings_dialog = SettingsDialog(
             serial_interface=self.serial_interface,
@@ -60,6 +77,7 @@ class Main(QApplication):
             experiments_path=self.experiment_profiles_path,
             stimulus_path=self.stimulus_path,
             camera=self.camera,
+            analysis_queue=self.analysis_queue,
             size=self.primaryScreen().size())
 
         self.main_window.setWindowTitle("CI-VTS")
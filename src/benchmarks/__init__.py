@@ -0,0 +1,23 @@
+"""
+benchmarks package
+
+Scripts that measure the cost of the analysis pipeline on synthetic data, or on the first frames of a recording where
+they take --video. Run them from the src folder, every script lists its options with --help.
+
+tracker_benchmark.py: Per-frame cost of the tracker at different population sizes, with and without the spatial grid
+    python -m benchmarks.tracker_benchmark --objects 15 100 1000
+engine_benchmark.py: Per-frame cost and id switches of the tracker engines
+    python -m benchmarks.engine_benchmark --objects 15 100 500
+motion_benchmark.py: Id switches and throughput when detecting on every k-th frame only
+    python -m benchmarks.motion_benchmark --every 1 2 4 8
+detection_benchmark.py: Cost of the blob detector backends on noisy foreground masks
+    python -m benchmarks.detection_benchmark --noise 0 0.01 0.05
+background_benchmark.py: Cost and agreement of the median background model against MOG2
+    python -m benchmarks.background_benchmark --video recording.avi
+downscale_benchmark.py: Accuracy and throughput of downscaled background subtraction
+    python -m benchmarks.downscale_benchmark --video recording.avi
+bands_benchmark.py: Time per frame of detection split over horizontal bands
+    python -m benchmarks.bands_benchmark --bands 2 4 8
+segment_benchmark.py: Wall-clock time and ids kept across boundaries of segment-parallel analysis
+    python -m benchmarks.segment_benchmark --segments 2 4
+"""
@@ -0,0 +1,78 @@
+import argparse
+import time
+import numpy as np
+from experiment.DataCollect import DataCollect
+from experiment.background import make_background
+from benchmarks.downscale_benchmark import read_frames, render_frames, compare
+
+"""
+Benchmark of the median background model against MOG2: the cost of producing a foreground mask per frame, the one-off
+cost of building the median from a sample, and how well detections agree with MOG2 detections. Runs on the first
+frames of a recording, or on rendered frames of moving objects when no recording is given.
+"""
+
+
+def time_model(model, frames):
+    """
+    :param model: background model
+    :param frames: list of frames
+    :return: float mean seconds per apply call
+    """
+    t = time.perf_counter()
+    for frame in frames:
+        model.apply(frame)
+    return (time.perf_counter() - t) / len(frames)
+
+
+def detect_all(frames, background, sample):
+    """
+    :param frames: list of frames
+    :param background: str name of background model
+    :param sample: list of frames for the median model to build its background from
+    :return: tuple (list with an (n, 4) array of boxes per frame, float mean seconds per frame)
+    """
+    data_collect = DataCollect(pop_num=15, skip_frames=10, detector_backend="components", background=background,
+                               background_sample=sample)
+    boxes = []
+    t = time.perf_counter()
+    for frame in frames:
+        data_collect.update(frame)
+        boxes.append(np.array(data_collect.detectionArray, dtype=np.int64).reshape(-1, 4))
+    return boxes, (time.perf_counter() - t) / len(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the median background model to MOG2")
+    parser.add_argument("--video", help="recording to run on, rendered frames are used when not given")
+    parser.add_argument("--frames", type=int, default=150)
+    parser.add_argument("--sample", type=int, default=25, help="number of frames the median is built from")
+    parser.add_argument("--tolerance", type=float, default=6.0)
+    args = parser.parse_args()
+
+    if args.video is not None:
+        frames = read_frames(args.video, args.frames)
+    else:
+        frames = render_frames(100, args.frames)
+    sample = [frames[i] for i in np.linspace(0, len(frames) - 1, args.sample).astype(np.int64).tolist()]
+
+    t = time.perf_counter()
+    make_background("median", sample=sample)
+    build_time = time.perf_counter() - t
+    mog2_mask = time_model(make_background("mog2"), frames)
+    median_mask = time_model(make_background("median", sample=sample), frames)
+    reference, mog2_total = detect_all(frames, "mog2", None)
+    boxes, median_total = detect_all(frames, "median", sample)
+    # skip frames where MOG2 is still learning the background
+    warmup = min(20, len(frames) // 2)
+    recall, precision, error = compare(reference[warmup:], boxes[warmup:], args.tolerance)
+
+    print("model    mask ms/frame   DataCollect ms/frame")
+    print("mog2     %13.2f   %20.2f" % (mog2_mask * 1000, mog2_total * 1000))
+    print("median   %13.2f   %20.2f" % (median_mask * 1000, median_total * 1000))
+    print("median built from %d frames in %.1f ms" % (len(sample), build_time * 1000))
+    print("median detections against mog2: recall %.3f, precision %.3f, center error %.2f px" % (recall, precision,
+                                                                                              error))
+
+
+if __name__ == '__main__':
+    main()
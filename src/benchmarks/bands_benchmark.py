@@ -0,0 +1,58 @@
+import argparse
+import os
+import time
+import numpy as np
+from experiment.DataCollect import DataCollect
+from benchmarks.downscale_benchmark import read_frames, render_frames
+
+"""
+Benchmark of detection split over horizontal bands on a thread pool. Reports time per frame for a number of bands and
+whether the detections are the same as without bands. With MOG2 every pixel is modelled independently, so the
+detections should be identical. The speedup is bound by the number of cores.
+"""
+
+
+def detect_all(frames, bands, background):
+    """
+    :param frames: list of frames
+    :param bands: int number of bands
+    :param background: str name of background model
+    :return: tuple (list with a set of (x, y, w, h) per frame, float mean seconds per frame)
+    """
+    data_collect = DataCollect(pop_num=15, skip_frames=10, detector_backend="components", background=background,
+                               bands=bands)
+    boxes = []
+    t = time.perf_counter()
+    for frame in frames:
+        data_collect.update(frame)
+        boxes.append(set(map(tuple, data_collect.detectionArray)))
+    elapsed = time.perf_counter() - t
+    data_collect.shutdown()
+    return boxes, elapsed / len(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection split over bands on a thread pool")
+    parser.add_argument("--video", help="recording to run on, rendered frames are used when not given")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--bands", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--background", default="mog2")
+    args = parser.parse_args()
+
+    if args.video is not None:
+        frames = read_frames(args.video, args.frames)
+    else:
+        frames = render_frames(100, args.frames)
+
+    print("%d cores" % os.cpu_count())
+    reference, single = detect_all(frames, 1, args.background)
+    print("bands   ms/frame   speedup   frames with identical detections")
+    print("%5d   %8.2f   %7.2f   %32d" % (1, single * 1000, 1, len(frames)))
+    for bands in args.bands:
+        boxes, per_frame = detect_all(frames, bands, args.background)
+        same = int(np.sum([a == b for a, b in zip(reference, boxes)]))
+        print("%5d   %8.2f   %7.2f   %32d" % (bands, per_frame * 1000, single / per_frame, same))
+
+
+if __name__ == '__main__':
+    main()
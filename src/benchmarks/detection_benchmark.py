@@ -0,0 +1,61 @@
+import argparse
+import time
+import numpy as np
+from experiment.detector import detector_backends
+
+"""
+Benchmark of the blob detector backends on synthetic foreground masks: objects of a detectable size on top of a given
+amount of single pixel and small speckle noise, as produced by background subtraction on a noisy camera.
+"""
+
+
+def make_noisy_mask(nr_of_objects, noise, width=1280, height=1024, box=10, seed=0):
+    """
+    :param nr_of_objects: int number of square objects
+    :param noise: float fraction of pixels set by noise
+    :param width: int mask width
+    :param height: int mask height
+    :param box: int size of objects
+    :param seed: int random seed
+    :return: 2d uint8 mask
+    """
+    rng = np.random.default_rng(seed)
+    mask = np.where(rng.random((height, width)) < noise, 255, 0).astype(np.uint8)
+    for x, y in rng.integers([0, 0], [width - box, height - box], size=(nr_of_objects, 2)).tolist():
+        mask[y:y + box, x:x + box] = 255
+    return mask
+
+
+def time_detector(detector, mask, repeats):
+    """
+    :param detector: detector instance
+    :param mask: 2d uint8 mask
+    :param repeats: int number of times to detect
+    :return: tuple (float mean seconds per detect call, int number of blobs found)
+    """
+    boxes, _ = detector.detect(mask)
+    t = time.perf_counter()
+    for _ in range(repeats):
+        detector.detect(mask)
+    return (time.perf_counter() - t) / repeats, len(boxes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the blob detector backends side by side")
+    parser.add_argument("--objects", type=int, default=100)
+    parser.add_argument("--noise", type=float, nargs="+", default=[0, 0.001, 0.01, 0.05])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    print("noise    " + "".join("%-12s ms/frame   blobs   " % name for name in detector_backends))
+    for noise in args.noise:
+        mask = make_noisy_mask(args.objects, noise)
+        row = "%-7g  " % noise
+        for backend in detector_backends.values():
+            per_frame, found = time_detector(backend(), mask, args.repeats)
+            row = row + "%21.3f   %5d   " % (per_frame * 1000, found)
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
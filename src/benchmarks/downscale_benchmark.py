@@ -0,0 +1,123 @@
+import argparse
+import time
+import cv2
+import numpy as np
+from experiment.DataCollect import DataCollect
+from experiment.tracker.tracker import distance_matrix
+from benchmarks.motion_benchmark import make_moving_objects
+
+"""
+Accuracy and throughput of downscaled background subtraction compared to full resolution. Detections at full resolution
+are the reference, for every other mode the share of reference detections found within a few pixels, the share of
+detections that match a reference detection and the mean center error are reported. Runs on the first frames of a
+recording, or on rendered frames of moving objects when no recording is given.
+"""
+
+
+def read_frames(video_path, nr_of_frames):
+    """
+    :param video_path: str path to a video file
+    :param nr_of_frames: int number of frames to read from the start
+    :return: list of frames
+    """
+    video = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < nr_of_frames:
+        r, frame = video.read()
+        if not r:
+            break
+        frames.append(frame)
+    video.release()
+    return frames
+
+
+def render_frames(nr_of_objects, nr_of_frames, width=1280, height=1024, box=12, seed=0):
+    """
+    :param nr_of_objects: int number of objects
+    :param nr_of_frames: int number of frames
+    :param width: int frame width
+    :param height: int frame height
+    :param box: int size of objects
+    :param seed: int random seed
+    :return: list of BGR frames of dark objects on a noisy, unevenly lit background
+    """
+    rng = np.random.default_rng(seed)
+    detections, _ = make_moving_objects(nr_of_objects, nr_of_frames, width, height, box=box, miss_rate=0, seed=seed)
+    light = np.linspace(150, 210, width)[None, :] + np.linspace(0, 30, height)[:, None]
+    frames = []
+    for rects in detections:
+        frame = light + rng.normal(0, 4, size=(height, width))
+        for x, y, w, h in rects:
+            cv2.ellipse(frame, (x + w // 2, y + h // 2), (w // 2, h // 2), 0, 0, 360, 60, -1)
+        frames.append(cv2.cvtColor(np.clip(frame, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR))
+    return frames
+
+
+def detect_all(frames, downscale, refine):
+    """
+    :param frames: list of frames
+    :param downscale: int downscale factor, 1 for full resolution
+    :param refine: bool refine boxes at full resolution
+    :return: tuple (list with an (n, 4) array of boxes per frame, float mean seconds per frame)
+    """
+    data_collect = DataCollect(pop_num=15, skip_frames=10, detector_backend="components", downscale=downscale,
+                               refine=refine)
+    boxes = []
+    t = time.perf_counter()
+    for frame in frames:
+        data_collect.update(frame)
+        boxes.append(np.array(data_collect.detectionArray, dtype=np.int64).reshape(-1, 4))
+    return boxes, (time.perf_counter() - t) / len(frames)
+
+
+def compare(reference, boxes, tolerance):
+    """
+    :param reference: list with an (n, 4) array of reference boxes per frame
+    :param boxes: list with an (m, 4) array of boxes per frame
+    :param tolerance: float largest center distance in pixels of a match
+    :return: tuple (float recall, float precision, float mean center error in pixels)
+    """
+    found = matched = total_ref = total = 0
+    errors = []
+    for ref, box in zip(reference, boxes):
+        total_ref = total_ref + len(ref)
+        total = total + len(box)
+        if len(ref) == 0 or len(box) == 0:
+            continue
+        dist = np.sqrt(distance_matrix(ref[:, 0:2] + ref[:, 2:4] / 2, box[:, 0:2] + box[:, 2:4] / 2))
+        close = dist < tolerance
+        found = found + int(close.any(axis=1).sum())
+        matched = matched + int(close.any(axis=0).sum())
+        errors.extend(dist.min(axis=1)[close.any(axis=1)].tolist())
+    return found / max(total_ref, 1), matched / max(total, 1), float(np.mean(errors)) if errors else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare downscaled background subtraction to full resolution")
+    parser.add_argument("--video", help="recording to run on, rendered frames are used when not given")
+    parser.add_argument("--frames", type=int, default=150)
+    parser.add_argument("--objects", type=int, default=100, help="number of objects in rendered frames")
+    parser.add_argument("--tolerance", type=float, default=6.0)
+    args = parser.parse_args()
+
+    if args.video is not None:
+        frames = read_frames(args.video, args.frames)
+    else:
+        frames = render_frames(args.objects, args.frames)
+
+    reference, full_time = detect_all(frames, 1, False)
+    # skip frames where the background model is still being learned
+    warmup = min(20, len(frames) // 2)
+    print("downscale   refine   ms/frame   speedup   recall   precision   center error px")
+    print("%9d   %6s   %8.2f   %7.2f   %6.3f   %9.3f   %15.2f" % (1, "-", full_time * 1000, 1, 1, 1, 0))
+    for downscale in (2, 4):
+        for refine in (False, True):
+            boxes, per_frame = detect_all(frames, downscale, refine)
+            recall, precision, error = compare(reference[warmup:], boxes[warmup:], args.tolerance)
+            print("%9d   %6s   %8.2f   %7.2f   %6.3f   %9.3f   %15.2f" % (downscale, refine, per_frame * 1000,
+                                                                       full_time / per_frame, recall, precision,
+                                                                       error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import time
+from experiment.tracker.engines import make_tracker, tracker_engines
+from benchmarks.tracker_benchmark import make_synthetic_detections
+
+"""
+Benchmark comparing the tracker engines on synthetic random walks: per-frame cost and the number of id switches, i.e.
+how often a simulated object is reported with a different id than in the previous frame it was detected in.
+"""
+
+
+def run_engine(engine, detections, truth):
+    """
+    :param engine: str name of tracker engine
+    :param detections: list with a list of [x, y, w, h] per frame
+    :param truth: list with an array of the true object index of every detection per frame
+    :return: tuple (float mean seconds per frame, int number of id switches)
+    """
+    tracker = make_tracker(engine, pop_num=len(truth[0]), frames=10)
+    last_id = {}
+    switches = 0
+    elapsed = 0
+    for rects, objects in zip(detections, truth):
+        t = time.perf_counter()
+        boxes_ids = tracker.update(rects)
+        elapsed = elapsed + time.perf_counter() - t
+        # trackers report boxes in detection order
+        for box_id, obj in zip(boxes_ids, objects.tolist()):
+            if obj in last_id and last_id[obj] != box_id[4]:
+                switches = switches + 1
+            last_id[obj] = box_id[4]
+    return elapsed / len(detections), switches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-frame cost and id switches of the tracker engines")
+    parser.add_argument("--objects", type=int, nargs="+", default=[15, 100, 500])
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--step", type=float, default=6.0, help="standard deviation of movement per frame in pixels")
+    args = parser.parse_args()
+
+    print("objects   engine     ms/frame   id switches")
+    for n in args.objects:
+        detections, truth = make_synthetic_detections(n, args.frames, step=args.step)
+        for engine in tracker_engines:
+            per_frame, switches = run_engine(engine, detections, truth)
+            print("%7d   %-8s   %8.3f   %11d" % (n, engine, per_frame * 1000, switches))
+
+
+if __name__ == '__main__':
+    main()
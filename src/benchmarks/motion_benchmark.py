@@ -0,0 +1,108 @@
+import argparse
+import time
+import numpy as np
+from experiment.DataCollect import DataCollect
+from experiment.tracker.tracker import init_tracker
+
+"""
+Benchmark of detecting on every k-th frame only. The tracker is run on synthetic objects moving with a slowly changing
+velocity, with and without the constant velocity motion model, counting id switches. DataCollect is timed end to end on
+rendered frames of the same objects to show the gain in analysis throughput.
+"""
+
+
+def make_moving_objects(nr_of_objects, nr_of_frames, width=1280, height=1024, speed=4.0, turn=0.3, box=10,
+                        miss_rate=0.02, seed=0):
+    """
+    Simulate objects moving with a velocity that changes a little every frame, bouncing off the frame edges
+    :param nr_of_objects: int number of objects
+    :param nr_of_frames: int number of frames
+    :param width: int frame width
+    :param height: int frame height
+    :param speed: float initial speed in pixels per frame
+    :param turn: float standard deviation of the change in velocity per frame
+    :param box: int size of bounding boxes
+    :param miss_rate: float chance of an object not being detected in a frame
+    :param seed: int random seed
+    :return: tuple (list with a list of [x, y, w, h] per frame, list with an array of true object indices per frame)
+    """
+    rng = np.random.default_rng(seed)
+    low = np.array([box, box])
+    high = np.array([width - 2 * box, height - 2 * box])
+    pos = rng.uniform(low, high, size=(nr_of_objects, 2))
+    angle = rng.uniform(0, 2 * np.pi, nr_of_objects)
+    vel = speed * np.column_stack((np.cos(angle), np.sin(angle)))
+    detections = []
+    truth = []
+    for _ in range(nr_of_frames):
+        vel = vel + rng.normal(0, turn, size=vel.shape)
+        pos = pos + vel
+        bounced = (pos < low) | (pos > high)
+        vel[bounced] = -vel[bounced]
+        pos = np.clip(pos, low, high)
+        seen = np.flatnonzero(rng.random(nr_of_objects) >= miss_rate)
+        rects = np.column_stack((pos[seen].astype(np.int64), np.full((seen.size, 2), box)))
+        detections.append(rects.tolist())
+        truth.append(seen)
+    return detections, truth
+
+
+def count_id_switches(detect_every, motion, detections, truth):
+    """
+    :param detect_every: int track every n-th frame only
+    :param motion: bool use the constant velocity motion model
+    :param detections: list with a list of [x, y, w, h] per frame
+    :param truth: list with an array of the true object index of every detection per frame
+    :return: int number of times an object is reported with a different id than the previous time it was detected
+    """
+    tracker = init_tracker(pop_num=len(truth[0]), frames=10, motion=motion)
+    last_id = {}
+    switches = 0
+    for rects, objects in list(zip(detections, truth))[::detect_every]:
+        for box_id, obj in zip(tracker.update(rects, dt=detect_every), objects.tolist()):
+            if obj in last_id and last_id[obj] != box_id[4]:
+                switches = switches + 1
+            last_id[obj] = box_id[4]
+    return switches
+
+
+def time_data_collect(detect_every, detections, width, height):
+    """
+    :param detect_every: int detect on every n-th frame only
+    :param detections: list with a list of [x, y, w, h] per frame, rendered as filled squares
+    :param width: int frame width
+    :param height: int frame height
+    :return: float mean seconds per frame
+    """
+    frames = []
+    for rects in detections:
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        for x, y, w, h in rects:
+            frame[y:y + h, x:x + w] = 255
+        frames.append(frame)
+    data_collect = DataCollect(pop_num=len(detections[0]), skip_frames=10, detect_every=detect_every)
+    t = time.perf_counter()
+    for frame in frames:
+        data_collect.update(frame)
+    return (time.perf_counter() - t) / len(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tracking with detection on every k-th frame")
+    parser.add_argument("--objects", type=int, default=100)
+    parser.add_argument("--frames", type=int, default=400)
+    parser.add_argument("--every", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    width, height = 1280, 1024
+    detections, truth = make_moving_objects(args.objects, args.frames, width, height)
+    print("every   id switches last position   id switches motion model   DataCollect ms/frame")
+    for k in args.every:
+        plain = count_id_switches(k, False, detections, truth)
+        motion = count_id_switches(k, True, detections, truth)
+        per_frame = time_data_collect(k, detections, width, height)
+        print("%5d   %25d   %24d   %20.3f" % (k, plain, motion, per_frame * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import os
+import tempfile
+import time
+import cv2
+from experiment.analysis import analyze_video, split_segments
+from benchmarks.downscale_benchmark import render_frames
+
+"""
+Benchmark of segment-parallel analysis against analysing a video in one go: wall-clock time, and how many objects keep
+their id across segment boundaries compared to the serial analysis. Runs on a recording, or on a video rendered to a
+temporary file when no recording is given.
+"""
+
+
+def boundary_continuity(serial, stitched, starts):
+    """
+    Count objects tracked by the serial analysis in the last frame of a segment and the first frame of the next, and how
+    many of those keep their id across the boundary in the stitched analysis
+    :param serial: list of rows [xm, ym, w, h, id, frame] of the serial analysis
+    :param stitched: list of rows of the segmented analysis
+    :param starts: list of int first frame owned by every segment after the first
+    :return: tuple (int objects keeping their id, int objects)
+    """
+    stitched_ids = {(row[5], row[0], row[1]): row[4] for row in stitched}
+    by_frame = {}
+    for row in serial:
+        by_frame.setdefault(row[5], {})[row[4]] = (row[0], row[1])
+    kept = 0
+    total = 0
+    for start in starts:
+        # frame numbers in rows count from 1, start is the index of the first frame of the next segment
+        before = by_frame.get(start, {})
+        after = by_frame.get(start + 1, {})
+        for track_id in set(before) & set(after):
+            key_before = (start,) + before[track_id]
+            key_after = (start + 1,) + after[track_id]
+            if key_before in stitched_ids and key_after in stitched_ids:
+                total = total + 1
+                kept = kept + (stitched_ids[key_before] == stitched_ids[key_after])
+    return kept, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare segment-parallel analysis to serial analysis")
+    parser.add_argument("--video", help="recording to run on, a rendered video is used when not given")
+    parser.add_argument("--frames", type=int, default=1200, help="number of frames to render")
+    parser.add_argument("--segments", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--overlap", type=int, default=150)
+    parser.add_argument("--background", default="mog2")
+    args = parser.parse_args()
+
+    video_path = args.video
+    if video_path is None:
+        video_path = os.path.join(tempfile.mkdtemp(), "rendered.avi")
+        writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (640, 480))
+        for frame in render_frames(30, args.frames, width=640, height=480):
+            writer.write(frame)
+        writer.release()
+    settings = {"pop_num": 30, "skip_frames": 10, "background": args.background}
+
+    t = time.perf_counter()
+    serial = analyze_video(video_path, settings)[None]
+    serial_time = time.perf_counter() - t
+    video = cv2.VideoCapture(video_path)
+    frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+
+    print("segments   seconds   speedup   ids kept at boundaries")
+    print("%8d %9.2f %9.2f" % (1, serial_time, 1))
+    for segments in args.segments:
+        t = time.perf_counter()
+        stitched = analyze_video(video_path, settings, segments=segments, overlap=args.overlap, workers=segments)[None]
+        elapsed = time.perf_counter() - t
+        starts = [start for _, start, _ in split_segments(frame_count, segments, args.overlap)[1:]]
+        kept, total = boundary_continuity(serial, stitched, starts)
+        print("%8d %9.2f %9.2f   %d / %d" % (segments, elapsed, serial_time / elapsed, kept, total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import math
+import time
+import numpy as np
+from experiment.tracker.tracker import init_tracker
+
+"""
+Benchmark of the per-frame cost of init_tracker.update against the nested-loop implementation it replaced, on synthetic
+random walks of a given number of objects. The tracker is timed both matching against all tracks and with the spatial
+grid index.
+"""
+
+
+class legacy_tracker:
+    """
+    The tracker as it was before matching was vectorized, kept for comparison
+    """
+    def __init__(self, pop_num, frames):
+        self.center_points = {}
+        self.population_id_list = list(range(0, pop_num))
+        self.lost_id = {}
+        self.frames = frames
+
+    def update(self, objects_rect):
+        objects_bbs_ids = []
+        for rect in objects_rect:
+            x, y, w, h = rect
+            cx = (x + x + w) // 2
+            cy = (y + y + h) // 2
+            same_object_detected = False
+            lost_retrieved = False
+            for id, centerp in self.lost_id.items():
+                cxl, cyl = centerp[0]
+                dist = math.hypot(cx - cxl, cy - cyl)
+                if dist < 20:
+                    self.center_points[id] = (cx, cy)
+                    objects_bbs_ids.append([x, y, w, h, id])
+                    self.lost_id.pop(id, None)
+                    lost_retrieved = True
+                    break
+            if lost_retrieved is False:
+                for id, pt in self.center_points.items():
+                    dist = math.hypot(cx - pt[0], cy - pt[1])
+                    if dist < 30:
+                        self.center_points[id] = (cx, cy)
+                        objects_bbs_ids.append([x, y, w, h, id])
+                        same_object_detected = True
+                        break
+            if same_object_detected is False and lost_retrieved is False:
+                self.center_points[self.population_id_list[0]] = (cx, cy)
+                objects_bbs_ids.append([x, y, w, h, self.population_id_list[0]])
+                self.population_id_list.pop(0)
+
+        new_center_points = {}
+        for obj_bb_id in objects_bbs_ids:
+            _, _, _, _, object_id = obj_bb_id
+            new_center_points[object_id] = self.center_points[object_id]
+        for key in self.center_points.keys():
+            if key not in new_center_points.keys():
+                self.population_id_list.append(key)
+                self.lost_id[key] = (self.center_points[key], 0)
+        for keys in self.lost_id.keys():
+            self.lost_id[keys] = (self.lost_id[keys][0], self.lost_id[keys][1] + 1)
+        clear_ids = [p for p in self.lost_id.keys() if self.lost_id[p][1] > self.frames]
+        for x in clear_ids:
+            self.lost_id.pop(x, None)
+            self.population_id_list.append(x)
+        self.center_points = new_center_points.copy()
+        return objects_bbs_ids
+
+
+def make_synthetic_detections(nr_of_objects, nr_of_frames, width=1280, height=1024, step=3.0, box=10,
+                              miss_rate=0.02, seed=0):
+    """
+    Simulate objects doing a random walk and detect them with an occasional missed detection
+    :param nr_of_objects: int number of objects
+    :param nr_of_frames: int number of frames
+    :param width: int frame width
+    :param height: int frame height
+    :param step: float standard deviation of movement per frame in pixels
+    :param box: int size of bounding boxes
+    :param miss_rate: float chance of an object not being detected in a frame
+    :param seed: int random seed
+    :return: tuple (list with a list of [x, y, w, h] per frame, list with an array of true object indices per frame)
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform([box, box], [width - 2 * box, height - 2 * box], size=(nr_of_objects, 2))
+    detections = []
+    truth = []
+    for _ in range(nr_of_frames):
+        pos = np.clip(pos + rng.normal(0, step, size=pos.shape), [box, box], [width - 2 * box, height - 2 * box])
+        seen = np.flatnonzero(rng.random(nr_of_objects) >= miss_rate)
+        rects = np.column_stack((pos[seen].astype(np.int64), np.full((seen.size, 2), box)))
+        detections.append(rects.tolist())
+        truth.append(seen)
+    return detections, truth
+
+
+def time_tracker(tracker, detections):
+    """
+    :param tracker: tracker instance with an update method
+    :param detections: list with a list of [x, y, w, h] per frame
+    :return: float mean seconds per frame, not counting the first frame where every track is created
+    """
+    tracker.update(detections[0])
+    t = time.perf_counter()
+    for rects in detections[1:]:
+        tracker.update(rects)
+    return (time.perf_counter() - t) / (len(detections) - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tracker against the nested-loop implementation")
+    parser.add_argument("--objects", type=int, nargs="+", default=[15, 100, 1000])
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--skip-legacy", action="store_true", help="do not time the nested-loop implementation")
+    args = parser.parse_args()
+
+    print("objects   legacy ms/frame   all-pairs ms/frame   grid ms/frame")
+    for n in args.objects:
+        detections, _ = make_synthetic_detections(n, args.frames)
+        legacy = float("nan")
+        if not args.skip_legacy:
+            legacy = time_tracker(legacy_tracker(pop_num=20 * n, frames=10), detections)
+        all_pairs = time_tracker(init_tracker(pop_num=20 * n, frames=10, spatial_index=False), detections)
+        grid = time_tracker(init_tracker(pop_num=20 * n, frames=10, spatial_index=True), detections)
+        print("%7d   %15.3f   %18.3f   %13.3f" % (n, legacy * 1000, all_pairs * 1000, grid * 1000))
+
+
+if __name__ == '__main__':
+    main()
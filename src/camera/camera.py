@@ -1,8 +1,25 @@
 import cv2
 import os
+import threading
 from PySide6.QtCore import *
 from PySide6.QtGui import *
 import time
+from camera.proxy_writer import ProxyWriter, get_proxy_path
+from camera.striped_video import StripedWriter, get_manifest_path, get_stripe_paths
+from camera.recording_info import write_recording_info
+from camera.recording_paths import get_armed_path
+
+
+def remove_file(path):
+    """
+    :param path: str path of a file, nothing is done if it does not exist
+    :return: None
+    """
+    try:
+        if os.path.isfile(path):
+            os.remove(path)
+    except IOError as e:
+        print(e)
 
 
 class Camera(QThread):
@@ -19,7 +36,8 @@ class Camera(QThread):
     img_changed_signal = Signal(bytes)
     cam_connected_signal = Signal(bytes)
 
-    def __init__(self, video_path, fps=60, width=420, height=640, res_width=1280.0, res_height=1024.0, running=True):
+    def __init__(self, video_path, fps=60, width=420, height=640, res_width=1280.0, res_height=1024.0, running=True,
+                 record_proxy=False, proxy_size=(640, 512), stripe_dirs=None):
         """
         Instantiate camera configuration values and scan for available capture devices on the system.
         :param video_path:
@@ -29,6 +47,10 @@ class Camera(QThread):
         :param res_width:
         :param res_height:
         :param running:
+        :param record_proxy: bool indicating if a low resolution proxy is recorded alongside each recording
+        :param proxy_size: tuple (int: width, int: height) of proxy frames
+        :param stripe_dirs: list of additional directories, recordings are striped across these and the directory of
+        video_path when given
         """
         super().__init__()
         self.is_alive = True
@@ -46,13 +68,23 @@ class Camera(QThread):
 
         self.live = True
         self.recording = False
+        self.armed = False
         self.out = None
+        self.out_path = None
+        self.record_proxy = record_proxy
+        self.proxy_size = proxy_size
+        self.proxy_writer = None
 
         self.video_path = video_path
+        self.stripe_dirs = stripe_dirs if stripe_dirs is not None else []
 
         self.mutex = QMutex()
+        self.writer_mutex = QMutex()
+        self.finalize_threads = []
 
         self.frames_written = 0
+        self.frame_times = []
+        self.rec_start_time = None
 
         if len(self.capture_indices) > 0:
             self.set_capture_device(self.capture_indices[0])
@@ -69,12 +101,11 @@ class Camera(QThread):
                     try:
                         ret, frame = self.capture_device.read()
                         if ret is True:
+                            frame_time = time.perf_counter()
                             self.camera_removed_flag = False
                             h, w, ch = frame.shape
-                            if self.out is not None:
-                                if self.recording:
-                                    self.out.write(frame)
-                                    self.frames_written = self.frames_written + 1
+                            if self.recording:
+                                self.write_frame(frame, frame_time)
 
                             bytes_per_line = ch * w
                             qt_image = QImage(frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
@@ -89,6 +120,25 @@ class Camera(QThread):
                         print("Excepting")
                         print(e)
 
+    def write_frame(self, frame, frame_time):
+        """
+        Write a captured frame to the armed video writer. Guarded by writer_mutex so the writer cannot be handed off
+        for finalizing halfway through a write.
+        :param frame: captured frame
+        :param frame_time: perf_counter timestamp of when the frame was read from the capture device
+        :return: None
+        """
+        self.writer_mutex.lock()
+        if self.recording and self.out is not None:
+            if self.frames_written == 0:
+                self.rec_start_time = frame_time
+            self.out.write(frame)
+            self.frames_written = self.frames_written + 1
+            self.frame_times.append(frame_time)
+            if self.proxy_writer is not None:
+                self.proxy_writer.add_frame(frame)
+        self.writer_mutex.unlock()
+
     def set_video_path(self, path, video_name=""):
         """
         Update video path held by camera, for verification when setting a video path elsewhere in the application
@@ -105,6 +155,20 @@ class Camera(QThread):
         except IOError as e:
             return False
 
+    def set_stripe_dirs(self, stripe_dirs):
+        """
+        Set the additional directories to stripe recordings across, preferably each on a separate disk.
+        An empty list disables striping.
+        :param stripe_dirs: list of str paths to existing directories
+        :return: bool indicating success
+        """
+        for d in stripe_dirs:
+            if not os.path.isdir(d):
+                print("Stripe directory '" + d + "' does not exist")
+                return False
+        self.stripe_dirs = list(stripe_dirs)
+        return True
+
     def shutdown(self):
         """
         Set flag to indicate stopping the camera fee. Recommend only running this on complete shutdown of application.
@@ -114,14 +178,17 @@ class Camera(QThread):
 
     def disconnect(self):
         """
-        Disconnect current camera, blocking run() from entering video capture sequence
+        Disconnect current camera, blocking run() from entering video capture sequence. A running recording is finalized
+        and an armed recorder is released with its empty file first.
         :return: None
         """
+        if self.recording:
+            self.set_live_mode()
+        else:
+            self.disarm_recording()
         if self.capture_device is not None:
             if self.capture_device.isOpened():
                 self.capture_device.release()
-        if self.out is not None:
-            self.out.release()
         self.emit_cam_status()
         self.capture_device_nr = -1
 
@@ -140,10 +207,14 @@ class Camera(QThread):
         elif not self.capture_device.isOpened():
             print("Camera is not open")
         else:
+            was_armed = self.armed
+            self.disarm_recording()
             self.fps = fps
             self.set_running(False)
             self.set_capture_device(self.capture_device_nr)
             self.set_running(True)
+            if was_armed:
+                self.arm_recording()
             return True
 
     def set_running(self, is_running):
@@ -199,51 +270,185 @@ class Camera(QThread):
 
     def set_live_mode(self):
         """
-        Set camera to capture and show frames, but disable recording. Useful for "dry-runs" in an experiment
+        Set camera to capture and show frames, but disable recording. Useful for "dry-runs" in an experiment.
+        The writer is detached on the calling thread and released on a separate thread, so stopping a recording never
+        blocks the UI while the container is finalized.
         :return: None
         """
+        self.writer_mutex.lock()
         self.recording = False
-        time.sleep(1)
-        if self.out is not None:
-            if self.out.isOpened():
-                print("releasing writer")
-                self.out.release()
+        out = self.out
+        out_path = self.out_path
+        proxy_writer = self.proxy_writer
+        frame_times = self.frame_times
+        self.out = None
+        self.out_path = None
+        self.proxy_writer = None
+        self.frame_times = []
+        self.armed = False
+        self.writer_mutex.unlock()
+
+        if out is not None:
+            finalize_thread = threading.Thread(target=self.finalize_writer,
+                                               args=(out, out_path, frame_times, proxy_writer))
+            finalize_thread.start()
+            # threads of earlier recordings that have finished are dropped, only running ones are waited for
+            self.finalize_threads = [t for t in self.finalize_threads if t.is_alive()] + [finalize_thread]
         self.live = True
-        print("wrote " + str(self.frames_written) + " frames")
 
-    def set_rec_mode(self, frames_to_write=0):
+    def finalize_writer(self, out, out_path, frame_times, proxy_writer=None):
         """
-        Set camera to both capture frames and enable recording
-        :param frames_to_write:
+        Release a detached video writer and write its recording info, run by set_live_mode on a separate thread
+        :param out: cv2.VideoWriter to release
+        :param out_path: str path the writer recorded to
+        :param frame_times: list of perf_counter timestamps of every frame written to out
+        :param proxy_writer: ProxyWriter recording alongside out, None if no proxy was recorded
         :return: None
         """
-        self.frames_written = 0
-        print(self.capture_device.get(3))
-        print(self.capture_device.get(4))
-        print(self.capture_device.get(5))
+        if out.isOpened():
+            print("releasing writer")
+            out.release()
+        info = write_recording_info(out_path, self.fps, frame_times)
+        print("wrote " + str(len(frame_times)) + " frames to " + str(out_path))
+        if info is not None:
+            print("requested " + str(info["requested_fps"]) + " fps, measured " + str(round(info["measured_fps"], 2)))
+        if proxy_writer is not None:
+            proxy_writer.stop()
+            print("wrote " + str(proxy_writer.frames_written) + " proxy frames (" +
+                  str(proxy_writer.frames_repeated) + " repeated) to " + proxy_writer.path)
+
+    def wait_for_finalize(self):
+        """
+        Block until all writers handed off by set_live_mode are released. Use on shutdown.
+        :return: None
+        """
+        for t in self.finalize_threads:
+            t.join()
+        self.finalize_threads = []
+
+    def get_unique_video_path(self):
+        """
+        Find a path to record to that does not overwrite an existing recording, by appending (1), (2), ... to the
+        name held in video_path
+        :return: str path to record to
+        """
+        def exists(path):
+            return os.path.isfile(path) or os.path.isfile(get_manifest_path(path))
+
+        if not exists(self.video_path):
+            return self.video_path
+        print("recording with same name already exists")
+        [name, ext] = self.video_path.rsplit('.', 1)
+        index = 1
+        while exists(name + "(" + str(index) + ")." + ext):
+            index = index + 1
+        return name + "(" + str(index) + ")." + ext
+
+    def arm_recording(self):
+        """
+        Open the video writer ahead of an experiment. Creating the writer and initializing the codec is the slow part
+        of starting a recording, arming moves that cost to before the experiment is started so that set_rec_mode only
+        has to flip a flag. The armed marker written next to the recording keeps it from being listed as a recording
+        until set_rec_mode removes it, see camera/recording_paths.py.
+        :return: bool indicating if the recorder is armed
+        """
+        if self.armed:
+            return True
+        if self.recording:
+            print("Cannot arm recorder while recording")
+            return False
+        if self.video_path[-4:] != ".avi":
+            return False
+
+        vid_path = self.get_unique_video_path()
+        try:
+            open(get_armed_path(vid_path), 'w').close()
+        except IOError as e:
+            print("Could not arm recorder for " + vid_path)
+            print(e)
+            return False
         fourcc = cv2.VideoWriter_fourcc('X', 'V', 'I', 'D')
-        vid_path = ""
-        if os.path.isfile(self.video_path):
-            print("recording with same name already exists")
-            done = False
-            index = 1
-            [name, ext] = self.video_path.split('.')
-            print(name)
-            while not done:
-                new_video_path = name + "(" + str(index) + ")." + ext
-                if not os.path.isfile(new_video_path):
-                    done = True
-                    vid_path = new_video_path
-                    # self.video_path = new_video_path
-                else:
-                    index = index + 1
+        size = (int(self.res_width), int(self.res_height))
+        if len(self.stripe_dirs) > 0:
+            out = StripedWriter(get_manifest_path(vid_path), get_stripe_paths(vid_path, self.stripe_dirs),
+                                fourcc, self.fps, size)
         else:
-            vid_path = self.video_path
+            out = cv2.VideoWriter(vid_path, fourcc, self.fps, size, isColor=True)
+        if not out.isOpened():
+            print("Could not open video writer for " + vid_path)
+            if isinstance(out, StripedWriter):
+                out.discard()
+            remove_file(get_armed_path(vid_path))
+            return False
 
-        if self.video_path[-4:len(vid_path)] == ".avi":
-            self.out = cv2.VideoWriter(vid_path, fourcc, self.fps, (int(self.res_width), int(self.res_height)), isColor=True)
-            self.recording = True
-            self.live = False
+        proxy_writer = None
+        if self.record_proxy:
+            proxy_writer = ProxyWriter(get_proxy_path(vid_path), self.fps, self.proxy_size)
+            if proxy_writer.isOpened():
+                proxy_writer.start()
+            else:
+                print("Could not open proxy writer, recording without proxy")
+                proxy_writer = None
+
+        self.writer_mutex.lock()
+        self.out = out
+        self.out_path = vid_path
+        self.proxy_writer = proxy_writer
+        self.frames_written = 0
+        self.frame_times = []
+        self.rec_start_time = None
+        self.armed = True
+        self.writer_mutex.unlock()
+        return True
+
+    def disarm_recording(self):
+        """
+        Release an armed writer that was never committed to and remove its empty file
+        :return: None
+        """
+        if not self.armed or self.recording:
+            return
+        self.writer_mutex.lock()
+        out = self.out
+        out_path = self.out_path
+        proxy_writer = self.proxy_writer
+        self.out = None
+        self.out_path = None
+        self.proxy_writer = None
+        self.armed = False
+        self.writer_mutex.unlock()
+
+        if isinstance(out, StripedWriter):
+            out.discard()
+        elif out is not None:
+            out.release()
+        if proxy_writer is not None:
+            proxy_writer.stop()
+        if out_path is not None:
+            remove_file(out_path)
+            remove_file(get_armed_path(out_path))
+        if proxy_writer is not None:
+            remove_file(proxy_writer.path)
+
+    def set_rec_mode(self, frames_to_write=0):
+        """
+        Set camera to both capture frames and enable recording. Arms the recorder first if that has not been done
+        already, recording then begins with the next frame read from the capture device.
+        :param frames_to_write:
+        :return: None
+        """
+        if not self.arm_recording():
+            print("Could not start recording to " + str(self.video_path))
+            return
+        self.writer_mutex.lock()
+        self.frames_written = 0
+        self.frame_times = []
+        self.rec_start_time = None
+        self.recording = True
+        self.live = False
+        out_path = self.out_path
+        self.writer_mutex.unlock()
+        remove_file(get_armed_path(out_path))
 
     def set_capture_device(self, cap_index):
         """
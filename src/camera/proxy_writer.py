@@ -0,0 +1,88 @@
+import cv2
+import queue
+from PySide6.QtCore import *
+from camera.recording_paths import get_proxy_path, is_proxy_path
+
+"""
+Module providing a writer for low resolution proxy recordings, made alongside the full resolution master recording.
+The proxy is only meant for playback and scrubbing in the analysis dialog, all analysis and frame export uses the master.
+Proxy file names are defined in camera/recording_paths.py.
+"""
+
+_stop = object()
+
+
+class ProxyWriter(QThread):
+    """
+    Writes frames to a proxy recording on its own thread. The capture thread downscales every frame before it is
+    queued, so the queue only ever holds proxy sized frames, and encoding is left to the proxy thread.
+
+    If the writer falls behind by more than max_pending frames, the capture thread queues a marker instead of the frame
+    and the previous proxy frame is repeated. This keeps every proxy frame at the same index as its master frame.
+    """
+    def __init__(self, path, fps, size=(640, 512), max_pending=60):
+        """
+        Open the proxy video writer, call start() to begin consuming frames.
+        :param path: str path to write proxy to
+        :param fps: fps of the master recording
+        :param size: tuple (int: width, int: height) of proxy frames
+        :param max_pending: int number of frames allowed to queue up before frames are repeated instead, 60 frames of
+        640x512 take 59 MB
+        """
+        super().__init__()
+        self.path = path
+        self.size = size
+        self.max_pending = max_pending
+        self.frames = queue.Queue()
+        self.frames_written = 0
+        self.frames_repeated = 0
+        self.last_frame = None
+        fourcc = cv2.VideoWriter_fourcc('M', 'J', 'P', 'G')
+        self.out = cv2.VideoWriter(path, fourcc, fps, size, isColor=True)
+
+    def isOpened(self):
+        """
+        :return: bool indicating if the proxy video writer could be opened
+        """
+        return self.out.isOpened()
+
+    def add_frame(self, frame):
+        """
+        Downscale and queue a captured frame for the proxy, never blocks
+        :param frame: full resolution frame
+        :return: None
+        """
+        if self.frames.qsize() < self.max_pending:
+            self.frames.put(cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA))
+        else:
+            self.frames.put(None)
+
+    def run(self):
+        """
+        Consume queued frames until stop() is called and the queue is drained
+        :return: None
+        """
+        while True:
+            frame = self.frames.get()
+            if frame is _stop:
+                break
+            if frame is None:
+                if self.last_frame is None:
+                    continue
+                self.frames_repeated = self.frames_repeated + 1
+            else:
+                self.last_frame = frame
+            self.out.write(self.last_frame)
+            self.frames_written = self.frames_written + 1
+        self.out.release()
+
+    def stop(self):
+        """
+        Write all remaining queued frames, then release the proxy video writer. Blocks until done.
+        :return: None
+        """
+        self.frames.put(_stop)
+        if self.isRunning():
+            self.wait()
+        else:
+            self.out.release()
@@ -0,0 +1,71 @@
+import json
+import os
+
+"""
+Module providing the recording info sidecar written next to every recording. Cameras often deliver fewer frames per
+second than requested, and the container only holds the requested rate. The sidecar holds the rate that was actually
+measured while recording along with the capture time of every frame, so playback and time based analysis stay correct.
+"""
+
+_info_suffix = "_rec.json"
+
+
+def get_info_path(video_path):
+    """
+    :param video_path: str path of a recording
+    :return: str path of the recording info sidecar of video_path
+    """
+    return video_path.rsplit('.', 1)[0] + _info_suffix
+
+
+def measure_fps(frame_times):
+    """
+    Compute the delivered frame rate from capture timestamps
+    :param frame_times: list of float perf_counter timestamps of each recorded frame
+    :return: float frames per second, None if there are too few frames to measure
+    """
+    if len(frame_times) < 2 or frame_times[-1] <= frame_times[0]:
+        return None
+    return (len(frame_times) - 1) / (frame_times[-1] - frame_times[0])
+
+
+def write_recording_info(video_path, requested_fps, frame_times):
+    """
+    Write the recording info sidecar of a recording
+    :param video_path: str path of the recording
+    :param requested_fps: fps the recording was made with
+    :param frame_times: list of float perf_counter timestamps of each recorded frame
+    :return: dictionary of the info written, None on failure
+    """
+    measured_fps = measure_fps(frame_times)
+    start = frame_times[0] if len(frame_times) > 0 else 0
+    info = {"requested_fps": requested_fps,
+            "measured_fps": measured_fps if measured_fps is not None else requested_fps,
+            "frames_written": len(frame_times),
+            "frame_times": [round(t - start, 6) for t in frame_times]}
+    try:
+        with open(get_info_path(video_path), 'w') as f:
+            json.dump(info, f, ensure_ascii=False)
+        return info
+    except IOError as e:
+        print("An error occurred when writing recording info:")
+        print(e)
+        return None
+
+
+def load_recording_info(video_path):
+    """
+    Load the recording info sidecar of a recording
+    :param video_path: str path of the recording
+    :return: dictionary of recording info, None if the recording has no sidecar
+    """
+    path = get_info_path(video_path)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError) as e:
+        print("An error occurred when reading recording info '" + path + "'")
+        print(e)
+        return None
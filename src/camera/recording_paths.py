@@ -0,0 +1,56 @@
+import os
+from camera.striped_capture import is_manifest_path, is_stripe_path, get_master_path
+
+"""
+Names of the files making up a recording, without depending on Qt so headless tools can find recordings. A recording is
+a master .avi, or the manifest of a striped recording, with optionally a low resolution proxy next to it, see
+camera/proxy_writer.py. A recording armed ahead of an experiment, see Camera.arm_recording, has an armed marker next to
+it until recording starts and is not listed as a recording, nor is one left behind when the application crashed while it
+was armed.
+"""
+
+_proxy_tag = ".proxy"
+_armed_suffix = ".armed"
+
+
+def get_proxy_path(video_path):
+    """
+    :param video_path: str path of a master recording
+    :return: str path of the proxy recording belonging to video_path
+    """
+    name, ext = video_path.rsplit('.', 1)
+    return name + _proxy_tag + "." + ext
+
+
+def is_proxy_path(video_path):
+    """
+    :param video_path: str path of a recording
+    :return: bool indicating if video_path is a proxy recording
+    """
+    return video_path.rsplit('.', 1)[0].endswith(_proxy_tag)
+
+
+def get_armed_path(video_path):
+    """
+    :param video_path: str path of a recording, or manifest of a striped recording
+    :return: str path of the marker of the recording while it is armed but not recording
+    """
+    return get_master_path(video_path).rsplit('.', 1)[0] + _armed_suffix
+
+
+def is_recording_path(path):
+    """
+    :param path: str path of a file
+    :return: bool indicating if path is a master recording or the manifest of a striped recording, proxy recordings,
+    individual stripes and armed recordings are not
+    """
+    return ((path[-4:len(path)] == ".avi" and not is_proxy_path(path) and not is_stripe_path(path)) or
+            is_manifest_path(path)) and not os.path.isfile(get_armed_path(path))
+
+
+def list_recordings(folder):
+    """
+    :param folder: str path of folder
+    :return: sorted list of str names of the recordings in folder
+    """
+    return sorted(name for name in os.listdir(folder) if is_recording_path(os.path.join(folder, name)))
@@ -0,0 +1,176 @@
+import cv2
+import json
+import os
+
+"""
+Reading of striped recordings: one recording spread round-robin over several video files, typically placed on separate
+disks to add up their write bandwidth. Frame i of a recording striped over n files is frame i // n of stripe i % n. A
+manifest next to the first stripe lists the stripes and lets a striped recording be opened as one video with
+open_video. This module does not depend on Qt, so recordings can be read by headless tools, see
+camera/striped_video.py for recording.
+"""
+
+_manifest_suffix = "_stripes.json"
+_stripe_tag = ".stripe"
+
+
+def get_manifest_path(video_path):
+    """
+    :param video_path: str path of a recording, as it would be named if it were not striped
+    :return: str path of the manifest of the striped recording
+    """
+    return video_path.rsplit('.', 1)[0] + _manifest_suffix
+
+
+def is_manifest_path(path):
+    """
+    :param path: str path or name of a file
+    :return: bool indicating if path is the manifest of a striped recording
+    """
+    return path.endswith(_manifest_suffix)
+
+
+def is_stripe_path(path):
+    """
+    :param path: str path or name of a file
+    :return: bool indicating if path is one of the stripes of a striped recording
+    """
+    return _stripe_tag in os.path.basename(path)
+
+
+def get_master_path(path):
+    """
+    Get the path a recording would have had if it were not striped, used to find files stored next to a recording
+    :param path: str path of a recording or manifest
+    :return: str path of the recording
+    """
+    if is_manifest_path(path):
+        return path[0:-len(_manifest_suffix)] + ".avi"
+    return path
+
+
+def get_stripe_paths(video_path, stripe_dirs):
+    """
+    :param video_path: str path of a recording, as it would be named if it were not striped
+    :param stripe_dirs: list of str directories to stripe across, the first stripe is kept next to video_path
+    :return: list of str paths of each stripe
+    """
+    name, ext = os.path.basename(video_path).rsplit('.', 1)
+    dirs = [os.path.dirname(video_path)] + list(stripe_dirs)
+    return [os.path.join(d, name + _stripe_tag + str(i) + "." + ext) for i, d in enumerate(dirs)]
+
+
+def open_video(path):
+    """
+    Open a recording for reading, striped or not
+    :param path: str path of a video file or manifest of a striped recording
+    :return: cv2.VideoCapture or StripedCapture
+    """
+    if is_manifest_path(path):
+        return StripedCapture(path)
+    return cv2.VideoCapture(path)
+
+
+class StripedCapture(object):
+    """
+    Drop-in replacement for cv2.VideoCapture that reads a striped recording as a single video
+    """
+    def __init__(self, manifest_path):
+        """
+        Read the manifest and open every stripe
+        :param manifest_path: str path of the manifest
+        """
+        self.manifest_path = manifest_path
+        self.position = 0
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            self.fps = manifest["fps"]
+            self.captures = [cv2.VideoCapture(p) for p in manifest["stripes"]]
+            self.frame_count = manifest["frame_count"]
+            if self.frame_count is None:
+                self.frame_count = self.count_frames()
+        except (IOError, KeyError, ValueError) as e:
+            print("An error occurred when reading stripe manifest '" + manifest_path + "'")
+            print(e)
+            self.frame_count = 0
+            self.fps = 0
+            self.captures = []
+
+    def count_frames(self):
+        """
+        Number of frames of a recording that was not released, the manifest has no frame count then. Frames are read up
+        to the first one missing from its stripe.
+        :return: int number of frames that can be read
+        """
+        n = len(self.captures)
+        counts = [int(c.get(cv2.CAP_PROP_FRAME_COUNT)) for c in self.captures]
+        return min([n * count + k for k, count in enumerate(counts)] or [0])
+
+    def isOpened(self):
+        """
+        :return: bool indicating if all stripes could be opened
+        """
+        return len(self.captures) > 0 and all(c.isOpened() for c in self.captures)
+
+    def read(self):
+        """
+        Read the next frame of the recording
+        :return: tuple (bool: success, frame)
+        """
+        if self.position >= self.frame_count or not self.isOpened():
+            return False, None
+        r, frame = self.captures[self.position % len(self.captures)].read()
+        self.position = self.position + 1
+        return r, frame
+
+    def grab(self):
+        """
+        Skip the next frame of the recording
+        :return: bool indicating success
+        """
+        if self.position >= self.frame_count or not self.isOpened():
+            return False
+        r = self.captures[self.position % len(self.captures)].grab()
+        self.position = self.position + 1
+        return r
+
+    def set(self, prop, value):
+        """
+        Set a capture property, only seeking by frame is handled across stripes, anything else is set on every stripe
+        :param prop: cv2.CAP_PROP_* property
+        :param value: value to set
+        :return: bool indicating success
+        """
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return all([c.set(prop, value) for c in self.captures])
+        n = len(self.captures)
+        self.position = min(max(int(value), 0), self.frame_count)
+        for k, c in enumerate(self.captures):
+            # number of frames in stripe k that come before self.position
+            c.set(cv2.CAP_PROP_POS_FRAMES, max(self.position - k + n - 1, 0) // n)
+        return True
+
+    def get(self, prop):
+        """
+        Get a capture property, frame count, position and fps refer to the recording as a whole
+        :param prop: cv2.CAP_PROP_* property
+        :return: value of the property
+        """
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        elif prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count)
+        elif prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        elif len(self.captures) > 0:
+            return self.captures[0].get(prop)
+        return 0.0
+
+    def release(self):
+        """
+        Release every stripe
+        :return: None
+        """
+        for c in self.captures:
+            c.release()
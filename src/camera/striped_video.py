@@ -0,0 +1,175 @@
+import cv2
+import json
+import os
+import queue
+import numpy as np
+from PySide6.QtCore import *
+from camera.striped_capture import get_manifest_path, is_manifest_path, is_stripe_path, get_master_path, \
+    get_stripe_paths, open_video, StripedCapture
+
+"""
+Module providing recording to striped recordings: one recording spread round-robin over several video files, typically
+placed on separate disks to add up their write bandwidth. Frame i of a recording striped over n files is frame i // n of
+stripe i % n. Reading striped recordings lives in camera/striped_capture.py and is imported here as well.
+"""
+
+_stop = object()
+
+
+class StripeWriter(QThread):
+    """
+    Writes the frames of a single stripe on its own thread.
+
+    If the writer falls behind by more than max_pending frames, e.g. because its disk is slow, the capture thread queues
+    a marker instead of the frame and the previous frame of the stripe is repeated, like ProxyWriter does. This bounds
+    memory and keeps every frame of the recording at its index.
+    """
+    def __init__(self, path, fourcc, fps, size, max_pending=30):
+        """
+        Open the video writer of the stripe, call start() to begin consuming frames.
+        :param path: str path to write stripe to
+        :param fourcc: codec to write with
+        :param fps: fps of the recording
+        :param size: tuple (int: width, int: height) of frames
+        :param max_pending: int number of frames allowed to queue up before frames are repeated instead, 30 frames of
+        1280x1024 take 118 MB
+        """
+        super().__init__()
+        self.path = path
+        self.size = size
+        self.max_pending = max_pending
+        self.frames = queue.Queue()
+        self.frames_written = 0
+        self.last_frame = None
+        self.out = cv2.VideoWriter(path, fourcc, fps, size, isColor=True)
+
+    def add_frame(self, frame):
+        """
+        Queue a frame, never blocks
+        :param frame: frame to write
+        :return: bool True if the frame was queued, False if the previous frame is repeated in its place
+        """
+        if self.frames.qsize() < self.max_pending:
+            self.frames.put(frame)
+            return True
+        self.frames.put(None)
+        return False
+
+    def run(self):
+        """
+        Consume queued frames until stop() is called and the queue is drained
+        :return: None
+        """
+        while True:
+            frame = self.frames.get()
+            if frame is _stop:
+                break
+            if frame is not None:
+                self.last_frame = frame
+            elif self.last_frame is None:
+                # nothing to repeat before the first frame, a black frame keeps later frames at their index
+                self.last_frame = np.zeros((self.size[1], self.size[0], 3), dtype=np.uint8)
+            self.out.write(self.last_frame)
+            self.frames_written = self.frames_written + 1
+        self.out.release()
+
+    def stop(self):
+        """
+        Write all remaining queued frames, then release the video writer. Blocks until done.
+        :return: None
+        """
+        self.frames.put(_stop)
+        if self.isRunning():
+            self.wait()
+        else:
+            self.out.release()
+
+
+class StripedWriter(object):
+    """
+    Drop-in replacement for cv2.VideoWriter that distributes frames round-robin over a number of stripes, each written
+    in parallel by its own StripeWriter. The manifest is written when the writer is opened, without a frame count, so
+    a recording interrupted before release() can still be found and read, see StripedCapture. release() writes the
+    frame count and the indices of the frames a stripe could not keep up with, which hold a repeat of the frame before
+    them in the stripe.
+    """
+    def __init__(self, manifest_path, stripe_paths, fourcc, fps, size):
+        """
+        Open a writer for every stripe, start their threads and write the manifest
+        :param manifest_path: str path to write the manifest to
+        :param stripe_paths: list of str paths, one per stripe
+        :param fourcc: codec to write with
+        :param fps: fps of the recording
+        :param size: tuple (int: width, int: height) of frames
+        """
+        self.manifest_path = manifest_path
+        self.fps = fps
+        self.size = size
+        self.frames_written = 0
+        self.repeated_frames = []
+        self.writers = [StripeWriter(p, fourcc, fps, size) for p in stripe_paths]
+        for w in self.writers:
+            if w.out.isOpened():
+                w.start()
+        if self.isOpened():
+            self.write_manifest(None)
+
+    def isOpened(self):
+        """
+        :return: bool indicating if all stripes could be opened
+        """
+        return all(w.out.isOpened() for w in self.writers)
+
+    def write(self, frame):
+        """
+        Queue a frame on the next stripe
+        :param frame: frame to write
+        :return: None
+        """
+        writer = self.writers[self.frames_written % len(self.writers)]
+        if not writer.add_frame(frame):
+            if len(self.repeated_frames) == 0:
+                print("Stripe " + writer.path + " is falling behind, frames are repeated")
+            self.repeated_frames.append(self.frames_written)
+        self.frames_written = self.frames_written + 1
+
+    def write_manifest(self, frame_count):
+        """
+        :param frame_count: int number of frames of the recording, None while it is being recorded
+        :return: None
+        """
+        manifest = {"stripes": [os.path.abspath(w.path) for w in self.writers],
+                    "frame_count": frame_count,
+                    "repeated_frames": self.repeated_frames,
+                    "fps": self.fps,
+                    "width": self.size[0],
+                    "height": self.size[1]}
+        try:
+            with open(self.manifest_path, 'w') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=4)
+        except IOError as e:
+            print("An error occurred when writing stripe manifest:")
+            print(e)
+
+    def release(self):
+        """
+        Finish writing all stripes and write the frame count to the manifest
+        :return: None
+        """
+        for w in self.writers:
+            w.stop()
+        if len(self.repeated_frames) > 0:
+            print(str(len(self.repeated_frames)) + " frames of " + self.manifest_path + " were repeated")
+        self.write_manifest(self.frames_written)
+
+    def discard(self):
+        """
+        Stop all stripes and remove their files and the manifest
+        :return: None
+        """
+        for w in self.writers:
+            w.stop()
+            if os.path.isfile(w.path):
+                os.remove(w.path)
+        if os.path.isfile(self.manifest_path):
+            os.remove(self.manifest_path)
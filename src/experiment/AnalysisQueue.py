@@ -0,0 +1,229 @@
+from PySide6.QtCore import *
+import json
+import os
+import subprocess
+import sys
+import time
+from camera.recording_info import get_info_path
+from camera.striped_capture import get_manifest_path
+
+"""
+Queue of recordings analysed automatically once an experiment has finished. Every recording is analysed by
+experiment/batch.py in a separate process at a lower OS priority, so the analysis never takes time from capturing and
+writing frames. While an experiment is running the queue starts no new analysis and a running analysis waits at its next
+progress check. The queue is kept in a JSON file, recordings still queued when the application is closed are analysed
+the next time it starts.
+"""
+
+_src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_queue(path):
+    """
+    :param path: str path of queue file
+    :return: list of job dictionaries, empty if there is no readable queue file
+    """
+    if not os.path.isfile(path):
+        return []
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError) as e:
+        print("An error occurred when reading analysis queue '" + path + "'")
+        print(e)
+        return []
+
+
+def save_queue(path, jobs):
+    """
+    :param path: str path of queue file
+    :param jobs: list of job dictionaries
+    :return: bool True on success
+    """
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(jobs, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, path)
+        return True
+    except (IOError, OSError) as e:
+        print("An error occurred when writing analysis queue:")
+        print(e)
+        return False
+
+
+def get_video_path(recording_path):
+    """
+    :param recording_path: str path a recording was made to, see Camera.out_path
+    :return: str path of the recording, or of its manifest if it was striped, None if neither exists
+    """
+    if os.path.isfile(recording_path):
+        return recording_path
+    if os.path.isfile(get_manifest_path(recording_path)):
+        return get_manifest_path(recording_path)
+    return None
+
+
+class AnalysisQueue(QThread):
+    """
+    Runs queued analyses one at a time in the background.
+
+    Jobs are dictionaries {"video": str, "settings": dict, "rois": list, "status": str, "added": float, "message": str},
+    status being "pending", "running", "done" or "failed".
+
+    Attributes
+    ----------
+    signal_job_changed : Signal
+        Qt signal object, emits {"video": str, "status": str, "message": str} when a job is added, starts or finishes
+    """
+    signal_job_changed = Signal(bytes)
+
+    def __init__(self, queue_path, settle_time=60, poll_interval=2):
+        """
+        :param queue_path: str path of the JSON file the queue is kept in
+        :param settle_time: float seconds after its last change a recording without recording info is analysed, the
+        recording info is written when a recording is finalized, see Camera.finalize_writer
+        :param poll_interval: float seconds between checks for work
+        """
+        super().__init__()
+        self.queue_path = queue_path
+        self.pause_path = queue_path.rsplit('.', 1)[0] + ".pause"
+        self.settings_path = queue_path.rsplit('.', 1)[0] + "_job.json"
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.mutex = QMutex()
+        self.alive = True
+        self.paused = False
+        self.process = None
+        self.jobs = load_queue(queue_path)
+        # jobs running when the application was closed are started again
+        for job in self.jobs:
+            if job["status"] == "running":
+                job["status"] = "pending"
+        self.set_paused(False)
+
+    def add_recording(self, recording_path, settings, rois=None):
+        """
+        Queue a recording for analysis
+        :param recording_path: str path the recording was made to
+        :param settings: dictionary of DataCollect keyword arguments
+        :param rois: list of ROIs, see experiment/roi.py, None or empty to analyse whole frames
+        :return: None
+        """
+        job = {"video": os.path.abspath(recording_path), "settings": settings, "rois": rois or [],
+               "status": "pending", "added": time.time(), "message": ""}
+        self.mutex.lock()
+        self.jobs.append(job)
+        save_queue(self.queue_path, self.jobs)
+        self.mutex.unlock()
+        self.emit_job(job)
+
+    def set_paused(self, paused):
+        """
+        Hold analysis, e.g. while an experiment is running
+        :param paused: bool True to hold analysis, False to resume
+        :return: None
+        """
+        self.paused = paused
+        try:
+            if paused:
+                open(self.pause_path, 'w').close()
+            elif os.path.exists(self.pause_path):
+                os.remove(self.pause_path)
+        except OSError as e:
+            print("Could not " + ("pause" if paused else "resume") + " analysis queue")
+            print(e)
+
+    def is_ready(self, job):
+        """
+        :param job: job dictionary
+        :return: bool True if the recording of job has been finalized
+        """
+        video_path = get_video_path(job["video"])
+        if video_path is None:
+            return False
+        return os.path.isfile(get_info_path(job["video"])) or \
+            time.time() - os.path.getmtime(video_path) > self.settle_time
+
+    def next_job(self):
+        """
+        :return: first pending job whose recording has been finalized, None if there is none
+        """
+        self.mutex.lock()
+        jobs = [job for job in self.jobs if job["status"] == "pending"]
+        self.mutex.unlock()
+        for job in jobs:
+            if self.is_ready(job):
+                return job
+        return None
+
+    def run(self):
+        """
+        Analyse queued recordings until shutdown is called
+        :return: None
+        """
+        while self.alive:
+            job = None if self.paused else self.next_job()
+            if job is None:
+                self.msleep(int(self.poll_interval * 1000))
+            else:
+                self.run_job(job)
+
+    def run_job(self, job):
+        """
+        Analyse the recording of a job in a separate process and record the outcome
+        :param job: job dictionary
+        :return: None
+        """
+        self.set_status(job, "running", "")
+        try:
+            with open(self.settings_path, 'w') as f:
+                json.dump(dict(job["settings"], rois=job["rois"]), f, ensure_ascii=False, indent=4)
+            self.process = subprocess.Popen([sys.executable, "-m", "experiment.batch", get_video_path(job["video"]),
+                                             "--settings", self.settings_path, "--workers", "1", "--low-priority",
+                                             "--pause-file", self.pause_path], cwd=_src_dir)
+            while self.process.poll() is None:
+                if not self.alive:
+                    self.process.terminate()
+                self.msleep(int(self.poll_interval * 1000))
+            if not self.alive:
+                self.set_status(job, "pending", "")
+            elif self.process.returncode == 0:
+                self.set_status(job, "done", "")
+            else:
+                self.set_status(job, "failed", "Analysis exited with status " + str(self.process.returncode))
+        except Exception as e:
+            print("An error occurred when analysing '" + job["video"] + "'")
+            print(e)
+            self.set_status(job, "failed", str(e))
+        self.process = None
+
+    def set_status(self, job, status, message):
+        """
+        :param job: job dictionary
+        :param status: str new status of job
+        :param message: str reason the job failed, empty otherwise
+        :return: None
+        """
+        self.mutex.lock()
+        job["status"] = status
+        job["message"] = message
+        save_queue(self.queue_path, self.jobs)
+        self.mutex.unlock()
+        self.emit_job(job)
+
+    def emit_job(self, job):
+        """
+        :param job: job dictionary
+        :return: None
+        """
+        self.signal_job_changed.emit({"video": os.path.basename(job["video"]), "status": job["status"],
+                                      "message": job["message"]})
+
+    def shutdown(self):
+        """
+        Stop the queue, a running analysis is stopped and started again the next time the queue is created
+        :return: None
+        """
+        self.alive = False
+        self.wait()
@@ -0,0 +1,108 @@
+from PySide6.QtCore import *
+import multiprocessing
+import os
+import time
+import cv2
+from camera.striped_capture import open_video
+from experiment.analysis import analyze_video, AnalysisCancelled
+from experiment.checkpoint import remove_checkpoint
+from experiment.track_store import write_tracks
+
+
+class AnalysisWorker(QThread):
+    """
+    Analyses a whole video as fast as the CPU allows, independent of playback. Long videos are split into segments
+    analysed in parallel processes, see experiment/analysis.py.
+
+    Attributes
+    ----------
+    signal_progress : Signal
+        Qt signal object, emits {"frames": int, "total": int, "fps": float, "eta": float seconds} as analysis progresses
+    signal_analysis_done : Signal
+        Qt signal object, emits {"video": str, "success": bool, "message": str} when analysis has finished or failed
+    """
+    signal_progress = Signal(bytes)
+    signal_analysis_done = Signal(bytes)
+
+    def __init__(self, video_path, settings, output_paths, rois=None, workers=None, overlap=150, checkpoint_path=None):
+        """
+        :param video_path: str path to video, or manifest of a striped recording
+        :param settings: dictionary of DataCollect keyword arguments, see VideoHandler.get_analysis_settings
+        :param output_paths: dictionary of str path of the track store to write results to by ROI name, None for a video without ROIs
+        :param rois: list of ROIs, see experiment/roi.py, None or empty to analyse whole frames
+        :param workers: int number of processes, os.cpu_count() if None
+        :param overlap: int number of frames every segment after the first starts before the frames it owns
+        :param checkpoint_path: str path of a playback analysis checkpoint of the video, removed once the results are
+        written as they replace the results it belongs to, None if there is none
+        """
+        super().__init__()
+        self.video_path = video_path
+        self.settings = settings
+        self.output_paths = output_paths
+        self.rois = rois
+        self.workers = workers or os.cpu_count() or 1
+        self.overlap = overlap
+        self.checkpoint_path = checkpoint_path
+        # shared with the analysis processes, see experiment/analysis.py
+        self.cancelled = multiprocessing.get_context("spawn").Event()
+        self.start_time = 0
+
+    def get_segments(self, frame_count):
+        """
+        Split into a few segments per process, so progress is reported while segments finish, but not into segments so
+        short that the overlap analysed twice adds much
+        :param frame_count: int number of frames of the video
+        :return: int number of segments
+        """
+        if self.workers <= 1:
+            return 1
+        return max(min(4 * self.workers, frame_count // (20 * self.overlap)), 1)
+
+    def run(self):
+        """
+        Analyse the video and write the results
+        :return: None
+        """
+        name = os.path.basename(self.video_path)
+        self.start_time = time.perf_counter()
+        try:
+            video = open_video(self.video_path)
+            frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+            video.release()
+            results = analyze_video(self.video_path, self.settings, self.rois, segments=self.get_segments(frame_count),
+                                    overlap=self.overlap, workers=self.workers, progress=self.report_progress,
+                                    cancelled=self.cancelled)
+            for roi_name, rows in results.items():
+                if not write_tracks(self.output_paths[roi_name], rows):
+                    raise IOError("Could not write " + self.output_paths[roi_name])
+            if self.checkpoint_path is not None:
+                remove_checkpoint(self.checkpoint_path)
+            self.signal_analysis_done.emit({"video": name, "success": True,
+                                            "message": "Analysed in %.0f s" % (time.perf_counter() - self.start_time)})
+        except AnalysisCancelled:
+            self.signal_analysis_done.emit({"video": name, "success": False, "message": "Analysis cancelled"})
+        except Exception as e:
+            print("An error occurred when analysing '" + name + "'")
+            print(e)
+            self.signal_analysis_done.emit({"video": name, "success": False, "message": str(e)})
+
+    def report_progress(self, frames, total):
+        """
+        Emit progress and the estimated time left, stops analysis if it was cancelled
+        :param frames: int number of frames analysed
+        :param total: int number of frames of the video
+        :return: None
+        """
+        if self.cancelled.is_set():
+            raise AnalysisCancelled()
+        elapsed = time.perf_counter() - self.start_time
+        fps = frames / elapsed if elapsed > 0 else 0
+        eta = (total - frames) / fps if fps > 0 else -1
+        self.signal_progress.emit({"frames": frames, "total": total, "fps": fps, "eta": eta})
+
+    def cancel(self):
+        """
+        Stop analysis within the next 100 frames of every segment, results are not written
+        :return: None
+        """
+        self.cancelled.set()
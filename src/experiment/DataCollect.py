@@ -3,11 +3,51 @@ import numpy as np
 import os
 import glob
 import math
-from experiment.tracker.tracker import *
+from experiment.tracker.engines import make_tracker
+from experiment.detector import make_detector
+from experiment.pyramid import shrink, scale_area, scale_boxes, refine_boxes, downscale_factors
+from experiment.background import make_background, restore_background, fit_image
+from experiment.bands import BandedDetector
+
+
+class TrackingResult:
+    """
+    Tracking data of one analysed frame, without any drawing. See experiment/overlay.py for displaying it.
+    """
+    def __init__(self, frame_index, boxes=None, ids=None, filled=None):
+        """
+        :param frame_index: int number of the frame, counting from 1
+        :param boxes: (n, 4) int array of [x, y, w, h] of tracked objects
+        :param ids: (n,) int array of tracking ids, one per box
+        :param filled: list of [xm, ym, w, h, id, frame] interpolated for frames skipped before this one
+        """
+        self.frame_index = frame_index
+        self.boxes = np.empty((0, 4), dtype=np.int64) if boxes is None else boxes
+        self.ids = np.empty(0, dtype=np.int64) if ids is None else ids
+        self.centers = self.boxes[:, 0:2] + self.boxes[:, 2:4] // 2
+        self.filled = [] if filled is None else filled
+
+    def __len__(self):
+        return len(self.ids)
+
+    def current_points(self):
+        """
+        :return: list of [xm, ym, w, h, id, frame] of this frame
+        """
+        frames = np.full((len(self.ids), 1), self.frame_index, dtype=np.int64)
+        return np.column_stack((self.centers, self.boxes[:, 2:4], self.ids, frames)).tolist()
+
+    def to_points(self):
+        """
+        :return: list of [xm, ym, w, h, id, frame] of skipped frames and this frame, ordered by frame
+        """
+        return self.filled + self.current_points()
 
 
 class DataCollect:
-    def __init__(self, pop_num, skip_frames):
+    def __init__(self, pop_num, skip_frames, tracker_engine="greedy", detect_every=1, detector_backend="contours",
+                 downscale=1, refine=False, background="mog2", background_sample=None, bands=1, band_overlap=16,
+                 min_area=30, max_area=200, lost_gate=20, match_gate=30, background_threshold=None):
 
         # largest tracking id
         self.pop_num = pop_num
@@ -17,42 +57,195 @@ class DataCollect:
 
         # Create a videoCapture object
         self.detectionArray = []
-        self.tracker = init_tracker(pop_num, skip_frames)
-        self.detector = cv2.createBackgroundSubtractorMOG2()  # Removed history=100, varThreshold=10
+        # Run detection on every n-th frame only, positions in between are interpolated. The tracker then predicts
+        # where objects moved to in the frames skipped.
+        self.detect_every = detect_every
+
+        # See experiment/tracker/engines.py for available engines
+        self.tracker_engine = tracker_engine
+        self.lost_gate = lost_gate
+        self.match_gate = match_gate
+        self.tracker = self.new_tracker()
+        # Points of the previous frame detection ran on, by id
+        self.last_points = {}
+        # Background subtraction and blob detection can run on a grayscale image downscaled by 2 or 4, with area
+        # thresholds scaled to match, see experiment/pyramid.py. Refining redraws every box from the full resolution
+        # frame.
+        if downscale not in downscale_factors:
+            raise ValueError("Unknown downscale factor '" + str(downscale) + "', choose from " +
+                             ", ".join(str(factor) for factor in downscale_factors))
+        self.downscale = downscale
+        self.pyramid_levels = int(math.log2(downscale))
+        self.refine = refine
+
+        # See experiment/background.py for available background models. The median model can be given a sample of
+        # frames from across the video to build its background from.
+        self.background = background
+        self.background_sample = background_sample
+        # gray value difference of foreground pixels for the median model, None uses its default
+        self.background_threshold = background_threshold
+        if background_sample is not None and downscale > 1:
+            self.background_sample = [shrink(frame, self.pyramid_levels) for frame in background_sample]
+
+        # Finds blobs in the foreground mask with an area in pixels between min_area and max_area, see
+        # experiment/detector.py for available backends
+        self.blob_detector = make_detector(detector_backend, min_area=scale_area(min_area, downscale),
+                                           max_area=scale_area(max_area, downscale))
+
+        # With more than one band, frames are split into horizontal bands processed in parallel, each with its own
+        # background model, see experiment/bands.py
+        self.bands = bands
+        if bands > 1:
+            self.detector = BandedDetector(bands, max(band_overlap // downscale, 1), self.make_background_model,
+                                           self.blob_detector)
+        else:
+            self.detector = self.make_background_model()  # Removed history=100, varThreshold=10
 
         self.i = 0
+        # Background image to seed the background model with before the next frame, set by seek
+        self.seed_background = None
+
+    def new_tracker(self, first_id=0):
+        """
+        :param first_id: int lowest id the tracker hands out
+        :return: tracker without any tracks
+        """
+        return make_tracker(self.tracker_engine, self.pop_num, self.SkipFrames, motion=self.detect_every > 1,
+                            lost_gate=self.lost_gate, match_gate=self.match_gate, first_id=first_id)
+
+    def make_background_model(self, top=None, bottom=None):
+        """
+        :param top: int first row of the part of the frame the model is for, None for the whole frame
+        :param bottom: int row after the last row of the part of the frame the model is for
+        :return: background model
+        """
+        if self.background != "median":
+            return make_background(self.background)
+        kwargs = {}
+        if self.background_sample is not None:
+            kwargs["sample"] = [frame[top:bottom] for frame in self.background_sample]
+        if self.background_threshold is not None:
+            kwargs["threshold"] = self.background_threshold
+        return make_background(self.background, **kwargs)
+
+    def get_state(self):
+        """
+        :return: tuple (dictionary of frame count and tracker state, background image or None), for checkpoints
+        """
+        state = {"i": self.i, "last_points": list(self.last_points.values()), "tracker": self.tracker.get_state()}
+        return state, self.detector.getBackgroundImage()
+
+    def set_state(self, state, background_image):
+        """
+        Continue analysis from a state returned by get_state
+        :param state: dictionary of frame count and tracker state
+        :param background_image: background image, None to start learning the background again
+        :return: None
+        """
+        self.i = state["i"]
+        self.last_points = {p[4]: p for p in state["last_points"]}
+        self.tracker.set_state(state["tracker"])
+        if background_image is not None:
+            restore_background(self.detector, background_image)
+
+    def shutdown(self):
+        """
+        Stop the worker threads of banded detection, call when the analysis is not used anymore
+        :return: None
+        """
+        if self.bands > 1:
+            self.detector.shutdown()
+
+    def seek(self, frame_index, background_image=None):
+        """
+        Continue analysis at another frame of the video. Tracks are dropped, objects get new ids from there on, above
+        all ids handed out before so they are not confused with the objects tracked before the jump.
+        :param frame_index: int index of the next frame to be analysed, counting from 0
+        :param background_image: background image at frame_index, e.g. from experiment/background_cache.py, None keeps
+        the current background model
+        :return: None
+        """
+        self.i = frame_index
+        self.last_points = {}
+        self.tracker = self.new_tracker(self.tracker.id_allocator.next_id)
+        self.seed_background = background_image
 
     def update(self, frame):
+        """
+        Detect and track objects in the next frame of a video. The frame is not modified.
+        :param frame: image
+        :return: TrackingResult
+        """
 
         self.i += 1
 
+        # Skipped frames are filled in when the next detection is done
+        if (self.i - 1) % self.detect_every != 0:
+            return TrackingResult(self.i)
+
         # Object detection
-        mask = self.detector.apply(frame)
+        if self.downscale > 1:
+            boxes = self.detect_downscaled(frame)
+        else:
+            boxes = self.detect_blobs(frame)
+        self.detectionArray = boxes.tolist()
+
+        # Object tracking
+        if self.i == 1:
+            return TrackingResult(self.i)
+        boxes_ids = np.array(self.tracker.update(self.detectionArray, dt=self.detect_every), dtype=np.int64)
+        boxes_ids = boxes_ids.reshape(-1, 5)
+        result = TrackingResult(self.i, boxes_ids[:, 0:4], boxes_ids[:, 4])
+        if self.detect_every > 1:
+            result.filled = self.interpolate(result.current_points())
+        return result
+
+    def detect_blobs(self, image):
+        """
+        :param image: image to run background subtraction on
+        :return: (n, 4) int array of [x, y, w, h] boxes
+        """
+        if self.seed_background is not None:
+            restore_background(self.detector, fit_image(self.seed_background, image))
+            self.seed_background = None
+        if self.bands > 1:
+            return self.detector.detect(image)
+        mask = self.detector.apply(image)
         # mask = cv2.adaptiveThreshold(mask, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,\
         # cv2.THRESH_BINARY, 11, 22)
-        contours, hierarchy = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
-        self.detectionArray.clear()
-        for cnt in contours:
-            # Calculate area of pixels then remove small elements.
-            area = cv2.contourArea(cnt)
-            if area > 30 and area < 200:
-                cv2.drawContours(frame, [cnt], -1, (0, 255, 0))
-                x, y, w, h = cv2.boundingRect(cnt)
-                self.detectionArray.append([x, y, w, h])
-
-        points = []
-        # Removing previous points
-        points.clear()
-        # Object tracking
-        if self.i > 1:
-            boxes_ids = self.tracker.update(self.detectionArray)
-            for box_id in boxes_ids:
-                x, y, w, h, id = box_id
-                cv2.putText(frame, str(id), (x, y - 15), cv2.FONT_HERSHEY_PLAIN, 1, (255, 0, 0), 2)
-                # cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 3)
-                xm = int(x + w / 2)
-                ym = int(y + h / 2)
-                cv2.circle(frame, (xm, ym), 15, (0, 255, 0), 2)
-                points.append([xm, ym, w, h, id, self.i])
-
-        return points, frame
+        boxes, _ = self.blob_detector.detect(mask)
+        return boxes
+
+    def detect_downscaled(self, frame):
+        """
+        :param frame: full resolution image
+        :return: (n, 4) int array of [x, y, w, h] boxes at full resolution
+        """
+        boxes = self.detect_blobs(shrink(frame, self.pyramid_levels))
+        boxes = scale_boxes(boxes, self.downscale, frame.shape)
+        if self.refine and len(boxes) > 0:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+            boxes = refine_boxes(gray, self.detector.getBackgroundImage(), boxes, self.downscale)
+        return boxes
+
+    def interpolate(self, points):
+        """
+        Fill in the frames skipped since the previous detection, for ids detected in both frames
+        :param points: list of [xm, ym, w, h, id, frame] detected in the current frame
+        :return: list of [xm, ym, w, h, id, frame] for the skipped frames, ordered by frame
+        """
+        previous = self.last_points
+        self.last_points = {p[4]: p for p in points}
+        both = [p for p in points if p[4] in previous]
+        if len(both) == 0:
+            return []
+
+        current = np.array(both, dtype=np.float64)
+        start = np.array([previous[p[4]] for p in both], dtype=np.float64)
+        # fraction of the way from the previous to the current detection, one row per skipped frame
+        t = (np.arange(1, self.detect_every) / self.detect_every)[:, None, None]
+        filled = np.rint(start[None, :, 0:4] + (current[None, :, 0:4] - start[None, :, 0:4]) * t).astype(np.int64)
+        ids = np.broadcast_to(current[None, :, 4:5], filled.shape[0:2] + (1,)).astype(np.int64)
+        frames = np.broadcast_to((self.i - self.detect_every + np.arange(1, self.detect_every))[:, None, None],
+                                 ids.shape)
+        return np.concatenate((filled, ids, frames), axis=2).reshape(-1, 6).tolist()
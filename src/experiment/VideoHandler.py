@@ -4,7 +4,22 @@ import time
 import cv2
 import os
 from experiment.DataCollect import *
-import json
+from experiment.overlay import draw_overlay, draw_roi_overlay
+from experiment.roi import load_rois, crop, MultiRoiCollect
+from experiment.autotune import load_detector_settings, tuned_settings
+from experiment.checkpoint import get_checkpoint_path, save_checkpoint, load_checkpoint, remove_checkpoint, \
+    file_sizes, truncate_files
+from experiment.background import sample_frames
+from experiment.AnalysisWorker import AnalysisWorker
+from experiment.track_store import TrackWriter, get_track_path
+from experiment.background_cache import get_background_cache_path, build_background_cache, save_background_cache, \
+    load_background_cache
+from camera.recording_paths import get_proxy_path
+from camera.striped_video import open_video, get_master_path
+from camera.recording_info import load_recording_info
+from experiment.experiment import get_ex_dir, load_experiment_profile
+import re
+import threading
 
 
 class VideoHandler(QThread):
@@ -42,10 +57,13 @@ class VideoHandler(QThread):
 
         self.video_name = None
         self.current_video = None
+        self.master_video = None
+        self.proxy_video = None
         self.current_frame = None
         self.video_frame_data = []
         self.nr_of_frames = -1
         self.fps = -1
+        self.frame_times = None
         self.video_path = video_path
         self.frame_display_width = frame_display_width
         self.frame_display_height = frame_display_height
@@ -58,10 +76,33 @@ class VideoHandler(QThread):
         self.video_paused = False
 
         self.data_collect = None
+        self.default_population_size = 15
+        self.population_size = self.default_population_size
+        # ROIs of the experiment the video was recorded in, each analysed separately, see experiment/roi.py
+        self.rois = []
+        # Detection thresholds of the loaded video proposed by experiment/autotune.py, None to use the defaults
+        self.detector_settings = None
         self.analyze = False
-        self.analyze_json_info = "[xm, ym, w, h, id, frame]"
         self.analyze_in_progress = False
+        # open track stores of the analysis by path, see experiment/track_store.py
+        self.track_writers = {}
         self.frames_skip = 10
+        # Save a checkpoint to resume analysis from every this many analysed frames, 0 to never save one
+        self.checkpoint_every = 500
+        # Detect objects on every n-th frame only and interpolate in between, 1 analyses every frame
+        self.detect_every = 1
+        # Background model used for analysis, "mog2" or "median", see experiment/background.py
+        self.background_model = "mog2"
+        self.background_sample_size = 25
+        # Number of horizontal bands frames are split in to detect objects on several cores
+        self.analysis_bands = 1
+        # Background images per time window of the loaded video to start analysis at any frame, loaded or computed on
+        # a separate thread on the first jump, see experiment/background_cache.py
+        self.background_cache = None
+        self.background_cache_window = 1800
+        self.background_cache_thread = None
+        # Index of the frame last analysed, a jump away from the next frame moves the analysis to the new position
+        self.analysed_position = -1
 
     def run(self):
         """
@@ -74,7 +115,7 @@ class VideoHandler(QThread):
                     t = time.perf_counter()
                     self.skip_frame_forward()
                     self.signal_current_play_time.emit(
-                        {"label_val": int(self.current_playback_location / self.fps),
+                        {"label_val": int(self.frame_to_seconds(self.current_playback_location)),
                          "slider_val": self.current_playback_location})
 
                     # This sometimes causes bugs that halts playback if camera is not connected, consider removing.
@@ -82,6 +123,7 @@ class VideoHandler(QThread):
                 except Exception as e:
                     print("Error when playing video")
                     print(e)
+        self.close_track_writers()
 
     def set_playback_speed(self, multiplier):
         """
@@ -101,29 +143,314 @@ class VideoHandler(QThread):
 
     def get_current_frame(self):
         """
-        Get current frame displayed to user
+        Get current frame displayed to user. When playing back from a proxy recording, the frame at the same position is
+        read from the master recording, so exported frames are always full resolution.
         :return: Integer indicating current frame
         """
+        if self.current_video is not None and self.current_video is not self.master_video:
+            position = max(self.current_video.get(cv2.CAP_PROP_POS_FRAMES) - 1, 0)
+            self.master_video.set(cv2.CAP_PROP_POS_FRAMES, position)
+            r, frame = self.master_video.read()
+            if r:
+                return frame
         return self.current_frame
 
+    def select_playback_source(self):
+        """
+        Play back from the proxy recording if there is one and no analysis is performed, from the master recording
+        otherwise. The newly selected recording is moved to the position of the previous one.
+        :return: None
+        """
+        if self.master_video is None:
+            return
+        if self.analyze or self.proxy_video is None:
+            source = self.master_video
+        else:
+            source = self.proxy_video
+        if source is not self.current_video:
+            source.set(cv2.CAP_PROP_POS_FRAMES, self.current_video.get(cv2.CAP_PROP_POS_FRAMES))
+            self.current_video = source
+
+    def frame_to_seconds(self, frame_index):
+        """
+        Convert a frame index to its time in the video. Uses the capture timestamps from the recording info when
+        available, the frame rate otherwise.
+        :param frame_index: int index of frame
+        :return: float seconds since the first frame
+        """
+        if self.frame_times is not None and len(self.frame_times) > 0:
+            return self.frame_times[min(max(int(frame_index), 0), len(self.frame_times) - 1)]
+        return frame_index / self.fps
+
     def set_video(self, video_name):
         """
         Load a video from file and setup preparations for playback and tracking analysis
         :param video_name: String indicating name of video file to be loaded
         :return: None
         """
+        # an analysis of the previous video is interrupted and keeps its checkpoint
+        if self.isRunning():
+            self.is_alive = False
+            self.wait()
+        self.analyze_in_progress = False
         try:
-            self.data_collect = DataCollect(pop_num=15, skip_frames=self.frames_skip)
+            settings = self.get_experiment_settings(video_name)
+            self.population_size = self.get_population_size(settings)
             self.current_playback_location = 0
             self.load_video(video_name)
+            self.rois = load_rois(settings, (int(self.master_video.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                           int(self.master_video.get(cv2.CAP_PROP_FRAME_HEIGHT))))
+            self.reset_data_collect()
             self.signal_set_fps_in_dialog.emit(self.fps)
             self.set_frame(self.current_frame)
-            self.video_duration = int(self.nr_of_frames/self.fps)
+            self.video_duration = int(self.frame_to_seconds(self.nr_of_frames))
             self.signal_total_run_time.emit(self.video_duration)
         except Exception as e:
             print("An error occurred when trying to load video '" + video_name + "' for analysis")
             print(e)
 
+    def new_data_collect(self):
+        """
+        Set up tracking analysis for the loaded video with the current analysis settings
+        :return: DataCollect object, or MultiRoiCollect object when the experiment has ROIs
+        """
+        self.analysed_position = -1
+        sample = None
+        if self.background_model == "median" and self.master_video is not None:
+            sample = sample_frames(self.master_video, self.background_sample_size)
+        if len(self.rois) > 0:
+            return MultiRoiCollect(self.rois, lambda roi: self.make_data_collect(
+                roi["crowd_size"] if roi["crowd_size"] > 0 else self.population_size,
+                None if sample is None else [crop(frame, roi["rect"]) for frame in sample]))
+        return self.make_data_collect(self.population_size, sample)
+
+    def reset_data_collect(self):
+        """
+        Replace the analysis with a new one from the current analysis settings, stopping the threads of the old one
+        :return: None
+        """
+        if self.data_collect is not None:
+            self.data_collect.shutdown()
+        self.data_collect = self.new_data_collect()
+
+    def make_analysis_settings(self, population_size):
+        """
+        :param population_size: int expected number of objects
+        :return: dictionary of DataCollect keyword arguments with the current analysis settings, without detection
+        thresholds tuned for a video, see experiment/analysis.py
+        """
+        return {"pop_num": population_size, "skip_frames": self.frames_skip, "detect_every": self.detect_every,
+                "background": self.background_model, "bands": self.analysis_bands}
+
+    def get_analysis_settings(self):
+        """
+        :return: dictionary of DataCollect keyword arguments for analysing the loaded video with the current analysis
+        settings, see experiment/analysis.py
+        """
+        settings = self.make_analysis_settings(self.population_size)
+        settings.update(tuned_settings(self.detector_settings, settings))
+        return settings
+
+    def make_data_collect(self, population_size, sample):
+        """
+        :param population_size: int expected number of objects
+        :param sample: list of frames for the median background model, or None
+        :return: DataCollect object
+        """
+        settings = self.get_analysis_settings()
+        settings["pop_num"] = population_size
+        return DataCollect(background_sample=sample, **settings)
+
+    def get_experiment_settings(self, video_name):
+        """
+        Look up the settings of the experiment a video was recorded in. Videos are named after their experiment
+        profile, possibly followed by an index such as "(1)" when recorded more than once.
+        :param video_name: str name of video file
+        :return: dictionary of experiment settings, None if the experiment profile can not be found
+        """
+        name = re.sub(r"\(\d+\)$", "", os.path.splitext(get_master_path(video_name))[0])
+        if os.path.isfile(get_ex_dir() + name + ".json"):
+            profile = load_experiment_profile(name)
+            if profile is not None:
+                return profile["settings"]
+        return None
+
+    def get_population_size(self, settings):
+        """
+        :param settings: dictionary of experiment settings, or None
+        :return: int crowd size of the experiment, default_population_size if it is not set
+        """
+        if settings is not None and settings.get("crowd_size", 0) > 0:
+            return settings["crowd_size"]
+        return self.default_population_size
+
+    def get_track_paths(self):
+        """
+        :return: list of str paths of all track stores tracking data of the loaded video is written to
+        """
+        return [self.get_track_path(roi["name"]) for roi in self.rois] or [self.get_track_path()]
+
+    def get_analysis_outputs(self):
+        """
+        :return: dictionary of str path of the track store tracking data is written to by ROI name, None for a video
+        without ROIs
+        """
+        if len(self.rois) == 0:
+            return {None: self.get_track_path()}
+        return {roi["name"]: self.get_track_path(roi["name"]) for roi in self.rois}
+
+    def new_analysis_worker(self):
+        """
+        Set up analysis of the whole loaded video in the background, independent of playback. It writes the files
+        playback analysis writes, so playback analysis must be off while it runs. A playback analysis checkpoint of the
+        video is removed once the analysis has written its results.
+        :return: AnalysisWorker, None if no video is loaded or playback analysis is on
+        """
+        if self.video_name is None or self.analyze:
+            return None
+        self.close_track_writers()
+        settings = self.get_analysis_settings()
+        settings["background_sample_size"] = self.background_sample_size
+        return AnalysisWorker(os.path.abspath(self.video_path + self.video_name), settings,
+                              self.get_analysis_outputs(), self.rois, checkpoint_path=self.get_checkpoint_path())
+
+    def get_checkpoint_path(self):
+        """
+        :return: str path of the analysis checkpoint of the loaded video
+        """
+        return get_checkpoint_path(get_master_path(os.path.abspath(self.video_path + self.video_name)))
+
+    def start_analysis(self):
+        """
+        Continue analysis from the checkpoint of the loaded video if there is one, otherwise start over with empty
+        result files. A checkpoint is left by an analysis interrupted by closing the application or loading another
+        video, stop_video removes it.
+        :return: None
+        """
+        self.close_track_writers()
+        if not self.resume_analysis():
+            for name in self.get_track_paths():
+                self.track_writers[name] = TrackWriter(name)
+        self.analyze_in_progress = True
+
+    def save_analysis_checkpoint(self):
+        """
+        Save the state of the running analysis
+        :return: None
+        """
+        state, images = self.data_collect.get_state()
+        for writer in self.track_writers.values():
+            writer.flush()
+        if len(self.rois) == 0:
+            images = {"background": images}
+        save_checkpoint(self.get_checkpoint_path(),
+                        {"video_position": int(self.current_video.get(cv2.CAP_PROP_POS_FRAMES)),
+                         "rois": [roi["name"] for roi in self.rois], "collect": state,
+                         "result_sizes": file_sizes(self.get_track_paths())}, images)
+
+    def resume_analysis(self):
+        """
+        Restore analysis state and playback position from the checkpoint of the loaded video
+        :return: bool True if analysis was resumed
+        """
+        checkpoint = load_checkpoint(self.get_checkpoint_path())
+        if checkpoint is None:
+            return False
+        state, images = checkpoint
+        if state["rois"] != [roi["name"] for roi in self.rois]:
+            print("Analysis checkpoint does not match the ROIs of the video, starting over")
+            return False
+        try:
+            self.reset_data_collect()
+            if len(self.rois) == 0:
+                self.data_collect.set_state(state["collect"], images.get("background"))
+            else:
+                self.data_collect.set_state(state["collect"], images)
+            truncate_files(state["result_sizes"])
+        except Exception as e:
+            print("An error occurred when resuming analysis, starting over")
+            print(e)
+            self.reset_data_collect()
+            return False
+        self.current_playback_location = state["video_position"]
+        self.analysed_position = state["video_position"] - 1
+        self.current_video.set(cv2.CAP_PROP_POS_FRAMES, self.current_playback_location)
+        self.signal_current_play_time.emit({"label_val": int(self.frame_to_seconds(self.current_playback_location)),
+                                            "slider_val": self.current_playback_location})
+        print("Resuming analysis at frame " + str(self.current_playback_location))
+        return True
+
+    def finish_analysis(self):
+        """
+        Called when analysis reached the end of the video, a finished analysis does not need its checkpoint
+        :return: None
+        """
+        self.close_track_writers()
+        if self.analyze_in_progress:
+            remove_checkpoint(self.get_checkpoint_path())
+            self.analyze_in_progress = False
+
+    def get_background_cache(self):
+        """
+        Load the background cache of the loaded video. If there is none it is computed and saved on a separate thread,
+        computing it reads frames from across the whole video and would hold up playback.
+        :return: BackgroundCache, None until it is available
+        """
+        if self.background_cache is None and self.background_cache_thread is None:
+            video_path = os.path.abspath(self.video_path + self.video_name)
+            self.background_cache = load_background_cache(get_background_cache_path(get_master_path(video_path)),
+                                                          self.nr_of_frames)
+            if self.background_cache is None:
+                self.background_cache_thread = threading.Thread(target=self.compute_background_cache,
+                                                                args=(video_path,), daemon=True)
+                self.background_cache_thread.start()
+        return self.background_cache
+
+    def compute_background_cache(self, video_path):
+        """
+        Compute and save the background cache of a video, run by get_background_cache on a separate thread with its own
+        capture of the video
+        :param video_path: str path of the video
+        :return: None
+        """
+        print("Computing backgrounds of '" + os.path.basename(video_path) + "'")
+        video = open_video(video_path)
+        cache = build_background_cache(video, self.background_cache_window)
+        video.release()
+        if cache is not None:
+            save_background_cache(get_background_cache_path(get_master_path(video_path)), cache)
+        # another video may have been loaded meanwhile
+        if self.video_name is not None and video_path == os.path.abspath(self.video_path + self.video_name):
+            self.background_cache = cache
+            self.background_cache_thread = None
+
+    def follow_playback_position(self):
+        """
+        Analysis needs consecutive frames. When the frame just read does not follow the one analysed last, e.g. after
+        moving the slider, the analysis is moved to it and its background seeded from the background cache if it is
+        available. Results of the frame jumped to and later frames, written before a jump back, are removed.
+        :return: None
+        """
+        position = int(self.current_video.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+        if self.analysed_position >= 0 and position != self.analysed_position + 1:
+            cache = self.get_background_cache()
+            self.data_collect.seek(position, None if cache is None else cache.image_at(position))
+            for path in self.get_track_paths():
+                try:
+                    # rows count frames from 1
+                    self.get_track_writer(path).truncate(position + 1)
+                except (IOError, OSError, ValueError) as e:
+                    print("An error occurred when removing points data after frame " + str(position))
+                    print(e)
+        self.analysed_position = position
+
+    def get_track_path(self, roi_name=None):
+        """
+        :param roi_name: str name of ROI, None for a video without ROIs
+        :return: str path of the track store tracking data of the loaded video, or one ROI of it, is written to
+        """
+        return get_track_path(get_master_path(os.path.abspath(self.video_path + self.video_name)), roi_name)
+
     def set_analyze(self, a):
         """
         Set flag indicating if tracking analysis should be perform. True indicates it should.
@@ -132,23 +459,46 @@ class VideoHandler(QThread):
         """
         print(a)
         if self.data_collect is not None:
+            self.close_track_writers()
             self.analyze = a
-            self.data_collect = DataCollect(pop_num=15, skip_frames=self.frames_skip)
+            self.analyze_in_progress = False
+            self.reset_data_collect()
+            self.select_playback_source()
 
     def write_data(self, data, file_path):
         """
-        Write tracking data to file on the system.
+        Add tracking data to the track store at file_path, rows are buffered and written in chunks
         :param data: List of lists with tracking data, See DataCollect.py for more info
         :param file_path: str path to where file should be stored.
         :return: NOne
         """
         try:
-            with open(file_path, 'a') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-                # print("wrote " + str(data) + "to file")
+            self.get_track_writer(file_path).add(data)
+        except (IOError, OSError, ValueError) as e:
+            print("An error occurred when writing points data:")
+            print(e)
 
-        except IOError as e:
-            print("An error occurred when writing points data: \n" + e)
+    def get_track_writer(self, file_path):
+        """
+        :param file_path: str path of a track store
+        :return: TrackWriter appending to file_path, opened on first use
+        """
+        if file_path not in self.track_writers:
+            self.track_writers[file_path] = TrackWriter(file_path, append=True)
+        return self.track_writers[file_path]
+
+    def close_track_writers(self):
+        """
+        Write buffered tracking data and close the track stores of the analysis
+        :return: None
+        """
+        for writer in self.track_writers.values():
+            try:
+                writer.close()
+            except (IOError, OSError) as e:
+                print("An error occurred when writing points data:")
+                print(e)
+        self.track_writers = {}
 
     def set_frame(self, frame):
         """
@@ -161,9 +511,23 @@ class VideoHandler(QThread):
             bytes_per_line = ch * w
 
             if self.analyze:
-                points, frame = self.data_collect.update(frame)
+                self.follow_playback_position()
+            if self.analyze and len(self.rois) > 0:
+                results = self.data_collect.update(frame)
+                for roi in self.rois:
+                    points = results[roi["name"]].to_points()
+                    if len(points) != 0:
+                        self.write_data(points, self.get_track_path(roi["name"]))
+                frame = draw_roi_overlay(frame, self.rois, results)
+            elif self.analyze:
+                result = self.data_collect.update(frame)
+                points = result.to_points()
                 if len(points) != 0:
-                    self.write_data(points, self.video_path + self.video_name[0:-4] + "_analysis.json")
+                    self.write_data(points, self.get_track_path())
+                frame = draw_overlay(frame, result)
+            if self.analyze and self.analyze_in_progress and self.checkpoint_every > 0 and \
+                    self.current_playback_location % self.checkpoint_every == 0:
+                self.save_analysis_checkpoint()
             qt_image = QImage(frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
 
             # scaled_image = qt_image.scaled(self.label_video_view.width(), self.label_video_view.height(), Qt.KeepAspectRatio)
@@ -177,11 +541,8 @@ class VideoHandler(QThread):
         :return: None
         """
         if self.current_video is not None and self.fps > 0:
-            if self.analyze:
-                name = self.video_path + self.video_name[0:-4] + "_analysis.json"
-                if os.path.isfile(name):
-                    os.remove(name)
-                    self.write_data(self.analyze_json_info, name)
+            if self.analyze and not self.analyze_in_progress:
+                self.start_analysis()
             self.video_playing = True
             self.video_paused = False
             if not self.isRunning():
@@ -200,14 +561,18 @@ class VideoHandler(QThread):
 
     def stop_video(self):
         """
-        Stop video playback and reset playback positions and data collecting
+        Stop video playback and reset playback positions and data collecting. Stopping a running analysis removes its
+        checkpoint, so the next play starts over instead of resuming it.
         :return:
         """
         if self.isRunning():
             self.is_alive = False
             self.wait()
+        self.close_track_writers()
+        if self.analyze_in_progress:
+            remove_checkpoint(self.get_checkpoint_path())
         self.analyze_in_progress = False
-        self.data_collect = DataCollect(pop_num=15, skip_frames=self.frames_skip)
+        self.reset_data_collect()
         self.video_playing = False
         self.video_paused = True
         self.current_playback_location = 0
@@ -241,11 +606,12 @@ class VideoHandler(QThread):
                 self.current_frame = frame
                 if not slider:
                     self.signal_current_play_time.emit(
-                        {"label_val": int(self.current_playback_location / self.fps),
+                        {"label_val": int(self.frame_to_seconds(self.current_playback_location)),
                          "slider_val": self.current_playback_location})
             else:
                 print("skipped ahead of end")
         else:
+            self.finish_analysis()
             self.pause_video()
 
     def skip_frame_backwards(self, slider=False, clicked=False, frames_to_skip=1):
@@ -273,7 +639,7 @@ class VideoHandler(QThread):
                 self.current_frame = frame
                 if not slider:
                     self.signal_current_play_time.emit(
-                        {"label_val": int(self.current_playback_location / self.fps),
+                        {"label_val": int(self.frame_to_seconds(self.current_playback_location)),
                         "slider_val": self.current_playback_location})
 
     def load_video(self, video_name):
@@ -282,15 +648,37 @@ class VideoHandler(QThread):
         :param video_name: N
         :return:
         """
-        if self.current_video is not None:
-            self.current_video.release()
+        self.close_track_writers()
+        if self.master_video is not None:
+            self.master_video.release()
+        if self.proxy_video is not None:
+            self.proxy_video.release()
+            self.proxy_video = None
         path = os.path.abspath(self.video_path + video_name)
         self.video_name = video_name
-        self.current_video = cv2.VideoCapture(path)
-        first_cap, first_frame = self.current_video.read()
+        self.master_video = open_video(path)
+        self.detector_settings = load_detector_settings(get_master_path(path))
+        self.background_cache = None
+        self.background_cache_thread = None
+        self.current_video = self.master_video
+
+        proxy_path = get_proxy_path(get_master_path(path))
+        if os.path.isfile(proxy_path):
+            self.proxy_video = cv2.VideoCapture(proxy_path)
+            if not self.proxy_video.isOpened():
+                self.proxy_video = None
+
+        first_cap, first_frame = self.master_video.read()
         if first_cap:
-            nr_of_frames = int(self.current_video.get(cv2.CAP_PROP_FRAME_COUNT))
+            nr_of_frames = int(self.master_video.get(cv2.CAP_PROP_FRAME_COUNT))
             self.current_frame = first_frame
             self.nr_of_frames = nr_of_frames
-            self.fps = self.current_video.get(cv2.CAP_PROP_FPS)
-            self.current_playback_location = self.current_video.get(cv2.CAP_PROP_POS_FRAMES)
+            self.fps = self.master_video.get(cv2.CAP_PROP_FPS)
+            self.frame_times = None
+            # the container holds the requested frame rate, prefer the rate measured while recording
+            info = load_recording_info(get_master_path(path))
+            if info is not None and info["measured_fps"] > 0:
+                self.fps = info["measured_fps"]
+                self.frame_times = info["frame_times"]
+            self.current_playback_location = self.master_video.get(cv2.CAP_PROP_POS_FRAMES)
+        self.select_playback_source()
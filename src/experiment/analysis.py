@@ -0,0 +1,270 @@
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+from camera.striped_capture import open_video, get_master_path
+from experiment.DataCollect import DataCollect
+from experiment.roi import crop, check_rois
+from experiment.background import sample_frames
+from experiment.background_cache import get_background_cache_path, load_background_cache
+
+"""
+Tracking analysis of a whole video without Qt or playback. A long video can be split into segments that are tracked in
+separate processes. Every segment starts some frames before the frames it owns, so its background model and tracker have
+settled by then, and objects it tracks at the end of that overlap are matched to the tracks of the previous segment by
+position.
+Matched tracks keep the id they had, unmatched tracks get new ids, giving one id space over the whole video.
+
+Analysis settings are a dictionary of DataCollect keyword arguments including pop_num and skip_frames, and optionally
+background_sample_size, the number of frames the median background model is built from. Results are
+dictionaries of rows [xm, ym, w, h, id, frame] by ROI name, None being the name of a video without ROIs, and are written
+to track stores, see experiment/track_store.py.
+"""
+
+# set in analysis processes by init_worker_process
+_worker_cancelled = None
+
+
+class AnalysisCancelled(Exception):
+    pass
+
+
+def make_collects(video, settings, rois=None):
+    """
+    :param video: cv2.VideoCapture or compatible object, to sample frames from for the median background model
+    :param settings: dictionary of DataCollect keyword arguments
+    :param rois: list of ROIs, see experiment/roi.py, None or empty to analyse whole frames
+    :return: dictionary of DataCollect by ROI name, None for whole frames
+    """
+    settings = dict(settings)
+    sample_size = settings.pop("background_sample_size", 25)
+    sample = None
+    if settings.get("background") == "median" and settings.get("background_sample") is None:
+        sample = sample_frames(video, sample_size)
+    if not rois:
+        if sample is not None:
+            settings["background_sample"] = sample
+        return {None: DataCollect(**settings)}
+    collects = {}
+    for roi in rois:
+        roi_settings = dict(settings)
+        if roi["crowd_size"] > 0:
+            roi_settings["pop_num"] = roi["crowd_size"]
+        if sample is not None:
+            roi_settings["background_sample"] = [crop(frame, roi["rect"]) for frame in sample]
+        collects[roi["name"]] = DataCollect(**roi_settings)
+    return collects
+
+
+def analyze_segment(video_path, start, stop, settings, rois=None, progress=None, cancelled=None):
+    """
+    Track objects in a range of frames of a video. Analysis starting after the first frame seeds its background from the
+    background cache of the video if there is one, see experiment/background_cache.py.
+    :param video_path: str path to video, or manifest of a striped recording
+    :param start: int index of first frame, counting from 0
+    :param stop: int index after the last frame, None for the end of the video. Videos whose container does not hold
+    the number of frames are read until they end.
+    :param settings: dictionary of DataCollect keyword arguments
+    :param rois: list of ROIs, None or empty to analyse whole frames
+    :param progress: callable called with the number of frames analysed so far every 100 frames, or None
+    :param cancelled: multiprocessing.Event or threading.Event checked every 100 frames, analysis raises
+    AnalysisCancelled once it is set, None to never cancel
+    :return: dictionary of lists of rows [xm, ym, w, h, id, frame] by ROI name
+    """
+    video = open_video(video_path)
+    frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    if frame_count > 0:
+        stop = frame_count if stop is None else min(stop, frame_count)
+    try:
+        check_rois(rois, (int(video.get(cv2.CAP_PROP_FRAME_WIDTH)), int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))))
+    except ValueError:
+        video.release()
+        raise
+    collects = make_collects(video, settings, rois)
+    rects = {roi["name"]: roi["rect"] for roi in rois or []}
+    if start > 0:
+        cache = load_background_cache(get_background_cache_path(get_master_path(video_path)), frame_count)
+        for name, collect in collects.items():
+            background = None if cache is None else cache.image_at(start)
+            if background is not None and name is not None:
+                background = crop(background, rects[name])
+            collect.seek(start, background)
+        video.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    rows = {name: [] for name in collects}
+    try:
+        index = start
+        while stop is None or index < stop:
+            r, frame = video.read()
+            if not r:
+                break
+            for name, collect in collects.items():
+                rows[name].extend(collect.update(frame if name is None else crop(frame, rects[name])).to_points())
+            if (index - start + 1) % 100 == 0:
+                if cancelled is not None and cancelled.is_set():
+                    raise AnalysisCancelled()
+                if progress is not None:
+                    progress(index - start + 1)
+            index = index + 1
+    finally:
+        video.release()
+        for collect in collects.values():
+            collect.shutdown()
+    return rows
+
+
+def split_segments(frame_count, segments, overlap):
+    """
+    :param frame_count: int number of frames of the video
+    :param segments: int number of segments
+    :param overlap: int number of frames a segment starts before the first frame it owns
+    :return: list of tuples (int first frame analysed, int first frame owned, int frame after the last frame owned)
+    """
+    edges = np.linspace(0, frame_count, max(segments, 1) + 1).astype(np.int64).tolist()
+    return [(max(start - overlap, 0), start, stop) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+
+def match_ids(rows_a, rows_b, gate):
+    """
+    Match the ids of two analyses of the same frames by the positions of their objects. Objects that are each other's
+    nearest within gate in a frame vote for their pair of ids, pairs are taken one to one with the most votes first.
+    :param rows_a: (n, 6) int array of rows [xm, ym, w, h, id, frame]
+    :param rows_b: (m, 6) int array of rows of the same frames
+    :param gate: float largest distance in pixels between matching objects
+    :return: dictionary of id in rows_a by id in rows_b
+    """
+    frames = np.intersect1d(rows_a[:, 5], rows_b[:, 5])
+    votes = collections.Counter()
+    for frame in frames.tolist():
+        a = rows_a[rows_a[:, 5] == frame]
+        b = rows_b[rows_b[:, 5] == frame]
+        distance = np.linalg.norm(b[:, None, 0:2] - a[None, :, 0:2], axis=2)
+        nearest_a = distance.argmin(axis=1)
+        nearest_b = distance.argmin(axis=0)
+        for j, k in enumerate(nearest_a.tolist()):
+            if nearest_b[k] == j and distance[j, k] <= gate:
+                votes[(int(a[k, 4]), int(b[j, 4]))] += 1
+
+    # pairs seen together in less than a quarter of the frames are too uncertain
+    mapping = {}
+    matched = set()
+    for (id_a, id_b), count in votes.most_common():
+        if 4 * count < len(frames):
+            break
+        if id_b not in mapping and id_a not in matched:
+            mapping[id_b] = id_a
+            matched.add(id_a)
+    return mapping
+
+
+def stitch(parts, segments, gate=10, match_frames=3):
+    """
+    Join the rows of consecutive segments into one id space. Every segment keeps the rows of the frames it owns, its ids
+    are matched to those of the previous segment in the last frames before the frames it owns. Trackers may hand ids
+    between objects passing close by, so only the frames right at the boundary are compared.
+    :param parts: list of lists of rows [xm, ym, w, h, id, frame], one per segment
+    :param segments: list of segments from split_segments
+    :param gate: float largest distance in pixels between matching objects
+    :param match_frames: int number of frames to match ids in
+    :return: list of rows, ordered by frame
+    """
+    stitched = []
+    previous = np.empty((0, 6), dtype=np.int64)
+    next_id = 0
+    for k, (part, (first, start, stop)) in enumerate(zip(parts, segments)):
+        rows = np.array(part, dtype=np.int64).reshape(-1, 6)
+        # frame numbers in rows count from 1
+        owned = rows[(rows[:, 5] > start) & (rows[:, 5] <= stop)]
+        compared = rows[(rows[:, 5] > max(start - match_frames, first)) & (rows[:, 5] <= start)]
+        if k == 0:
+            mapping = {track_id: track_id for track_id in owned[:, 4].tolist()}
+        elif len(previous) > 0 and len(compared) > 0:
+            mapping = match_ids(previous, compared, gate)
+        else:
+            mapping = {}
+        for track_id in np.unique(owned[:, 4]).tolist():
+            if track_id not in mapping:
+                mapping[track_id] = next_id
+                next_id = next_id + 1
+        if len(owned) > 0:
+            owned[:, 4] = [mapping[track_id] for track_id in owned[:, 4].tolist()]
+        next_id = max([next_id] + [track_id + 1 for track_id in mapping.values()])
+        stitched.extend(owned.tolist())
+        previous = owned
+    return stitched
+
+
+def init_worker_process(cancelled=None):
+    """
+    Initializer of analysis processes. Analyses already run in parallel, OpenCV threads in every process would only
+    compete for the same cores.
+    :param cancelled: multiprocessing.Event segments analysed in this process stop at once it is set, or None. Events
+    can only be handed to spawned processes when they start, not with every task.
+    :return: None
+    """
+    global _worker_cancelled
+    _worker_cancelled = cancelled
+    cv2.setNumThreads(1)
+
+
+def analyze_segment_in_worker(video_path, start, stop, settings, rois=None):
+    """
+    analyze_segment in an analysis process, cancelled with the event given to init_worker_process
+    :return: dictionary of lists of rows by ROI name, see analyze_segment
+    """
+    return analyze_segment(video_path, start, stop, settings, rois, cancelled=_worker_cancelled)
+
+
+def analyze_video(video_path, settings, rois=None, segments=1, overlap=150, workers=None, progress=None,
+                  cancelled=None):
+    """
+    Track objects in a whole video, in segments on a process pool if segments is more than 1 and the number of frames of
+    the video is known
+    :param video_path: str path to video, or manifest of a striped recording
+    :param settings: dictionary of DataCollect keyword arguments
+    :param rois: list of ROIs, see experiment/roi.py, None or empty to analyse whole frames
+    :param segments: int number of segments to split the video in
+    :param overlap: int number of frames every segment after the first starts before the frames it owns
+    :param workers: int number of processes, os.cpu_count() if None
+    :param progress: callable called with (int frames analysed, int number of frames) as analysis progresses, or None.
+    An exception raised by progress stops the analysis.
+    :param cancelled: multiprocessing.Event of the spawn context, analysis raises AnalysisCancelled within 100 frames of
+    every segment once it is set, None to never cancel
+    :return: dictionary of lists of rows [xm, ym, w, h, id, frame] by ROI name, None for a video without ROIs
+    """
+    video = open_video(video_path)
+    if not video.isOpened():
+        raise IOError("Could not open video '" + video_path + "'")
+    frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+
+    if segments > 1 and frame_count <= 0:
+        print("Number of frames of '" + video_path + "' is unknown, it can not be split into segments and is analysed "
+              "in one")
+        segments = 1
+    if segments <= 1:
+        return analyze_segment(video_path, 0, None, settings, rois,
+                               None if progress is None else lambda done: progress(done, frame_count), cancelled)
+
+    ranges = split_segments(frame_count, segments, overlap)
+    parts = [None] * len(ranges)
+    done = 0
+    # spawned rather than forked processes, forking a process running Qt or OpenCV threads is not safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_worker_process, initargs=(cancelled,)) as executor:
+        futures = {executor.submit(analyze_segment_in_worker, video_path, first, stop, settings, rois): k
+                   for k, (first, _, stop) in enumerate(ranges)}
+        try:
+            for future in as_completed(futures):
+                k = futures[future]
+                parts[k] = future.result()
+                done = done + ranges[k][2] - ranges[k][1]
+                if progress is not None:
+                    progress(done, frame_count)
+        except BaseException:
+            # do not wait for segments that have not started when analysis fails or is stopped
+            for future in futures:
+                future.cancel()
+            raise
+    return {name: stitch([part[name] for part in parts], ranges) for name in parts[0]}
@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from camera.striped_capture import open_video, get_master_path
+from experiment.background import percentile_image, make_background
+
+"""
+Automatic tuning of the detection thresholds of a video. Foreground masks are made the way the background model of the
+analysis makes them and the areas of all blobs are collected, measured as the detector backend of the analysis measures
+them. Noise gives many tiny blobs, the animals give a mode of larger blobs, the proposed area bounds are the valleys
+around that mode, widened to at least half to twice the mode. The result is saved in a sidecar next to the video and
+picked up by VideoHandler and experiment/batch.py when analysing it.
+
+median: a few hundred frames spread over the video are read in parallel, foreground is found against the median of
+those frames and the foreground threshold is tuned as well.
+mog2: MOG2 learns from consecutive frames, a few stretches spread over the video are each run through their own MOG2
+model in parallel and blobs are collected once the model has settled. MOG2 has no threshold to tune, only the area
+bounds are.
+
+The sidecar records the background model and detector backend the thresholds were found with, they are only applied to
+analyses with the same ones, see tuned_settings.
+
+Usage: python -m experiment.autotune video.avi [--background median] [--detector components]
+"""
+
+_detector_suffix = "_detector.json"
+_tuned_keys = ("min_area", "max_area", "background_threshold")
+
+
+def get_detector_settings_path(video_path):
+    """
+    :param video_path: str path of a recording, for striped recordings the path given by get_master_path
+    :return: str path of the detector settings sidecar of video_path
+    """
+    return video_path.rsplit('.', 1)[0] + _detector_suffix
+
+
+def save_detector_settings(video_path, settings):
+    """
+    :param video_path: str path of the recording
+    :param settings: dictionary of detector settings
+    :return: bool True on success
+    """
+    try:
+        with open(get_detector_settings_path(video_path), 'w') as f:
+            json.dump(settings, f, ensure_ascii=False, indent=4)
+        return True
+    except IOError as e:
+        print("An error occurred when writing detector settings:")
+        print(e)
+        return False
+
+
+def load_detector_settings(video_path):
+    """
+    :param video_path: str path of the recording
+    :return: dictionary of detector settings, None if the recording has not been tuned
+    """
+    path = get_detector_settings_path(video_path)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError) as e:
+        print("An error occurred when reading detector settings '" + path + "'")
+        print(e)
+        return None
+
+
+def tuned_settings(tuned, settings):
+    """
+    :param tuned: dictionary of detector settings from load_detector_settings, or None
+    :param settings: dictionary of DataCollect keyword arguments of an analysis
+    :return: dictionary of the tuned DataCollect keyword arguments that apply to the analysis, empty if the recording
+    was tuned for another background model or detector backend
+    """
+    if tuned is None:
+        return {}
+    if settings.get("background", "mog2") != tuned["background"] or \
+            settings.get("detector_backend", "contours") != tuned["detector_backend"]:
+        return {}
+    return {key: tuned[key] for key in _tuned_keys if key in tuned}
+
+
+def read_frames_at(video_path, indices):
+    """
+    :param video_path: str path to video
+    :param indices: sorted list of int frame indices
+    :return: list of grayscale frames, frames that can not be read are left out
+    """
+    video = open_video(video_path)
+    frames = []
+    for index in indices:
+        video.set(cv2.CAP_PROP_POS_FRAMES, index)
+        r, frame = video.read()
+        if r:
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    video.release()
+    return frames
+
+
+def sample_video(video_path, count, workers=4):
+    """
+    Read frames spread evenly over a video, every worker thread reads a consecutive part of them with its own capture
+    :param video_path: str path to video
+    :param count: int number of frames to read
+    :param workers: int number of worker threads
+    :return: list of grayscale frames
+    """
+    video = open_video(video_path)
+    nr_of_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    indices = np.unique(np.linspace(0, max(nr_of_frames - 1, 0), count).astype(np.int64)).tolist()
+    chunks = [c.tolist() for c in np.array_split(indices, workers) if len(c) > 0]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        parts = executor.map(lambda chunk: read_frames_at(video_path, chunk), chunks)
+    return [frame for part in parts for frame in part]
+
+
+def estimate_threshold(frames, background, minimum=10):
+    """
+    Gray value difference separating foreground from camera noise, from a robust estimate of the noise
+    :param frames: list of grayscale frames
+    :param background: grayscale background image
+    :param minimum: int smallest threshold to return
+    :return: int threshold
+    """
+    diff = np.concatenate([cv2.absdiff(frame, background)[::4, ::4].ravel() for frame in frames[0:20]])
+    median = float(np.median(diff))
+    mad = float(np.median(np.abs(diff - median)))
+    return int(max(round(median + 6 * 1.4826 * max(mad, 1)), minimum))
+
+
+def mask_areas(mask, detector_backend):
+    """
+    :param mask: uint8 foreground mask
+    :param detector_backend: str name of the detector backend whose area is measured, see experiment/detector.py
+    :return: float array of the area of every blob in mask
+    """
+    if detector_backend == "contours":
+        contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
+        return np.array([cv2.contourArea(cnt) for cnt in contours], dtype=np.float64)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    return stats[1:, cv2.CC_STAT_AREA].astype(np.float64)
+
+
+def blob_areas(frames, background, threshold, detector_backend="contours", workers=4):
+    """
+    :param frames: list of grayscale frames
+    :param background: grayscale background image
+    :param threshold: int smallest difference in gray value of a foreground pixel
+    :param detector_backend: str name of the detector backend whose area is measured, see experiment/detector.py
+    :param workers: int number of worker threads
+    :return: float array of the area of every blob in every frame
+    """
+    def areas(frame):
+        _, mask = cv2.threshold(cv2.absdiff(frame, background), threshold, 255, cv2.THRESH_BINARY)
+        return mask_areas(mask, detector_backend)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return np.concatenate([np.empty(0, dtype=np.float64)] + list(executor.map(areas, frames)))
+
+
+def mog2_areas(video_path, count, detector_backend="contours", warmup=100, workers=4):
+    """
+    Areas of the blobs in MOG2 masks, as the analysis makes them. Every worker thread runs its own MOG2 model over a
+    stretch of consecutive frames, the stretches are spread evenly over the video.
+    :param video_path: str path to video
+    :param count: int number of frames to collect blobs from, over all stretches
+    :param detector_backend: str name of the detector backend whose area is measured, see experiment/detector.py
+    :param warmup: int number of frames every model learns from before blobs are collected
+    :param workers: int number of stretches and worker threads
+    :return: tuple (float array of the area of every blob, int number of frames blobs were collected from)
+    """
+    video = open_video(video_path)
+    nr_of_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    length = warmup + max(count // workers, 1)
+    starts = np.unique(np.linspace(0, max(nr_of_frames - length, 0), workers).astype(np.int64)).tolist()
+
+    def stretch(start):
+        video = open_video(video_path)
+        video.set(cv2.CAP_PROP_POS_FRAMES, start)
+        model = make_background("mog2")
+        areas = []
+        for index in range(length):
+            r, frame = video.read()
+            if not r:
+                break
+            mask = model.apply(frame)
+            if index >= warmup:
+                areas.append(mask_areas(mask, detector_backend))
+        video.release()
+        return areas
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        masks = [areas for part in executor.map(stretch, starts) for areas in part]
+    return np.concatenate([np.empty(0, dtype=np.float64)] + masks), len(masks)
+
+
+def propose_area_bounds(areas, noise_area=3, bins=60):
+    """
+    Find the mode of blob areas belonging to the animals and the valleys on either side of it. The histogram is over
+    log area and weighted by area, so the many tiny noise blobs weigh little against the fewer, larger animals.
+    :param areas: array of blob areas
+    :param noise_area: int blobs smaller than this are ignored
+    :param bins: int number of histogram bins
+    :return: tuple (int min_area, int max_area, float mode area), None if there are too few blobs
+    """
+    areas = areas[areas >= noise_area].astype(np.float64)
+    if areas.size < 10:
+        return None
+    edges = np.linspace(np.log(noise_area), np.log(areas.max()) + 1e-6, bins + 1)
+    hist, _ = np.histogram(np.log(areas), bins=edges, weights=areas)
+    smooth = np.convolve(hist, np.array([1, 2, 3, 2, 1]) / 9, mode="same")
+    peak = int(np.argmax(smooth))
+
+    # walk down the slopes until the next valley, or until the histogram falls to a tenth of the peak
+    low = peak
+    while low > 0 and smooth[low - 1] <= smooth[low] and smooth[low - 1] > 0.1 * smooth[peak]:
+        low = low - 1
+    high = peak
+    while high < bins - 1 and smooth[high + 1] <= smooth[high] and smooth[high + 1] > 0.1 * smooth[peak]:
+        high = high + 1
+
+    # keep at least half to twice the mode for animals seen curled up or partly, at most a quarter to four times
+    mode = float(np.exp((edges[peak] + edges[peak + 1]) / 2))
+    min_area = max(min(np.exp(edges[low]), mode / 2), mode / 4, noise_area)
+    max_area = min(max(np.exp(edges[high + 1]), mode * 2), mode * 4)
+    return int(np.floor(min_area)), int(np.ceil(max_area)), mode
+
+
+def autotune(video_path, count=300, workers=4, detector_backend="contours", background="mog2"):
+    """
+    Propose detection settings for a video
+    :param video_path: str path to video, or manifest of a striped recording
+    :param count: int number of frames to sample
+    :param workers: int number of worker threads
+    :param detector_backend: str name of the detector backend of the analyses, see experiment/detector.py
+    :param background: str name of the background model of the analyses, "mog2" or "median"
+    :return: dictionary of detector settings, None if no animals could be found
+    """
+    if detector_backend not in ("contours", "components"):
+        raise ValueError("Unknown detector backend '" + str(detector_backend) + "', choose from contours, components")
+    if background not in ("mog2", "median"):
+        raise ValueError("Unknown background model '" + str(background) + "', choose from mog2, median")
+
+    settings = {}
+    if background == "median":
+        frames = sample_video(video_path, count, workers)
+        if len(frames) < 3:
+            print("Too few frames to tune detection of '" + video_path + "'")
+            return None
+        image = percentile_image(frames[::max(len(frames) // 25, 1)], 50)
+        settings["background_threshold"] = estimate_threshold(frames, image)
+        areas = blob_areas(frames, image, settings["background_threshold"], detector_backend, workers)
+        frames_sampled = len(frames)
+    else:
+        areas, frames_sampled = mog2_areas(video_path, count, detector_backend, workers=workers)
+    bounds = propose_area_bounds(areas)
+    if bounds is None:
+        print("No blobs found to tune detection of '" + video_path + "'")
+        return None
+    min_area, max_area, mode = bounds
+    return dict(settings, min_area=min_area, max_area=max_area, background=background,
+                detector_backend=detector_backend, mode_area=round(mode, 1), frames_sampled=frames_sampled)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Propose and save detection thresholds for a video")
+    parser.add_argument("video", help="path to video, or manifest of a striped recording")
+    parser.add_argument("--frames", type=int, default=300, help="number of frames to sample")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--detector", default="contours", choices=["contours", "components"],
+                        help="detector backend of the analyses the settings are for")
+    parser.add_argument("--background", default="mog2", choices=["mog2", "median"],
+                        help="background model of the analyses the settings are for")
+    parser.add_argument("--dry-run", action="store_true", help="only print the proposed settings")
+    args = parser.parse_args()
+
+    settings = autotune(args.video, args.frames, args.workers, args.detector, args.background)
+    if settings is None:
+        return
+    print(json.dumps(settings, indent=4))
+    if not args.dry_run and save_detector_settings(get_master_path(args.video), settings):
+        print("saved to " + get_detector_settings_path(get_master_path(args.video)) + ", used by analyses with the "
+              + args.background + " background and the " + args.detector + " detector")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import collections
+import cv2
+import numpy as np
+
+"""
+Background models producing a foreground mask per frame. Every model has the interface of an OpenCV background
+subtractor, apply(frame) returns a uint8 mask and getBackgroundImage() the current background, so they are
+interchangeable in DataCollect.
+
+mog2: cv2.createBackgroundSubtractorMOG2, an adaptive per-pixel Gaussian mixture
+median: a static per-pixel median of sampled frames, foreground is every pixel differing by more than a threshold
+"""
+
+
+def sample_frames(video, count):
+    """
+    Read frames spread evenly over a video, the read position of the video is restored afterwards
+    :param video: cv2.VideoCapture or compatible object
+    :param count: int number of frames to read
+    :return: list of frames
+    """
+    position = video.get(cv2.CAP_PROP_POS_FRAMES)
+    nr_of_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = []
+    for index in np.linspace(0, max(nr_of_frames - 1, 0), count).astype(np.int64).tolist():
+        video.set(cv2.CAP_PROP_POS_FRAMES, index)
+        r, frame = video.read()
+        if r:
+            frames.append(frame)
+    video.set(cv2.CAP_PROP_POS_FRAMES, position)
+    return frames
+
+
+def percentile_image(frames, percentile):
+    """
+    Per-pixel percentile over a list of images. The images are sorted pixel by pixel with an odd-even transposition
+    sorting network of whole-image minimum and maximum operations, which for a few dozen frames is several times faster
+    than np.partition along the stacking axis.
+    :param frames: list of images of equal size and type
+    :param percentile: float percentile to take, 50 is the median
+    :return: image
+    """
+    rows = list(frames)
+    n = len(rows)
+    for p in range(n):
+        for i in range(p % 2, n - 1, 2):
+            rows[i], rows[i + 1] = np.minimum(rows[i], rows[i + 1]), np.maximum(rows[i], rows[i + 1])
+    return rows[int(round(percentile / 100 * (n - 1)))]
+
+
+class MedianBackground:
+    def __init__(self, sample=None, percentile=50, threshold=30, history=25, refresh_every=0,
+                 illumination_change=15.0):
+        """
+        :param sample: list of frames to build the background from, e.g. from sample_frames. Without a sample the
+        background is built from the first frames applied.
+        :param percentile: float percentile of every pixel over the frames taken as background, 50 is the median
+        :param threshold: int smallest difference in gray value of a foreground pixel
+        :param history: int number of recent frames kept to rebuild the background from
+        :param refresh_every: int rebuild the background from recent frames every this many frames, 0 never does
+        :param illumination_change: float change in mean gray value of a frame from the background that triggers a
+        rebuild from the frames seen from then on
+        """
+        self.percentile = percentile
+        self.threshold = threshold
+        self.refresh_every = refresh_every
+        self.illumination_change = illumination_change
+        self.recent = collections.deque(maxlen=history)
+        # frames between two frames added to recent, so recent spans one refresh period
+        self.stride = max(refresh_every // history, 1)
+        self.background = None
+        self.background_mean = 0
+        self.frame_count = 0
+        # while bootstrapping the background is rebuilt whenever the number of recent frames doubles
+        self.bootstrapping = True
+        if sample is not None and len(sample) > 0:
+            self.build([self.to_gray(frame) for frame in sample])
+            self.bootstrapping = False
+
+    @staticmethod
+    def to_gray(frame):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+    def build(self, frames):
+        """
+        Set the background to the percentile of every pixel over frames
+        :param frames: list of grayscale frames of equal size
+        :return: None
+        """
+        self.background = percentile_image(list(frames), self.percentile)
+        self.background_mean = float(self.background.mean())
+
+    def apply(self, frame, learningRate=-1):
+        """
+        :param frame: image
+        :param learningRate: unused, accepted for compatibility with OpenCV background subtractors
+        :return: uint8 mask, 255 for foreground and 0 for background pixels
+        """
+        gray = self.to_gray(frame)
+        self.frame_count += 1
+
+        if self.background is None or self.background.shape != gray.shape or \
+                abs(float(gray.mean()) - self.background_mean) > self.illumination_change:
+            # start over, e.g. from the new lighting
+            self.recent.clear()
+            self.recent.append(gray)
+            self.build(self.recent)
+            self.bootstrapping = True
+        elif self.frame_count % self.stride == 0:
+            self.recent.append(gray)
+            if self.bootstrapping and (len(self.recent) & (len(self.recent) - 1) == 0 or
+                                       len(self.recent) == self.recent.maxlen):
+                self.build(self.recent)
+            elif self.refresh_every > 0 and self.frame_count % self.refresh_every == 0:
+                self.build(self.recent)
+            if len(self.recent) == self.recent.maxlen:
+                self.bootstrapping = False
+
+        _, mask = cv2.threshold(cv2.absdiff(gray, self.background), self.threshold, 255, cv2.THRESH_BINARY)
+        return mask
+
+    def getBackgroundImage(self):
+        """
+        :return: grayscale background image, None before the first frame
+        """
+        return self.background
+
+    def setBackgroundImage(self, image):
+        """
+        Continue from a background image, e.g. one saved in a checkpoint
+        :param image: grayscale background image
+        :return: None
+        """
+        self.background = self.to_gray(image)
+        self.background_mean = float(self.background.mean())
+        self.bootstrapping = False
+
+
+def restore_background(model, image):
+    """
+    Set the background of a model to an image returned by its getBackgroundImage. OpenCV subtractors can not be set
+    directly, they are made to learn the image with a learning rate of 1, which replaces what they learnt before.
+    :param model: background model
+    :param image: background image
+    :return: None
+    """
+    if hasattr(model, "setBackgroundImage"):
+        model.setBackgroundImage(image)
+    else:
+        model.apply(image, learningRate=1)
+
+
+def fit_image(image, like):
+    """
+    Convert an image to the size and number of channels of another, e.g. a cached full resolution color background
+    to the downscaled grayscale frames a model is applied to
+    :param image: BGR or grayscale image
+    :param like: image to match
+    :return: image with the shape of like
+    """
+    if image.ndim == 3 and like.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    elif image.ndim == 2 and like.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if image.shape[0:2] != like.shape[0:2]:
+        image = cv2.resize(image, (like.shape[1], like.shape[0]), interpolation=cv2.INTER_AREA)
+    return image
+
+
+background_models = {"mog2": cv2.createBackgroundSubtractorMOG2, "median": MedianBackground}
+
+
+def make_background(model, **kwargs):
+    """
+    Instantiate a background model by name
+    :param model: str name of model, a key of background_models
+    :param kwargs: further arguments to the model
+    :return: background model instance
+    """
+    if model not in background_models:
+        raise ValueError("Unknown background model '" + str(model) + "', choose from " + ", ".join(background_models))
+    return background_models[model](**kwargs)
@@ -0,0 +1,134 @@
+import argparse
+import os
+import cv2
+import numpy as np
+from camera.striped_capture import open_video, get_master_path
+from experiment.background import percentile_image
+
+"""
+Cached background images of a video, one per time window, so tracking can start at any frame. Background models learn
+the background from the frames before the one analysed, after a jump into the middle of a long recording they give
+mostly foreground for a while. The cache holds the median of frames sampled over every window of the video, computed
+once and stored next to the video, and DataCollect.seek seeds its background model with the image of the window a jump
+lands in.
+
+Usage: python -m experiment.background_cache video.avi
+"""
+
+_background_cache_suffix = "_backgrounds.npz"
+
+
+def get_background_cache_path(video_path):
+    """
+    :param video_path: str path of a recording, for striped recordings the path given by get_master_path
+    :return: str path of the background cache of video_path
+    """
+    return video_path.rsplit('.', 1)[0] + _background_cache_suffix
+
+
+class BackgroundCache:
+    def __init__(self, window, images, frame_count):
+        """
+        :param window: int number of frames per window
+        :param images: array of background images, one per window
+        :param frame_count: int number of frames of the video the cache was built from
+        """
+        self.window = window
+        self.images = images
+        self.frame_count = frame_count
+
+    def image_at(self, frame_index):
+        """
+        :param frame_index: int index of frame, counting from 0
+        :return: background image of the window frame_index is in
+        """
+        return self.images[min(max(frame_index // self.window, 0), len(self.images) - 1)]
+
+
+def build_background_cache(video, window=1800, samples=15, percentile=50):
+    """
+    Compute the background of every window of a video, the read position of the video is restored afterwards
+    :param video: cv2.VideoCapture or compatible object
+    :param window: int number of frames per window
+    :param samples: int number of frames per window to take the background from
+    :param percentile: float percentile of every pixel taken as background, 50 is the median
+    :return: BackgroundCache, None if no frames could be read
+    """
+    position = video.get(cv2.CAP_PROP_POS_FRAMES)
+    frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    images = []
+    for start in range(0, max(frame_count, 1), window):
+        stop = min(start + window, frame_count)
+        frames = []
+        for index in np.unique(np.linspace(start, max(stop - 1, start), samples).astype(np.int64)).tolist():
+            video.set(cv2.CAP_PROP_POS_FRAMES, index)
+            r, frame = video.read()
+            if r:
+                frames.append(frame)
+        if len(frames) > 0:
+            images.append(percentile_image(frames, percentile))
+        elif len(images) > 0:
+            images.append(images[-1])
+    video.set(cv2.CAP_PROP_POS_FRAMES, position)
+    if len(images) == 0:
+        return None
+    return BackgroundCache(window, np.stack(images), frame_count)
+
+
+def save_background_cache(path, cache):
+    """
+    :param path: str path of the cache file
+    :param cache: BackgroundCache
+    :return: bool True on success
+    """
+    tmp_path = path + ".tmp.npz"
+    try:
+        np.savez_compressed(tmp_path, window=cache.window, frame_count=cache.frame_count, images=cache.images)
+        os.replace(tmp_path, path)
+        return True
+    except (IOError, OSError) as e:
+        print("An error occurred when writing background cache:")
+        print(e)
+        return False
+
+
+def load_background_cache(path, frame_count=None):
+    """
+    :param path: str path of the cache file
+    :param frame_count: int number of frames of the video, a cache built from a different number of frames is stale
+    :return: BackgroundCache, None if there is no usable cache
+    """
+    if not os.path.isfile(path):
+        return None
+    try:
+        with np.load(path) as data:
+            cache = BackgroundCache(int(data["window"]), data["images"], int(data["frame_count"]))
+    except (IOError, OSError, KeyError, ValueError) as e:
+        print("An error occurred when reading background cache '" + path + "'")
+        print(e)
+        return None
+    if frame_count is not None and cache.frame_count != frame_count:
+        return None
+    return cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the background cache of a video for tracking from any frame")
+    parser.add_argument("video", help="path to video, or manifest of a striped recording")
+    parser.add_argument("--window", type=int, default=1800, help="number of frames per background image")
+    parser.add_argument("--samples", type=int, default=15, help="number of frames per window to take the median of")
+    args = parser.parse_args()
+
+    video = open_video(args.video)
+    cache = build_background_cache(video, args.window, args.samples)
+    video.release()
+    if cache is None:
+        print("No frames could be read from '" + args.video + "'")
+        return
+    path = get_background_cache_path(get_master_path(args.video))
+    if save_background_cache(path, cache):
+        print("saved " + str(len(cache.images)) + " backgrounds to " + path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from experiment.background import restore_background
+
+"""
+Detection split over horizontal bands of a frame, run in parallel on a thread pool. OpenCV releases the GIL, so
+background subtraction and blob extraction of the bands run on separate cores. Every band owns a range of rows and is
+processed with some overlap into its neighbours, a blob is kept by the band owning the row of its centroid only, so
+blobs crossing a seam are found once.
+"""
+
+
+class BandedDetector:
+    def __init__(self, nr_of_bands, overlap, make_model, blob_detector):
+        """
+        :param nr_of_bands: int number of horizontal bands
+        :param overlap: int number of rows a band reaches into each neighbour, at least half the height of an object
+        :param make_model: callable returning a new background model, one is made per band. Is called with the row
+        range (start, stop) of the band.
+        :param blob_detector: blob detector, see experiment/detector.py, shared by all bands
+        """
+        self.nr_of_bands = nr_of_bands
+        self.overlap = overlap
+        self.make_model = make_model
+        self.blob_detector = blob_detector
+        self.bands = None
+        self.models = None
+        self.height = None
+        self.executor = ThreadPoolExecutor(max_workers=nr_of_bands)
+
+    def setup(self, height):
+        """
+        Divide the rows of a frame over the bands and make a background model per band
+        :param height: int number of rows of a frame
+        :return: None
+        """
+        edges = np.linspace(0, height, self.nr_of_bands + 1).astype(np.int64).tolist()
+        # rows owned and rows processed by every band
+        self.bands = [(start, stop, max(start - self.overlap, 0), min(stop + self.overlap, height))
+                      for start, stop in zip(edges[:-1], edges[1:])]
+        self.models = [self.make_model(top, bottom) for _, _, top, bottom in self.bands]
+        self.height = height
+
+    def detect_band(self, index, image):
+        """
+        :param index: int index of band
+        :param image: whole frame
+        :return: (n, 4) int array of [x, y, w, h] in frame coordinates of the blobs owned by the band
+        """
+        start, stop, top, bottom = self.bands[index]
+        mask = self.models[index].apply(image[top:bottom])
+        boxes, centroids = self.blob_detector.detect(mask)
+        boxes[:, 1] += top
+        rows = centroids[:, 1] + top
+        return boxes[(rows >= start) & (rows < stop)]
+
+    def detect(self, image):
+        """
+        :param image: frame
+        :return: (n, 4) int array of [x, y, w, h] of blobs in the frame
+        """
+        if self.height != image.shape[0]:
+            self.setup(image.shape[0])
+        boxes = list(self.executor.map(lambda index: self.detect_band(index, image), range(self.nr_of_bands)))
+        return np.concatenate(boxes)
+
+    def getBackgroundImage(self):
+        """
+        :return: background image stitched from the rows owned by every band, None before the first frame
+        """
+        if self.models is None:
+            return None
+        parts = []
+        for (start, stop, top, _), model in zip(self.bands, self.models):
+            background = model.getBackgroundImage()
+            if background is None:
+                return None
+            parts.append(background[start - top:stop - top])
+        return np.concatenate(parts)
+
+    def setBackgroundImage(self, image):
+        """
+        Continue every band from its part of a stitched background image
+        :param image: background image of the whole frame, as returned by getBackgroundImage
+        :return: None
+        """
+        if self.height != image.shape[0]:
+            self.setup(image.shape[0])
+        for (_, _, top, bottom), model in zip(self.bands, self.models):
+            restore_background(model, image[top:bottom])
+
+    def shutdown(self):
+        """
+        Stop the worker threads
+        :return: None
+        """
+        self.executor.shutdown(wait=False)
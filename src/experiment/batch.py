@@ -0,0 +1,248 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from camera.recording_paths import is_recording_path, list_recordings
+from camera.striped_capture import get_master_path
+from experiment.analysis import analyze_video, init_worker_process
+from experiment.autotune import load_detector_settings, tuned_settings
+from experiment.checkpoint import get_checkpoint_path
+from experiment.pyramid import downscale_factors
+from experiment.roi import load_rois
+from experiment.track_store import get_track_path, write_tracks
+
+"""
+Headless batch analysis of many recordings, e.g. a night's worth on a server. Recordings are analysed one per process
+on a process pool, without Qt. Recordings with up to date results are skipped, so an interrupted batch can be run again.
+Detection thresholds saved by experiment/autotune.py are used for every recording they were tuned for, settings given on
+the command line or in a settings file take precedence.
+
+A settings file is a JSON object of DataCollect keyword arguments, optionally with "rois" as in the experiment settings,
+see experiment/roi.py, e.g. {"pop_num": 20, "background": "median", "rois": [{"name": "left", "rect": [0, 0, 640, 960]}]}
+
+Usage: python -m experiment.batch recordings/ "more/*.avi" --workers 4 --background median
+Exits with status 1 if any recording failed.
+
+Run in the background next to recording, e.g. by experiment/AnalysisQueue.py, --low-priority lowers the OS priority of
+the analysis and analysis waits while the file given with --pause-file exists.
+"""
+
+_below_normal_priority_class = 0x4000
+
+
+def lower_priority():
+    """
+    Lower the OS scheduling priority of this process, processes it starts inherit it
+    :return: None
+    """
+    try:
+        if os.name == "nt":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), _below_normal_priority_class)
+        else:
+            os.nice(10)
+    except (OSError, AttributeError) as e:
+        print("Could not lower process priority")
+        print(e)
+
+
+def wait_while_paused(pause_path, interval=1.0):
+    """
+    :param pause_path: str path of pause file, None to never pause
+    :param interval: float seconds between checks
+    :return: None, once pause_path does not exist
+    """
+    while pause_path is not None and os.path.exists(pause_path):
+        time.sleep(interval)
+
+
+def find_recordings(patterns):
+    """
+    :param patterns: list of str folders, paths or glob patterns
+    :return: list of str paths of recordings, in the order found and without duplicates
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found = [os.path.join(pattern, name) for name in list_recordings(pattern)]
+        else:
+            found = [path for path in sorted(glob.glob(pattern)) if is_recording_path(path)]
+        for path in found:
+            if os.path.abspath(path) not in [os.path.abspath(p) for p in paths]:
+                paths.append(path)
+    return paths
+
+
+def get_output_paths(video_path, rois):
+    """
+    :param video_path: str path of recording
+    :param rois: list of ROIs
+    :return: dictionary of str path of the track store of the results by ROI name, None for a recording without ROIs
+    """
+    master_path = get_master_path(video_path)
+    if len(rois) == 0:
+        return {None: get_track_path(master_path)}
+    return {roi["name"]: get_track_path(master_path, roi["name"]) for roi in rois}
+
+
+def is_analysed(video_path, rois):
+    """
+    :param video_path: str path of recording
+    :param rois: list of ROIs
+    :return: bool True if all results exist and are newer than the recording, and no analysis of it is unfinished
+    """
+    if os.path.isfile(get_checkpoint_path(get_master_path(video_path))):
+        return False
+    modified = os.path.getmtime(video_path)
+    return all(os.path.isfile(path) and os.path.getmtime(path) >= modified
+               for path in get_output_paths(video_path, rois).values())
+
+
+def analyze_recording(video_path, settings, rois, pause_path=None):
+    """
+    Analyse a recording and write its results, runs in a worker process
+    :param video_path: str path of recording
+    :param settings: dictionary of DataCollect keyword arguments
+    :param rois: list of ROIs
+    :param pause_path: str path of a file analysis waits for to be removed, checked every 100 frames, or None
+    :return: tuple (int number of rows written, float seconds taken)
+    """
+    t = time.perf_counter()
+    settings = get_recording_settings(video_path, settings)
+    wait_while_paused(pause_path)
+    results = analyze_video(video_path, settings, rois, progress=lambda frames, total: wait_while_paused(pause_path))
+    return write_results(get_output_paths(video_path, rois), results), time.perf_counter() - t
+
+
+def get_recording_settings(video_path, settings):
+    """
+    :param video_path: str path of recording
+    :param settings: dictionary of DataCollect keyword arguments
+    :return: dictionary of settings, completed with the detection thresholds tuned for the recording
+    """
+    return dict(tuned_settings(load_detector_settings(get_master_path(video_path)), settings), **settings)
+
+
+def write_results(outputs, results):
+    """
+    :param outputs: dictionary of str path of results by ROI name, see get_output_paths
+    :param results: dictionary of lists of rows by ROI name, see analyze_video
+    :return: int number of rows written, raises IOError if results could not be written
+    """
+    rows = 0
+    for name, points in results.items():
+        # written under a temporary name first, an interrupted analysis must not leave results that look complete
+        tmp_path = outputs[name] + ".tmp"
+        if not write_tracks(tmp_path, points):
+            raise IOError("Could not write " + outputs[name])
+        os.replace(tmp_path, outputs[name])
+        rows = rows + len(points)
+    return rows
+
+
+def add_settings_arguments(parser):
+    """
+    Add the analysis settings options read by make_settings
+    :param parser: argparse.ArgumentParser
+    :return: None
+    """
+    parser.add_argument("--settings", help="JSON file with DataCollect keyword arguments and ROIs")
+    parser.add_argument("--pop-num", type=int, help="expected number of objects")
+    parser.add_argument("--skip-frames", type=int, help="number of frames a lost id is reserved")
+    parser.add_argument("--tracker", help="tracker engine, see experiment/tracker/engines.py")
+    parser.add_argument("--detector", help="blob detector backend, see experiment/detector.py")
+    parser.add_argument("--background", help="background model, see experiment/background.py")
+    parser.add_argument("--detect-every", type=int, help="detect objects on every n-th frame only")
+    parser.add_argument("--downscale", type=int, choices=downscale_factors,
+                        help="detect objects at 1/2 or 1/4 resolution")
+    parser.add_argument("--bands", type=int, help="number of horizontal bands detected in parallel")
+    parser.add_argument("--min-area", type=int, help="smallest object area in pixels")
+    parser.add_argument("--max-area", type=int, help="largest object area in pixels")
+    parser.add_argument("--threshold", type=int, help="foreground threshold of the median background model")
+
+
+def make_settings(args):
+    """
+    :param args: parsed command line arguments
+    :return: tuple (dictionary of DataCollect keyword arguments, list of ROIs)
+    """
+    settings = {"pop_num": 15, "skip_frames": 10}
+    rois = []
+    if args.settings is not None:
+        with open(args.settings, 'r') as f:
+            loaded = json.load(f)
+        rois = load_rois(loaded)
+        settings.update({key: value for key, value in loaded.items() if key != "rois"})
+    given = {"pop_num": args.pop_num, "skip_frames": args.skip_frames, "tracker_engine": args.tracker,
+             "detector_backend": args.detector, "background": args.background, "detect_every": args.detect_every,
+             "downscale": args.downscale, "bands": args.bands, "min_area": args.min_area, "max_area": args.max_area,
+             "background_threshold": args.threshold}
+    settings.update({key: value for key, value in given.items() if value is not None})
+    return settings, rois
+
+
+def report(index, count, path, result):
+    """
+    Print the outcome of analysing a recording
+    :param index: int number of recordings finished before this one
+    :param count: int number of recordings to analyse
+    :param path: str path of recording
+    :param result: callable returning the result of analyze_recording, raising its exception if it failed
+    :return: int 1 if analysis failed, 0 otherwise
+    """
+    try:
+        rows, seconds = result()
+        print("[%d/%d] %s: %d rows in %.1f s" % (index + 1, count, path, rows, seconds))
+        return 0
+    except Exception as e:
+        print("[%d/%d] %s: failed" % (index + 1, count, path))
+        print(e)
+        return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse recordings without the user interface")
+    parser.add_argument("recordings", nargs="+", help="folders, recordings or glob patterns of recordings")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, one per core by default")
+    parser.add_argument("--force", action="store_true", help="also analyse recordings that have results")
+    add_settings_arguments(parser)
+    parser.add_argument("--low-priority", action="store_true", help="run at a lower OS priority")
+    parser.add_argument("--pause-file", help="analysis waits while this file exists")
+    args = parser.parse_args()
+
+    if args.low_priority:
+        lower_priority()
+
+    settings, rois = make_settings(args)
+    recordings = find_recordings(args.recordings)
+    if len(recordings) == 0:
+        print("No recordings found")
+        return 1
+    todo = [path for path in recordings if args.force or not is_analysed(path, rois)]
+    print("%d recordings, %d already analysed" % (len(recordings), len(recordings) - len(todo)))
+
+    failed = 0
+    t = time.perf_counter()
+    if args.workers == 1:
+        # one recording at a time in this process, so stopping this process stops the analysis
+        for k, path in enumerate(todo):
+            failed = failed + report(k, len(todo), path, lambda: analyze_recording(path, settings, rois,
+                                                                                  args.pause_file))
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=init_worker_process) as executor:
+            futures = {executor.submit(analyze_recording, path, settings, rois, args.pause_file): path
+                       for path in todo}
+            for k, future in enumerate(as_completed(futures)):
+                failed = failed + report(k, len(todo), futures[future], future.result)
+    print("done in %.1f s, %d failed" % (time.perf_counter() - t, failed))
+    return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
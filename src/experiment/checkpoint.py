@@ -0,0 +1,90 @@
+import json
+import os
+import numpy as np
+
+"""
+Checkpoints of a tracking analysis, so an interrupted analysis of a long video can continue where it was. A checkpoint
+holds the position in the video, the DataCollect state (frame count and tracker state), background images to continue
+background subtraction from and the size of every results file at the time. Resuming truncates the results files to
+those sizes, dropping anything written after the checkpoint, and appends from there. Stopping the video discards the
+checkpoint, the next analysis then starts over.
+
+Checkpoints are a NumPy .npz file with the state as JSON and one array per background image, written to a temporary
+file first and then renamed, so a crash while saving leaves the previous checkpoint intact.
+"""
+
+_checkpoint_suffix = "_analysis_checkpoint.npz"
+
+
+def get_checkpoint_path(video_path):
+    """
+    :param video_path: str path of a recording
+    :return: str path of the analysis checkpoint of video_path
+    """
+    return video_path.rsplit('.', 1)[0] + _checkpoint_suffix
+
+
+def save_checkpoint(path, state, images):
+    """
+    :param path: str path of checkpoint
+    :param state: JSON serializable dictionary
+    :param images: dictionary of images by name, None values are left out
+    :return: bool True on success
+    """
+    tmp_path = path + ".tmp.npz"
+    try:
+        arrays = {"image_" + name: image for name, image in images.items() if image is not None}
+        np.savez(tmp_path, state=np.array(json.dumps(state)), **arrays)
+        os.replace(tmp_path, path)
+        return True
+    except (IOError, OSError, TypeError, ValueError) as e:
+        print("An error occurred when writing analysis checkpoint:")
+        print(e)
+        return False
+
+
+def load_checkpoint(path):
+    """
+    :param path: str path of checkpoint
+    :return: tuple (dictionary of state, dictionary of images by name), None if there is no usable checkpoint
+    """
+    if not os.path.isfile(path):
+        return None
+    try:
+        with np.load(path) as data:
+            state = json.loads(str(data["state"]))
+            images = {key[len("image_"):]: data[key] for key in data.files if key.startswith("image_")}
+        return state, images
+    except (IOError, OSError, KeyError, ValueError) as e:
+        print("An error occurred when reading analysis checkpoint '" + path + "'")
+        print(e)
+        return None
+
+
+def remove_checkpoint(path):
+    """
+    :param path: str path of checkpoint
+    :return: None
+    """
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+def file_sizes(paths):
+    """
+    :param paths: list of str paths
+    :return: dictionary of size in bytes by path, 0 for files that do not exist
+    """
+    return {path: os.path.getsize(path) if os.path.isfile(path) else 0 for path in paths}
+
+
+def truncate_files(sizes):
+    """
+    Cut files back to the sizes they had when a checkpoint was saved
+    :param sizes: dictionary of size in bytes by path
+    :return: None
+    """
+    for path, size in sizes.items():
+        if os.path.isfile(path) and os.path.getsize(path) > size:
+            with open(path, 'r+b') as f:
+                f.truncate(size)
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+
+"""
+Blob detectors turning a foreground mask into bounding boxes. Both detectors keep blobs with an area between min_area
+and max_area and share the same interface, detect(mask) returns an (n, 4) array of [x, y, w, h] boxes and an (n, 2)
+array of centroids.
+
+contours: cv2.findContours, area is the area enclosed by the outline of a blob
+components: cv2.connectedComponentsWithStats, area is the number of pixels of a blob, filtered in one NumPy expression
+"""
+
+
+class ContourDetector:
+    def __init__(self, min_area=30, max_area=200):
+        """
+        :param min_area: smallest area of a blob to keep, exclusive
+        :param max_area: largest area of a blob to keep, exclusive
+        """
+        self.min_area = min_area
+        self.max_area = max_area
+
+    def detect(self, mask):
+        """
+        :param mask: 2d uint8 foreground mask
+        :return: tuple ((n, 4) int array of [x, y, w, h], (n, 2) float array of centroids)
+        """
+        contours, hierarchy = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
+        boxes = []
+        for cnt in contours:
+            # Calculate area of pixels then remove small elements.
+            area = cv2.contourArea(cnt)
+            if self.min_area < area < self.max_area:
+                boxes.append(cv2.boundingRect(cnt))
+        boxes = np.array(boxes, dtype=np.int64).reshape(-1, 4)
+        return boxes, boxes[:, 0:2] + boxes[:, 2:4] / 2
+
+
+class ComponentsDetector:
+    def __init__(self, min_area=30, max_area=200, connectivity=8):
+        """
+        :param min_area: smallest number of pixels of a blob to keep, exclusive
+        :param max_area: largest number of pixels of a blob to keep, exclusive
+        :param connectivity: 4 or 8, neighbourhood of pixels belonging to the same blob
+        """
+        self.min_area = min_area
+        self.max_area = max_area
+        self.connectivity = connectivity
+
+    def detect(self, mask):
+        """
+        :param mask: 2d uint8 foreground mask
+        :return: tuple ((n, 4) int array of [x, y, w, h], (n, 2) float array of centroids)
+        """
+        # block based labelling, measured several times faster than the default algorithm on 8-connectivity
+        _, _, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(mask, self.connectivity, cv2.CV_32S,
+                                                                                cv2.CCL_BBDT)
+        # label 0 is the background
+        area = stats[1:, cv2.CC_STAT_AREA]
+        keep = np.flatnonzero((area > self.min_area) & (area < self.max_area)) + 1
+        return stats[keep, 0:4].astype(np.int64), centroids[keep]
+
+
+detector_backends = {"contours": ContourDetector, "components": ComponentsDetector}
+
+
+def make_detector(backend, **kwargs):
+    """
+    Instantiate a blob detector by name
+    :param backend: str name of backend, a key of detector_backends
+    :param kwargs: further arguments to the detector, such as min_area and max_area
+    :return: detector instance
+    """
+    if backend not in detector_backends:
+        raise ValueError("Unknown detector backend '" + str(backend) + "', choose from " + ", ".join(detector_backends))
+    return detector_backends[backend](**kwargs)
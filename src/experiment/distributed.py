@@ -0,0 +1,498 @@
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sys
+import time
+import cv2
+from camera.striped_capture import open_video, get_master_path
+from experiment.analysis import analyze_segment, split_segments, stitch
+from experiment.batch import add_settings_arguments, make_settings, get_recording_settings, get_output_paths, \
+    write_results, lower_priority, find_recordings
+from experiment.track_store import write_tracks, open_tracks, array_to_rows
+
+"""
+Distributed analysis over a shared directory, so idle machines can analyse recordings without any other service. A job
+directory holds one file per job, and any number of workers on any machine that can see the directory and the
+recordings take jobs from it:
+
+    jobs/<job id>.json      what to analyse, written by submit
+    claims/<job id>.<n>     lease of the n-th attempt at a job, holding the worker and when the lease expires
+    done/<job id>.json      written once the results of a job are in place
+    failed/<job id>.json    written when a job raised an error or a job it depends on failed, submit the recording
+                            again to retry it
+
+A worker claims a job by creating its claim file with O_EXCL, which only one worker can do, and renews the lease while
+working. A lease that has expired, e.g. because its worker crashed, is re-issued by creating the claim of the next
+attempt, again with O_EXCL, and a worker that finds the next attempt claimed stops working on the job. A job can
+therefore briefly run twice when a worker is stalled longer than its lease, which is harmless as results are replaced
+atomically.
+
+A recording is analysed as one job, or split into segment jobs that write their rows next to the recording as track
+stores and a stitch job that joins them once all segments are done, see experiment/analysis.py. A recording whose
+container does not hold its number of frames is analysed as one job. Results are written next to the recording like
+experiment/batch.py writes them.
+
+Job ids are the id of the recording, an id of the submission and the index of the segment. Submitting a recording again
+removes the jobs of its earlier submission with their claims, markers and segment rows, so it is analysed again with the
+new settings. A worker still running a removed job stops at its next lease renewal. Paths of recordings inside the job directory's tree are stored relative to it, so
+machines may mount a shared disk at different places.
+
+Usage:
+    python -m experiment.distributed submit /share/jobs /share/videos --segments 8 --pop-num 20
+    python -m experiment.distributed work /share/jobs --low-priority
+    python -m experiment.distributed status /share/jobs
+"""
+
+_part_suffix = "_part%03d"
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def write_json(path, data):
+    """
+    Write a JSON file under a temporary name first, so readers never see it half written
+    :param path: str path of file
+    :param data: JSON serializable object
+    :return: None
+    """
+    tmp_path = path + "." + str(os.getpid()) + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    """
+    :param path: str path of file
+    :return: JSON content of path, None if it does not exist or cannot be read
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def make_job_dirs(jobs_dir):
+    """
+    :param jobs_dir: str path of job directory
+    :return: None
+    """
+    for name in ("jobs", "claims", "done", "failed"):
+        os.makedirs(os.path.join(jobs_dir, name), exist_ok=True)
+
+
+def get_video_id(video_path):
+    """
+    :param video_path: str path of recording
+    :return: str name of the recording made unique by a hash of its absolute path
+    """
+    name = os.path.basename(video_path).rsplit('.', 1)[0]
+    return name + "-" + hashlib.sha1(os.path.abspath(video_path).encode("utf-8")).hexdigest()[:8]
+
+
+def get_part_path(video_path, submission, index, roi_name=None):
+    """
+    :param video_path: str path of recording
+    :param submission: str id of the submission of the recording
+    :param index: int index of segment
+    :param roi_name: str name of ROI, None for a recording without ROIs
+    :return: str path of the track store of the rows of one segment of the recording, kept until the segments are
+    stitched
+    """
+    path = get_master_path(video_path).rsplit('.', 1)[0] + "_" + submission + _part_suffix % index
+    return path + ("" if roi_name is None else "_" + roi_name) + ".part"
+
+
+def store_path(jobs_dir, path):
+    """
+    :param jobs_dir: str path of job directory
+    :param path: str path of a recording
+    :return: str path relative to jobs_dir, or absolute path if there is no relative path, e.g. on another drive
+    """
+    try:
+        return os.path.relpath(os.path.abspath(path), os.path.abspath(jobs_dir))
+    except ValueError:
+        return os.path.abspath(path)
+
+
+def resolve_path(jobs_dir, path):
+    """
+    :param jobs_dir: str path of job directory
+    :param path: str path as stored by store_path
+    :return: str path on this machine
+    """
+    return os.path.normpath(os.path.join(jobs_dir, path))
+
+
+def remove_submitted(jobs_dir, video_path):
+    """
+    Remove the jobs of earlier submissions of a recording, with their claims, markers and segment rows
+    :param jobs_dir: str path of job directory
+    :param video_path: str path of recording
+    :return: None
+    """
+    prefix = get_video_id(video_path) + "-"
+    for job_id in list_jobs(jobs_dir):
+        if not job_id.startswith(prefix):
+            continue
+        job = read_json(os.path.join(jobs_dir, "jobs", job_id + ".json"))
+        if job is None or resolve_path(jobs_dir, job["video"]) != resolve_path(jobs_dir, store_path(jobs_dir,
+                                                                                                    video_path)):
+            continue
+        if job["type"] == "stitch":
+            remove_parts(jobs_dir, job)
+        paths = [os.path.join(jobs_dir, name, job_id + ".json") for name in ("jobs", "done", "failed")]
+        paths.extend(os.path.join(jobs_dir, "claims", "%s.%d" % (job_id, attempt))
+                     for attempt in get_attempts(jobs_dir, job_id))
+        for path in paths:
+            if os.path.isfile(path):
+                os.remove(path)
+
+
+def submit(jobs_dir, video_path, settings, rois, segments=1, overlap=150):
+    """
+    Add the jobs analysing a recording to a job directory, replacing the jobs of earlier submissions of the recording
+    :param jobs_dir: str path of job directory
+    :param video_path: str path of recording
+    :param settings: dictionary of DataCollect keyword arguments
+    :param rois: list of ROIs, see experiment/roi.py
+    :param segments: int number of segment jobs to split the recording in
+    :param overlap: int number of frames every segment after the first starts before the frames it owns
+    :return: list of str ids of the jobs added
+    """
+    video = open_video(video_path)
+    if not video.isOpened():
+        raise IOError("Could not open video '" + video_path + "'")
+    frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+
+    make_job_dirs(jobs_dir)
+    remove_submitted(jobs_dir, video_path)
+    if frame_count > 0:
+        ranges = split_segments(frame_count, segments, overlap)
+    else:
+        if segments > 1:
+            print("Number of frames of '" + video_path + "' is unknown, it can not be split into segments and is "
+                  "analysed in one job")
+        # analysed until the video ends, see analyze_segment
+        ranges = [(0, 0, None)]
+    submission = "%08x" % (int(time.time() * 1000) % 16 ** 8)
+    job_id = get_video_id(video_path) + "-" + submission
+    job = {"video": store_path(jobs_dir, video_path), "settings": get_recording_settings(video_path, settings),
+           "rois": rois, "submission": submission}
+    jobs = []
+    for k, (first, start, stop) in enumerate(ranges):
+        jobs.append(dict(job, id="%s-%03d" % (job_id, k), type="segment", index=k, first=first, start=start,
+                         stop=stop, parts=len(ranges)))
+    if len(ranges) > 1:
+        jobs.append(dict(job, id=job_id + "-stitch", type="stitch", segments=ranges,
+                         depends=[segment["id"] for segment in jobs]))
+    for job in jobs:
+        write_json(os.path.join(jobs_dir, "jobs", job["id"] + ".json"), job)
+    return [job["id"] for job in jobs]
+
+
+def is_finished(jobs_dir, job_id):
+    """
+    :param jobs_dir: str path of job directory
+    :param job_id: str id of job
+    :return: bool True if the job is done or has failed
+    """
+    return os.path.isfile(os.path.join(jobs_dir, "done", job_id + ".json")) or \
+        os.path.isfile(os.path.join(jobs_dir, "failed", job_id + ".json"))
+
+
+def list_jobs(jobs_dir):
+    """
+    :param jobs_dir: str path of job directory
+    :return: list of str ids of all jobs, stitch jobs after the segments they depend on
+    """
+    return sorted(name[:-5] for name in os.listdir(os.path.join(jobs_dir, "jobs")) if name.endswith(".json"))
+
+
+def get_attempts(jobs_dir, job_id):
+    """
+    :param jobs_dir: str path of job directory
+    :param job_id: str id of job
+    :return: list of int attempts at the job that have been claimed
+    """
+    prefix = job_id + "."
+    return [int(name[len(prefix):]) for name in os.listdir(os.path.join(jobs_dir, "claims"))
+            if name.startswith(prefix) and name[len(prefix):].isdigit()]
+
+
+class Lease:
+    """
+    Claim of one attempt at a job, see the module description
+    """
+    def __init__(self, jobs_dir, job_id, attempt, worker, duration):
+        """
+        :param jobs_dir: str path of job directory
+        :param job_id: str id of job
+        :param attempt: int attempt claimed
+        :param worker: str name of the worker holding the lease
+        :param duration: float seconds the lease lasts without being renewed
+        """
+        self.jobs_dir = jobs_dir
+        self.job_id = job_id
+        self.attempt = attempt
+        self.worker = worker
+        self.duration = duration
+        self.renewed = 0
+
+    def get_path(self, attempt=None):
+        """
+        :param attempt: int attempt, the attempt of this lease if None
+        :return: str path of the claim file of attempt
+        """
+        return os.path.join(self.jobs_dir, "claims", "%s.%d" % (self.job_id, self.attempt if attempt is None
+                                                                 else attempt))
+
+    def claim(self):
+        """
+        :return: bool True if the claim was created, False if another worker holds it
+        """
+        try:
+            fd = os.open(self.get_path(), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"worker": self.worker, "expires": time.time() + self.duration}, f)
+        self.renewed = time.time()
+        return True
+
+    def renew(self):
+        """
+        Extend the lease, raises LeaseLost if the lease has expired and was re-issued, or the job was removed
+        :return: None
+        """
+        if os.path.exists(self.get_path(self.attempt + 1)):
+            raise LeaseLost("Lease of " + self.job_id + " was re-issued")
+        if not os.path.isfile(os.path.join(self.jobs_dir, "jobs", self.job_id + ".json")):
+            raise LeaseLost(self.job_id + " was removed")
+        write_json(self.get_path(), {"worker": self.worker, "expires": time.time() + self.duration})
+        self.renewed = time.time()
+
+    def renew_if_due(self):
+        """
+        Renew the lease once a third of it has passed
+        :return: None
+        """
+        if time.time() - self.renewed > self.duration / 3:
+            self.renew()
+
+    def is_expired(self):
+        """
+        :return: bool True if the claim of this attempt has expired, a claim that cannot be read expires a lease after
+        it was last changed
+        """
+        path = self.get_path()
+        claim = read_json(path)
+        try:
+            expires = claim["expires"] if claim is not None else os.path.getmtime(path) + self.duration
+        except OSError:
+            return False
+        return expires < time.time()
+
+
+def claim_job(jobs_dir, job_id, worker, lease):
+    """
+    :param jobs_dir: str path of job directory
+    :param job_id: str id of job
+    :param worker: str name of worker
+    :param lease: float seconds a lease lasts
+    :return: Lease on the job, None if it is held by another worker
+    """
+    attempts = get_attempts(jobs_dir, job_id)
+    if len(attempts) == 0:
+        attempt = 0
+    elif Lease(jobs_dir, job_id, max(attempts), worker, lease).is_expired():
+        attempt = max(attempts) + 1
+        print("Lease of " + job_id + " expired, re-issuing")
+    else:
+        return None
+    claim = Lease(jobs_dir, job_id, attempt, worker, lease)
+    return claim if claim.claim() else None
+
+
+def claim_next(jobs_dir, worker, lease):
+    """
+    :param jobs_dir: str path of job directory
+    :param worker: str name of worker
+    :param lease: float seconds a lease lasts
+    :return: tuple (job dictionary, Lease) of the first job that is ready and could be claimed, None if there is none
+    """
+    for job_id in list_jobs(jobs_dir):
+        if is_finished(jobs_dir, job_id):
+            continue
+        job = read_json(os.path.join(jobs_dir, "jobs", job_id + ".json"))
+        if job is None:
+            continue
+        depends_failed = [depend for depend in job.get("depends", [])
+                          if os.path.isfile(os.path.join(jobs_dir, "failed", depend + ".json"))]
+        if len(depends_failed) > 0:
+            # a job waiting for a failed job would never become ready
+            write_json(os.path.join(jobs_dir, "failed", job_id + ".json"),
+                       {"worker": worker, "message": "Depends on failed jobs " + ", ".join(depends_failed)})
+            continue
+        if not all(os.path.isfile(os.path.join(jobs_dir, "done", depend + ".json"))
+                   for depend in job.get("depends", [])):
+            continue
+        claim = claim_job(jobs_dir, job_id, worker, lease)
+        # the job may have been finished between the check above and the claim by a worker whose lease had expired
+        if claim is not None and not is_finished(jobs_dir, job_id):
+            return job, claim
+    return None
+
+
+def run_job(jobs_dir, job, claim):
+    """
+    Analyse a segment of a recording, or stitch the segments of a recording, and write the results next to it
+    :param jobs_dir: str path of job directory
+    :param job: job dictionary
+    :param claim: Lease held on the job
+    :return: int number of rows written
+    """
+    video_path = resolve_path(jobs_dir, job["video"])
+    rois = job["rois"]
+    if job["type"] == "segment":
+        rows = analyze_segment(video_path, job["first"], job["stop"], job["settings"], rois,
+                               lambda frames: claim.renew_if_due())
+        if job["parts"] == 1:
+            claim.renew()
+            return write_results(get_output_paths(video_path, rois), rows)
+        claim.renew()
+        for name, points in rows.items():
+            if not write_tracks(get_part_path(video_path, job["submission"], job["index"], name), points):
+                raise IOError("Could not write " + get_part_path(video_path, job["submission"], job["index"], name))
+        return sum(len(points) for points in rows.values())
+
+    results = {}
+    for name in get_output_paths(video_path, rois):
+        parts = [array_to_rows(open_tracks(get_part_path(video_path, job["submission"], k, name)))
+                 for k in range(len(job["segments"]))]
+        results[name] = stitch(parts, job["segments"])
+    claim.renew()
+    return write_results(get_output_paths(video_path, rois), results)
+
+
+def remove_parts(jobs_dir, job):
+    """
+    Remove the rows of the segments of a stitch job, once the job is done. Until then a worker taking over the job
+    after its lease expired needs them.
+    :param jobs_dir: str path of job directory
+    :param job: job dictionary of a stitch job
+    :return: None
+    """
+    video_path = resolve_path(jobs_dir, job["video"])
+    for name in get_output_paths(video_path, job["rois"]):
+        for k in range(len(job["segments"])):
+            if os.path.isfile(get_part_path(video_path, job["submission"], k, name)):
+                os.remove(get_part_path(video_path, job["submission"], k, name))
+
+
+def work(jobs_dir, worker=None, lease=300, poll_interval=10, exit_when_done=False):
+    """
+    Take jobs from a job directory until there are none left, or forever
+    :param jobs_dir: str path of job directory
+    :param worker: str name of worker, host name and process id if None
+    :param lease: float seconds a lease lasts, must be longer than analysing 100 frames takes
+    :param poll_interval: float seconds to wait when there is no job to take
+    :param exit_when_done: bool True to return once every job is done or failed
+    :return: int number of jobs that failed
+    """
+    worker = worker or socket.gethostname() + "-" + str(os.getpid())
+    make_job_dirs(jobs_dir)
+    failed = 0
+    while True:
+        claimed = claim_next(jobs_dir, worker, lease)
+        if claimed is None:
+            if exit_when_done and all(is_finished(jobs_dir, job_id) for job_id in list_jobs(jobs_dir)):
+                return failed
+            time.sleep(poll_interval)
+            continue
+        job, claim = claimed
+        t = time.perf_counter()
+        try:
+            rows = run_job(jobs_dir, job, claim)
+            write_json(os.path.join(jobs_dir, "done", job["id"] + ".json"),
+                       {"worker": worker, "rows": rows, "seconds": time.perf_counter() - t})
+            if job["type"] == "stitch":
+                remove_parts(jobs_dir, job)
+            print("%s: %s, %d rows in %.1f s" % (worker, job["id"], rows, time.perf_counter() - t))
+        except LeaseLost as e:
+            print(e)
+        except Exception as e:
+            # a worker whose lease had expired may have done the job meanwhile, e.g. removed the parts it was reading
+            if is_finished(jobs_dir, job["id"]):
+                print("%s: %s was finished by another worker" % (worker, job["id"]))
+                continue
+            failed = failed + 1
+            print("%s: %s failed" % (worker, job["id"]))
+            print(e)
+            write_json(os.path.join(jobs_dir, "failed", job["id"] + ".json"), {"worker": worker, "message": str(e)})
+
+
+def status(jobs_dir):
+    """
+    :param jobs_dir: str path of job directory
+    :return: dictionary of int number of jobs by state, "pending", "claimed", "expired", "done" or "failed"
+    """
+    counts = {"pending": 0, "claimed": 0, "expired": 0, "done": 0, "failed": 0}
+    for job_id in list_jobs(jobs_dir):
+        attempts = get_attempts(jobs_dir, job_id)
+        if os.path.isfile(os.path.join(jobs_dir, "done", job_id + ".json")):
+            counts["done"] += 1
+        elif os.path.isfile(os.path.join(jobs_dir, "failed", job_id + ".json")):
+            counts["failed"] += 1
+        elif len(attempts) == 0:
+            counts["pending"] += 1
+        elif Lease(jobs_dir, job_id, max(attempts), "", 0).is_expired():
+            counts["expired"] += 1
+        else:
+            counts["claimed"] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse recordings on several machines sharing a job directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    submit_parser = commands.add_parser("submit", help="add recordings to a job directory")
+    submit_parser.add_argument("jobs_dir", help="shared job directory")
+    submit_parser.add_argument("recordings", nargs="+", help="folders, recordings or glob patterns of recordings")
+    submit_parser.add_argument("--segments", type=int, default=1, help="number of jobs to split every recording in")
+    submit_parser.add_argument("--overlap", type=int, default=150, help="number of frames segments overlap")
+    add_settings_arguments(submit_parser)
+    work_parser = commands.add_parser("work", help="analyse jobs of a job directory")
+    work_parser.add_argument("jobs_dir", help="shared job directory")
+    work_parser.add_argument("--lease", type=float, default=300, help="seconds a claimed job is reserved for")
+    work_parser.add_argument("--poll", type=float, default=10, help="seconds between looking for jobs")
+    work_parser.add_argument("--exit-when-done", action="store_true", help="stop once every job is finished")
+    work_parser.add_argument("--low-priority", action="store_true", help="run at a lower OS priority")
+    status_parser = commands.add_parser("status", help="count jobs by state")
+    status_parser.add_argument("jobs_dir", help="shared job directory")
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        settings, rois = make_settings(args)
+        recordings = find_recordings(args.recordings)
+        for path in recordings:
+            print(path + ": " + str(len(submit(args.jobs_dir, path, settings, rois, args.segments, args.overlap))) +
+                  " jobs")
+        return 0 if len(recordings) > 0 else 1
+    if args.command == "work":
+        if args.low_priority:
+            lower_priority()
+        return 1 if work(args.jobs_dir, lease=args.lease, poll_interval=args.poll,
+                         exit_when_done=args.exit_when_done) > 0 else 0
+    print(", ".join("%d %s" % (count, state) for state, count in status(args.jobs_dir).items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -45,8 +45,12 @@ class ExperimentRunner(QObject):
         self.serial_interface = serial_interface
         self.resolution = resolution
         self.recording_experiment = recording_experiment
+        # path the experiment was recorded to, set once recording has stopped
+        self.recorded_path = None
         self.start_time = 0
         self.current_time = 0
+        self.first_stim_time = None
+        self.start_offset = None
         self.duration = duration
         self.timer = QTimer()
         self.timer.setTimerType(Qt.PreciseTimer)
@@ -113,7 +117,10 @@ class ExperimentRunner(QObject):
             return
 
         if len(self.stim_vals) > 0:
+            if self.recording_experiment and not self.camera.armed:
+                self.camera.arm_recording()
             self.start_time = time.perf_counter()
+            self.first_stim_time = None
             if self.recording_experiment:
                 self.camera.set_rec_mode()
             self.timer.start()
@@ -129,6 +136,8 @@ class ExperimentRunner(QObject):
         self.signal_updating.emit(True)
         if len(self.stim_vals) > 0 and not self.flag_done_plotting:
             stim_val = self.stim_vals.pop(0)
+            if self.first_stim_time is None:
+                self.first_stim_time = time.perf_counter()
             self.serial_interface.send_data(stim_val, "sl")
             if len(self.stim_vals) == 0:
                 self.flag_done_plotting = True
@@ -138,18 +147,35 @@ class ExperimentRunner(QObject):
         self.current_time = time.perf_counter() - self.start_time
         if self.abort_flag:
             self.timer.stop()
-            self.signal_experiment_in_progress.emit(False)
             if self.recording_experiment:
+                self.report_start_offset()
+                self.recorded_path = self.camera.out_path
                 self.camera.set_live_mode()
+            self.signal_experiment_in_progress.emit(False)
 
         elif self.current_time >= self.duration:
             self.timer.stop()
             if self.recording_experiment:
+                self.report_start_offset()
+                self.recorded_path = self.camera.out_path
                 self.camera.set_live_mode()
 
             self.signal_experiment_in_progress.emit(False)
             self.signal_experiment_done.emit(True)
 
+    def report_start_offset(self):
+        """
+        Compute how long after the first stimulus command the first frame was recorded. A negative offset means the
+        recording started before the stimulus.
+        :return: float offset in seconds, None if either event has not happened
+        """
+        if self.first_stim_time is None or self.camera.rec_start_time is None:
+            print("Could not measure recording start offset")
+            return None
+        self.start_offset = self.camera.rec_start_time - self.first_stim_time
+        print("recording started " + str(round(self.start_offset * 1000, 2)) + " ms after first stimulus command")
+        return self.start_offset
+
 
 def get_ex_dir():
     """
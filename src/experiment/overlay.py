@@ -0,0 +1,38 @@
+import cv2
+
+"""
+Drawing of tracking results for display. Analysis itself never draws, only frames shown to the user are annotated and
+always on a copy, so the analysed frame stays untouched.
+"""
+
+
+def draw_overlay(frame, result):
+    """
+    Draw the boxes, centers and ids of tracked objects
+    :param frame: image the result was computed from
+    :param result: TrackingResult of the frame, see DataCollect.py
+    :return: annotated copy of frame
+    """
+    frame = frame.copy()
+    for (x, y, w, h), (xm, ym), object_id in zip(result.boxes.tolist(), result.centers.tolist(), result.ids.tolist()):
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0))
+        cv2.putText(frame, str(object_id), (x, y - 15), cv2.FONT_HERSHEY_PLAIN, 1, (255, 0, 0), 2)
+        cv2.circle(frame, (xm, ym), 15, (0, 255, 0), 2)
+    return frame
+
+
+def draw_roi_overlay(frame, rois, results):
+    """
+    Draw the outline and name of every ROI and the tracked objects inside
+    :param frame: whole frame
+    :param rois: list of ROIs, see experiment/roi.py
+    :param results: dictionary of TrackingResult by ROI name, with coordinates relative to the ROI
+    :return: annotated copy of frame
+    """
+    frame = frame.copy()
+    for roi in rois:
+        x, y, w, h = roi["rect"]
+        frame[y:y + h, x:x + w] = draw_overlay(frame[y:y + h, x:x + w], results[roi["name"]])
+        cv2.rectangle(frame, (x, y), (x + w - 1, y + h - 1), (255, 255, 0))
+        cv2.putText(frame, roi["name"], (x + 4, y + 16), cv2.FONT_HERSHEY_PLAIN, 1, (255, 255, 0), 1)
+    return frame
@@ -0,0 +1,84 @@
+import math
+import cv2
+import numpy as np
+
+"""
+Helpers for running background subtraction and blob detection on a downscaled image. A frame is converted to grayscale
+and halved with cv2.pyrDown once per level, boxes found at the low resolution are mapped back to full resolution and
+can optionally be refined there against the background model.
+"""
+
+# factors a frame can be downscaled by, each level of the pyramid halves the resolution
+downscale_factors = (1, 2, 4)
+
+
+def shrink(frame, levels):
+    """
+    :param frame: BGR or grayscale image
+    :param levels: int number of times to halve the resolution
+    :return: grayscale image downscaled by 2 ** levels
+    """
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    for _ in range(levels):
+        frame = cv2.pyrDown(frame)
+    return frame
+
+
+def scale_area(area, factor):
+    """
+    Translate a blob area at full resolution to the area the same blob has after downscaling. Blobs are treated as
+    discs, and as pyrDown blurs before halving, the foreground of a blob spreads about one pixel beyond its scaled size.
+    :param area: float area in pixels at full resolution
+    :param factor: int downscale factor
+    :return: float area in pixels at low resolution
+    """
+    if factor == 1:
+        return area
+    return math.pi * (math.sqrt(area / math.pi) / factor + 1) ** 2
+
+
+def scale_boxes(boxes, factor, shape):
+    """
+    Map boxes found in a downscaled image back to full resolution
+    :param boxes: (n, 4) int array of [x, y, w, h] at low resolution
+    :param factor: int downscale factor
+    :param shape: shape of the full resolution frame
+    :return: (n, 4) int array of [x, y, w, h] at full resolution, clipped to the frame
+    """
+    boxes = boxes * factor
+    boxes[:, 0:2] = np.minimum(boxes[:, 0:2], [shape[1] - 1, shape[0] - 1])
+    boxes[:, 2:4] = np.minimum(boxes[:, 2:4], [shape[1], shape[0]] - boxes[:, 0:2])
+    return boxes
+
+
+def refine_boxes(gray, background, boxes, factor, threshold=30):
+    """
+    Tighten boxes mapped back from low resolution: inside every box, grown by one low resolution pixel, compare the
+    full resolution frame to the upscaled background and take the bounding box of the pixels that differ.
+    :param gray: full resolution grayscale frame
+    :param background: low resolution grayscale background image
+    :param boxes: (n, 4) int array of [x, y, w, h] at full resolution
+    :param factor: int downscale factor
+    :param threshold: int smallest difference in gray value of a foreground pixel
+    :return: (n, 4) int array of refined [x, y, w, h], boxes without any foreground pixel are kept as they are
+    """
+    height, width = gray.shape[0:2]
+    refined = boxes.copy()
+    for i, (x, y, w, h) in enumerate(boxes.tolist()):
+        # grow to whole low resolution pixels so the crop of the background lines up
+        x0 = max(x // factor - 1, 0) * factor
+        y0 = max(y // factor - 1, 0) * factor
+        x1 = min(-(-(x + w) // factor) + 1, background.shape[1]) * factor
+        y1 = min(-(-(y + h) // factor) + 1, background.shape[0]) * factor
+        x1, y1 = min(x1, width), min(y1, height)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        patch = background[y0 // factor:-(-y1 // factor), x0 // factor:-(-x1 // factor)]
+        patch = cv2.resize(patch, (-(-x1 // factor) * factor - x0, -(-y1 // factor) * factor - y0),
+                           interpolation=cv2.INTER_LINEAR)[0:y1 - y0, 0:x1 - x0]
+        foreground = cv2.absdiff(gray[y0:y1, x0:x1], patch) > threshold
+        if foreground.any():
+            bx, by, bw, bh = cv2.boundingRect(foreground.astype(np.uint8))
+            refined[i] = (x0 + bx, y0 + by, bw, bh)
+    return refined
@@ -0,0 +1,136 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Regions of interest, for recording several cuvettes side by side in one frame. ROIs are stored in the experiment
+settings under "rois" as a list of {"name": str, "rect": [x, y, w, h]}, optionally with a "crowd_size" per ROI. Every
+ROI is analysed as an independent experiment with its own background model, tracker and id space. ROI names are part
+of the names of result files, see safe_name.
+"""
+
+
+def safe_name(name):
+    """
+    :param name: str name of ROI as given in the experiment settings
+    :return: str name with every character other than letters, digits, '-' and '_' replaced by '_'
+    """
+    return re.sub(r"[^A-Za-z0-9_-]", "_", name)
+
+
+def fits(rect, frame_size):
+    """
+    :param rect: [x, y, w, h] of a ROI
+    :param frame_size: tuple (int width, int height) of the frames
+    :return: bool True if rect lies inside the frames
+    """
+    x, y, w, h = rect
+    return x + w <= frame_size[0] and y + h <= frame_size[1]
+
+
+def check_rois(rois, frame_size):
+    """
+    :param rois: list of ROIs, see load_rois
+    :param frame_size: tuple (int width, int height) of the frames
+    :return: None, raises ValueError if a ROI does not lie inside the frames
+    """
+    for roi in rois or []:
+        if not fits(roi["rect"], frame_size):
+            raise ValueError("ROI '" + roi["name"] + "' " + str(roi["rect"]) + " does not fit in frames of " +
+                             str(frame_size[0]) + "x" + str(frame_size[1]))
+
+
+def load_rois(settings, frame_size=None):
+    """
+    Read and check the ROIs of experiment settings, invalid ROIs are reported and left out. Names are made safe for
+    file names with safe_name.
+    :param settings: dictionary of experiment settings
+    :param frame_size: tuple (int width, int height) of the frames ROIs must lie inside, None to not check
+    :return: list of dictionaries {"name": str, "rect": [x, y, w, h], "crowd_size": int}, crowd_size 0 if not set
+    """
+    rois = []
+    names = set()
+    if settings is None:
+        return rois
+    for roi in settings.get("rois", []):
+        try:
+            name = safe_name(str(roi["name"]))
+            x, y, w, h = [int(v) for v in roi["rect"]]
+            if name == "" or name in names or w <= 0 or h <= 0 or x < 0 or y < 0:
+                raise ValueError("ROI names must be unique and rectangles non-empty")
+            if frame_size is not None and not fits([x, y, w, h], frame_size):
+                raise ValueError("ROI does not fit in frames of " + str(frame_size[0]) + "x" + str(frame_size[1]))
+            names.add(name)
+            rois.append({"name": name, "rect": [x, y, w, h], "crowd_size": int(roi.get("crowd_size", 0))})
+        except Exception as e:
+            print("Skipping invalid ROI " + str(roi))
+            print(e)
+    return rois
+
+
+def crop(frame, rect):
+    """
+    :param frame: image
+    :param rect: [x, y, w, h] of the ROI
+    :return: view of the part of frame inside rect, not a copy
+    """
+    x, y, w, h = rect
+    return frame[y:y + h, x:x + w]
+
+
+class MultiRoiCollect:
+    """
+    Runs one analysis per ROI on the matching part of every frame, the ROIs concurrently on a thread pool
+    """
+    def __init__(self, rois, make_collect, workers=None):
+        """
+        :param rois: list of ROIs, see load_rois
+        :param make_collect: callable returning a new DataCollect object for a ROI
+        :param workers: int number of worker threads, one per ROI if None
+        """
+        self.rois = rois
+        self.collects = {roi["name"]: make_collect(roi) for roi in rois}
+        self.executor = ThreadPoolExecutor(max_workers=workers or max(len(rois), 1))
+
+    def update(self, frame):
+        """
+        :param frame: whole frame
+        :return: dictionary of TrackingResult by ROI name, coordinates are relative to the ROI
+        """
+        results = self.executor.map(lambda roi: self.collects[roi["name"]].update(crop(frame, roi["rect"])),
+                                    self.rois)
+        return {roi["name"]: result for roi, result in zip(self.rois, results)}
+
+    def get_state(self):
+        """
+        :return: tuple (dictionary of state by ROI name, dictionary of background image by ROI name)
+        """
+        states = {name: collect.get_state() for name, collect in self.collects.items()}
+        return {name: s[0] for name, s in states.items()}, {name: s[1] for name, s in states.items()}
+
+    def set_state(self, state, background_images):
+        """
+        :param state: dictionary of state by ROI name
+        :param background_images: dictionary of background image by ROI name
+        :return: None
+        """
+        for name, collect in self.collects.items():
+            collect.set_state(state[name], background_images.get(name))
+
+    def seek(self, frame_index, background_image=None):
+        """
+        :param frame_index: int index of the next frame to be analysed, counting from 0
+        :param background_image: background image of the whole frame at frame_index, None keeps the current backgrounds
+        :return: None
+        """
+        for roi in self.rois:
+            self.collects[roi["name"]].seek(frame_index, None if background_image is None else
+                                            crop(background_image, roi["rect"]))
+
+    def shutdown(self):
+        """
+        Stop the worker threads, also those of the analysis of every ROI
+        :return: None
+        """
+        self.executor.shutdown(wait=False)
+        for collect in self.collects.values():
+            collect.shutdown()
@@ -0,0 +1,171 @@
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+import time
+from experiment.DataCollect import DataCollect
+from experiment.track_store import TrackWriter, get_track_path
+from camera.striped_capture import open_video, get_master_path
+
+"""
+Parameter sweep over DataCollect configurations in a single pass over a video. Every frame is decoded once and the same
+frame buffer is handed to a worker thread per configuration, the workers only read it. Each configuration writes its
+tracking data to its own track store, see experiment/track_store.py, and a summary table compares the configurations.
+
+Configurations are read from a JSON file holding a list of objects, each with a "name" and DataCollect keyword
+arguments, e.g. [{"name": "small", "min_area": 20, "max_area": 120}, {"name": "wide_gate", "match_gate": 45}].
+pop_num and skip_frames default to 15 and 10.
+
+Usage: python -m experiment.sweep video.avi configs.json --out sweep_results
+"""
+
+_end = object()
+
+
+class SweepWorker(threading.Thread):
+    """
+    Runs one configuration on the frames put in its queue and keeps statistics for the summary
+    """
+    def __init__(self, config, out_path, max_pending=64):
+        """
+        :param config: dictionary with "name" and DataCollect keyword arguments
+        :param out_path: str path of the track store to write tracking data to
+        :param max_pending: int number of frames the worker may fall behind the decoder
+        """
+        super().__init__()
+        self.name = config["name"]
+        kwargs = {k: v for k, v in config.items() if k != "name"}
+        kwargs.setdefault("pop_num", 15)
+        kwargs.setdefault("skip_frames", 10)
+        self.data_collect = DataCollect(**kwargs)
+        self.out_path = out_path
+        self.frames = queue.Queue(maxsize=max_pending)
+        self.error = None
+
+        self.frames_detected = 0
+        self.detections = 0
+        self.track_ids = set()
+        self.id_churn = 0
+        self.elapsed = 0
+
+    def run(self):
+        previous_ids = None
+        try:
+            with TrackWriter(self.out_path) as writer:
+                while True:
+                    frame = self.frames.get()
+                    if frame is _end:
+                        break
+                    t = time.perf_counter()
+                    result = self.data_collect.update(frame)
+                    self.elapsed = self.elapsed + time.perf_counter() - t
+                    writer.add(result.to_points())
+
+                    # statistics over frames detection ran on, the first frame only initialises the background
+                    if result.frame_index == 1 or (result.frame_index - 1) % self.data_collect.detect_every != 0:
+                        continue
+                    ids = set(result.ids.tolist())
+                    self.frames_detected = self.frames_detected + 1
+                    self.detections = self.detections + len(ids)
+                    self.track_ids.update(ids)
+                    if previous_ids is not None:
+                        self.id_churn = self.id_churn + len(ids - previous_ids)
+                    previous_ids = ids
+        except Exception as e:
+            print("Error in sweep configuration '" + self.name + "'")
+            print(e)
+            self.error = e
+            # keep draining so the decoder does not block on a full queue
+            while self.frames.get() is not _end:
+                pass
+
+    def summary(self):
+        """
+        :return: dictionary of statistics of the configuration
+        """
+        frames = max(self.frames_detected, 1)
+        return {"name": self.name, "frames": self.frames_detected,
+                "detections_per_frame": round(self.detections / frames, 3), "tracks": len(self.track_ids),
+                "id_churn_per_100_frames": round(100 * self.id_churn / frames, 3),
+                "ms_per_frame": round(1000 * self.elapsed / max(self.data_collect.i, 1), 3),
+                "error": "" if self.error is None else str(self.error)}
+
+
+def load_configs(path):
+    """
+    :param path: str path to JSON file with a list of configurations
+    :return: list of dictionaries
+    """
+    with open(path, 'r') as f:
+        configs = json.load(f)
+    names = [c["name"] for c in configs]
+    if len(set(names)) != len(names):
+        raise ValueError("Configuration names must be unique")
+    return configs
+
+
+def run_sweep(video_path, configs, out_dir, max_frames=None):
+    """
+    Analyse a video with every configuration in a single decoding pass
+    :param video_path: str path to video, or manifest of a striped recording
+    :param configs: list of dictionaries with "name" and DataCollect keyword arguments
+    :param out_dir: str directory to write results and summary to
+    :param max_frames: int stop after this many frames, None for the whole video
+    :return: list of summary dictionaries, one per configuration
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    master_path = os.path.join(out_dir, os.path.basename(get_master_path(video_path)))
+    base = os.path.splitext(os.path.basename(master_path))[0]
+    # results of every configuration are named like those of an ROI of the video
+    workers = [SweepWorker(c, get_track_path(master_path, c["name"])) for c in configs]
+    for worker in workers:
+        worker.start()
+
+    video = open_video(video_path)
+    count = 0
+    try:
+        while max_frames is None or count < max_frames:
+            r, frame = video.read()
+            if not r:
+                break
+            # the same buffer goes to every worker, workers do not modify frames
+            for worker in workers:
+                worker.frames.put(frame)
+            count = count + 1
+    finally:
+        video.release()
+        for worker in workers:
+            worker.frames.put(_end)
+        for worker in workers:
+            worker.join()
+
+    summaries = [worker.summary() for worker in workers]
+    with open(os.path.join(out_dir, base + "_sweep_summary.csv"), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(summaries[0].keys()))
+        writer.writeheader()
+        writer.writerows(summaries)
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse a video with many DataCollect configurations in one pass")
+    parser.add_argument("video", help="path to video, or manifest of a striped recording")
+    parser.add_argument("configs", help="JSON file with a list of configurations")
+    parser.add_argument("--out", default="sweep_results", help="directory to write results to")
+    parser.add_argument("--frames", type=int, default=None, help="only analyse this many frames")
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+    summaries = run_sweep(args.video, load_configs(args.configs), args.out, args.frames)
+    print("%-20s %8s %12s %8s %16s %10s" % ("name", "frames", "dets/frame", "tracks", "churn/100 frames",
+                                             "ms/frame"))
+    for s in summaries:
+        print("%-20s %8d %12.2f %8d %16.2f %10.2f" % (s["name"], s["frames"], s["detections_per_frame"], s["tracks"],
+                                                     s["id_churn_per_100_frames"], s["ms_per_frame"]))
+    print("done in %.1f s" % (time.perf_counter() - t))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import sys
+import numpy as np
+
+"""
+Binary store of tracking results. Rows are kept in a NumPy structured array of int32 columns (frame, id, x, y, w, h)
+with x, y the center of the object, buffered in memory and appended to the file in large chunks, so writing results
+costs one write per chunk instead of one per frame. The file is a fixed header followed by the raw rows, it is read back
+with np.memmap without parsing, and it can be cut back to any earlier size at a row boundary, see experiment/checkpoint.py.
+Rows missing in a file written by a process that was killed are those of its last unwritten chunk, a partly written last
+row is ignored.
+
+Results written by earlier versions as one JSON list of rows [xm, ym, w, h, id, frame] per frame after a header are
+converted by import_json.
+
+Usage: python -m experiment.track_store import videos/*_analysis.json
+Exits with status 1 if any file could not be converted.
+"""
+
+track_dtype = np.dtype([("frame", "<i4"), ("id", "<i4"), ("x", "<i4"), ("y", "<i4"), ("w", "<i4"), ("h", "<i4")])
+_magic = b"CIVTS-TRACKS-v1\n"
+_header_size = len(_magic)
+_json_suffix = "_analysis.json"
+_track_suffix = "_tracks.bin"
+
+
+def get_track_path(video_path, roi_name=None):
+    """
+    :param video_path: str path of a recording, for striped recordings the path given by get_master_path
+    :param roi_name: str name of ROI, None for a video without ROIs
+    :return: str path of the track store of the recording, or one ROI of it
+    """
+    if roi_name is None:
+        return video_path.rsplit('.', 1)[0] + _track_suffix
+    return video_path.rsplit('.', 1)[0] + "_" + roi_name + _track_suffix
+
+
+def rows_to_array(rows):
+    """
+    :param rows: list of rows [xm, ym, w, h, id, frame]
+    :return: structured array of track_dtype
+    """
+    rows = np.asarray(rows, dtype=np.int64).reshape(-1, 6)
+    tracks = np.empty(len(rows), dtype=track_dtype)
+    for column, name in enumerate(("x", "y", "w", "h", "id", "frame")):
+        tracks[name] = rows[:, column]
+    return tracks
+
+
+def array_to_rows(tracks):
+    """
+    :param tracks: structured array of track_dtype
+    :return: list of rows [xm, ym, w, h, id, frame]
+    """
+    return np.column_stack([tracks[name] for name in ("x", "y", "w", "h", "id", "frame")]).tolist()
+
+
+class TrackWriter:
+    """
+    Appends rows to a track store, use as a context manager or call close
+    """
+    def __init__(self, path, chunk_rows=65536, append=False):
+        """
+        :param path: str path of the track store
+        :param chunk_rows: int number of rows buffered before they are written
+        :param append: bool True to add to an existing store, a new store is started if there is none
+        """
+        self.path = path
+        self.buffer = np.empty(chunk_rows, dtype=track_dtype)
+        self.count = 0
+        if append and os.path.isfile(path) and os.path.getsize(path) >= _header_size:
+            check_header(path)
+            self.file = open(path, 'r+b')
+            # drop a partly written last row, so appended rows stay aligned
+            self.file.truncate(_header_size + (os.path.getsize(path) - _header_size) // track_dtype.itemsize *
+                               track_dtype.itemsize)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(_magic)
+
+    def add(self, rows):
+        """
+        :param rows: list of rows [xm, ym, w, h, id, frame]
+        :return: None
+        """
+        if len(rows) == 0:
+            return
+        tracks = rows_to_array(rows)
+        while len(tracks) > 0:
+            n = min(len(tracks), len(self.buffer) - self.count)
+            self.buffer[self.count:self.count + n] = tracks[:n]
+            self.count = self.count + n
+            tracks = tracks[n:]
+            if self.count == len(self.buffer):
+                self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows to the file
+        :return: None
+        """
+        if self.count > 0:
+            self.file.write(self.buffer[:self.count].tobytes())
+            self.count = 0
+        self.file.flush()
+
+    def truncate(self, frame):
+        """
+        Remove the rows of frame and all later frames, rows must have been added in the order of their frames
+        :param frame: int frame number, counting from 1
+        :return: None
+        """
+        self.flush()
+        self.file.truncate(_header_size + count_rows_before(self.path, frame) * track_dtype.itemsize)
+        self.file.seek(0, os.SEEK_END)
+
+    def close(self):
+        """
+        :return: None
+        """
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def check_header(path):
+    """
+    :param path: str path of a track store
+    :return: None, raises ValueError if path is not a track store
+    """
+    with open(path, 'rb') as f:
+        if f.read(_header_size) != _magic:
+            raise ValueError("'" + path + "' is not a track store")
+
+
+def open_tracks(path):
+    """
+    :param path: str path of a track store
+    :return: read-only structured array of track_dtype mapped onto the file
+    """
+    check_header(path)
+    count = (os.path.getsize(path) - _header_size) // track_dtype.itemsize
+    if count == 0:
+        return np.empty(0, dtype=track_dtype)
+    return np.memmap(path, dtype=track_dtype, mode='r', offset=_header_size, shape=(count,))
+
+
+def count_rows_before(path, frame):
+    """
+    Binary search of a track store ordered by frame, reading only the rows compared
+    :param path: str path of a track store
+    :param frame: int frame number, counting from 1
+    :return: int number of rows of frames before frame
+    """
+    tracks = open_tracks(path)
+    low = 0
+    high = len(tracks)
+    while low < high:
+        middle = (low + high) // 2
+        if tracks[middle]["frame"] < frame:
+            low = middle + 1
+        else:
+            high = middle
+    # the mapping must be closed before the file can be truncated on Windows
+    del tracks
+    return low
+
+
+def write_tracks(path, rows):
+    """
+    :param path: str path of the track store
+    :param rows: list of rows [xm, ym, w, h, id, frame]
+    :return: bool True on success
+    """
+    try:
+        with TrackWriter(path) as writer:
+            writer.add(rows)
+        return True
+    except (IOError, OSError) as e:
+        print("An error occurred when writing points data:")
+        print(e)
+        return False
+
+
+def read_json_rows(path):
+    """
+    :param path: str path of results written as JSON documents one after another, the first being a header
+    :return: list of rows [xm, ym, w, h, id, frame]
+    """
+    with open(path, 'r') as f:
+        text = f.read()
+    decoder = json.JSONDecoder()
+    rows = []
+    position = 0
+    while True:
+        while position < len(text) and text[position].isspace():
+            position = position + 1
+        if position == len(text):
+            return rows
+        document, position = decoder.raw_decode(text, position)
+        if isinstance(document, list):
+            rows.extend(document)
+
+
+def import_json(json_path, track_path=None):
+    """
+    Convert results written as JSON into a track store
+    :param json_path: str path of an _analysis.json file
+    :param track_path: str path of the track store to write, the one of the same recording and ROI if None
+    :return: str path of the track store written, None on failure
+    """
+    if track_path is None:
+        if not json_path.endswith(_json_suffix):
+            print("Cannot name track store of '" + json_path + "', pass its path")
+            return None
+        track_path = json_path[0:-len(_json_suffix)] + _track_suffix
+    try:
+        rows = read_json_rows(json_path)
+    except (IOError, ValueError) as e:
+        print("An error occurred when reading '" + json_path + "'")
+        print(e)
+        return None
+    if not write_tracks(track_path, rows):
+        return None
+    return track_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert tracking results written as JSON into track stores")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="convert _analysis.json files")
+    import_parser.add_argument("files", nargs="+", help="_analysis.json files")
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.files:
+        track_path = import_json(path)
+        if track_path is None:
+            failed = failed + 1
+        else:
+            print(path + ": " + str(len(open_tracks(track_path))) + " rows written to " + track_path)
+    return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
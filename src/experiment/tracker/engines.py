@@ -0,0 +1,27 @@
+from experiment.tracker.tracker import init_tracker
+from experiment.tracker.optimal_tracker import OptimalTracker
+
+"""
+Module providing the selectable tracker engines. Every engine is a subclass of init_tracker and shares its interface:
+update() takes a list of [x, y, w, h] detections and returns a list of [x, y, w, h, id], engines only differ in how
+detections are assigned to tracks.
+
+greedy: each detection takes the nearest track left, fast but detection order can decide identities
+optimal: minimal total distance per connected group of detections and tracks
+"""
+
+tracker_engines = {"greedy": init_tracker, "optimal": OptimalTracker}
+
+
+def make_tracker(engine, pop_num, frames, **kwargs):
+    """
+    Instantiate a tracker engine by name
+    :param engine: str name of engine, a key of tracker_engines
+    :param pop_num: expected population size
+    :param frames: number of frames a lost id is reserved for
+    :param kwargs: further arguments to the engine, such as lost_gate and match_gate
+    :return: tracker instance
+    """
+    if engine not in tracker_engines:
+        raise ValueError("Unknown tracker engine '" + str(engine) + "', choose from " + ", ".join(tracker_engines))
+    return tracker_engines[engine](pop_num, frames, **kwargs)
@@ -0,0 +1,34 @@
+import heapq
+
+
+class IdAllocator:
+    """
+    Hands out tracking ids, always the lowest free one. Released ids are kept in a min-heap and fresh ids come from a
+    counter, so there is no upper limit on the number of ids in use and allocating or releasing costs O(log n).
+    """
+    def __init__(self, pop_num=0, first_id=0):
+        """
+        :param pop_num: expected population size, ids first_id to first_id + pop_num - 1 are handed out first
+        :param first_id: int lowest id handed out
+        """
+        # a sorted list is a valid heap
+        self.free_ids = list(range(first_id, first_id + pop_num))
+        self.next_id = first_id + pop_num
+
+    def allocate(self):
+        """
+        :return: int lowest id not in use
+        """
+        if len(self.free_ids) > 0:
+            return heapq.heappop(self.free_ids)
+        new_id = self.next_id
+        self.next_id = self.next_id + 1
+        return new_id
+
+    def release(self, object_id):
+        """
+        Return an id so it can be handed out again. Must only be called once for every allocated id.
+        :param object_id: int id to release
+        :return: None
+        """
+        heapq.heappush(self.free_ids, object_id)
@@ -0,0 +1,137 @@
+import numpy as np
+
+"""
+Constant velocity motion model for the tracker. Every track has a Kalman filter with position and velocity as state,
+the x and y axes are filtered independently with the same noise, so one 2x2 covariance per track is enough. All tracks
+are stored in arrays and predicted and corrected together.
+"""
+
+
+class ConstantVelocityModel:
+    def __init__(self, process_noise=0.5, measurement_noise=2.0, initial_velocity_noise=25.0, capacity=64):
+        """
+        :param process_noise: standard deviation of the change in velocity per frame in pixels
+        :param measurement_noise: standard deviation of detected centers in pixels
+        :param initial_velocity_noise: standard deviation of the velocity of a new track in pixels per frame
+        :param capacity: initial number of tracks to allocate room for, grows when needed
+        """
+        self.process_var = process_noise ** 2
+        self.measurement_var = measurement_noise ** 2
+        self.initial_velocity_var = initial_velocity_noise ** 2
+
+        # rows of [x, y, vx, vy] and of the covariance [p_pos, p_pos_vel, p_vel] of a single axis
+        self.state = np.zeros((capacity, 4))
+        self.cov = np.zeros((capacity, 3))
+        self.active = np.zeros(capacity, dtype=bool)
+        self.slot = {}
+        self.free_slots = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.slot)
+
+    def __contains__(self, key):
+        return key in self.slot
+
+    def grow(self):
+        capacity = len(self.active)
+        self.state = np.concatenate((self.state, np.zeros((capacity, 4))))
+        self.cov = np.concatenate((self.cov, np.zeros((capacity, 3))))
+        self.active = np.concatenate((self.active, np.zeros(capacity, dtype=bool)))
+        self.free_slots.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def add(self, key, point):
+        """
+        Start a track standing still at point, replacing the track of key if there is one
+        :param key: hashable key of the track, e.g. a tracking id
+        :param point: tuple (x, y)
+        :return: None
+        """
+        if key not in self.slot:
+            if len(self.free_slots) == 0:
+                self.grow()
+            self.slot[key] = self.free_slots.pop()
+        s = self.slot[key]
+        self.state[s] = (point[0], point[1], 0, 0)
+        self.cov[s] = (self.measurement_var, 0, self.initial_velocity_var)
+        self.active[s] = True
+
+    def remove(self, key):
+        """
+        Stop tracking key, does nothing if key has no track
+        :param key: key of the track
+        :return: None
+        """
+        s = self.slot.pop(key, None)
+        if s is not None:
+            self.active[s] = False
+            self.free_slots.append(s)
+
+    def predict(self, dt=1):
+        """
+        Move every track ahead by dt frames
+        :param dt: number of frames since the last prediction
+        :return: None
+        """
+        state = self.state[self.active]
+        p00, p01, p11 = self.cov[self.active].T
+        state[:, 0:2] += state[:, 2:4] * dt
+        # covariance F P F^T + Q with F = [[1, dt], [0, 1]] and Q for a random change in velocity
+        q = self.process_var
+        cov = np.column_stack((p00 + 2 * dt * p01 + dt * dt * p11 + q * dt ** 4 / 4,
+                               p01 + dt * p11 + q * dt ** 3 / 2,
+                               p11 + q * dt * dt))
+        self.state[self.active] = state
+        self.cov[self.active] = cov
+
+    def correct(self, keys, points):
+        """
+        Update tracks with their detected positions
+        :param keys: list of track keys
+        :param points: (n, 2) array of detected positions, one per key
+        :return: None
+        """
+        if len(keys) == 0:
+            return
+        slots = np.array([self.slot[k] for k in keys], dtype=np.int64)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        p00, p01, p11 = self.cov[slots].T
+        gain_pos = p00 / (p00 + self.measurement_var)
+        gain_vel = p01 / (p00 + self.measurement_var)
+        innovation = points - self.state[slots, 0:2]
+        self.state[slots, 0:2] += gain_pos[:, None] * innovation
+        self.state[slots, 2:4] += gain_vel[:, None] * innovation
+        self.cov[slots] = np.column_stack(((1 - gain_pos) * p00, (1 - gain_pos) * p01, p11 - gain_vel * p01))
+
+    def get_state(self):
+        """
+        :return: dictionary of the state of all tracks, for checkpoints
+        """
+        return {"slot": [[key, s] for key, s in self.slot.items()], "state": self.state.tolist(),
+                "cov": self.cov.tolist(), "active": self.active.tolist(), "free_slots": list(self.free_slots)}
+
+    def set_state(self, state):
+        """
+        :param state: dictionary from get_state
+        :return: None
+        """
+        self.slot = {key: s for key, s in state["slot"]}
+        self.state = np.array(state["state"], dtype=np.float64).reshape(-1, 4)
+        self.cov = np.array(state["cov"], dtype=np.float64).reshape(-1, 3)
+        self.active = np.array(state["active"], dtype=bool)
+        self.free_slots = list(state["free_slots"])
+
+    def position_std(self, keys):
+        """
+        :param keys: list of track keys
+        :return: (n,) array of the standard deviation of the estimated position of every key along one axis
+        """
+        slots = np.array([self.slot[k] for k in keys], dtype=np.int64)
+        return np.sqrt(self.cov[slots, 0])
+
+    def positions(self, keys):
+        """
+        :param keys: list of track keys
+        :return: (n, 2) array of the estimated position of every key
+        """
+        slots = np.array([self.slot[k] for k in keys], dtype=np.int64)
+        return self.state[slots, 0:2]
@@ -0,0 +1,131 @@
+import numpy as np
+from experiment.tracker.tracker import init_tracker
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+def hungarian(cost):
+    """
+    Pure NumPy minimum cost assignment, used when scipy is not installed. Shortest augmenting path version of the
+    Hungarian algorithm, O(n^2 m) for an n by m matrix with n <= m, with the inner loop over columns vectorized.
+    :param cost: 2d array of finite costs
+    :return: tuple (array of row indices, array of column indices) of the assignment, sorted by row
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    # potentials, and the row assigned to every column, index 0 is a virtual column used to start each search
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            improved = free & (reduced < minv[1:])
+            minv[1:][improved] = reduced[improved]
+            way[1:][improved] = j0
+            j1 = int(np.argmin(np.where(free, minv[1:], np.inf))) + 1
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        # flip the augmenting path
+        while j0 != 0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(p[1:] > 0)
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def connected_components(det, track):
+    """
+    Label the connected components of the bipartite gating graph given by candidate pairs
+    :param det: array of detection indices, one per candidate pair
+    :param track: array of track ids, one per candidate pair
+    :return: array of component labels, one per candidate pair
+    """
+    det_nodes, det_index = np.unique(det, return_inverse=True)
+    _, track_index = np.unique(track, return_inverse=True)
+    parent = list(range(det_nodes.size + int(track_index.max(initial=-1)) + 1))
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for a, b in zip(det_index.tolist(), (track_index + det_nodes.size).tolist()):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[root_a] = root_b
+    return np.array([find(a) for a in det_index.tolist()], dtype=np.int64)
+
+
+class OptimalTracker(init_tracker):
+    """
+    Tracker engine assigning detections to tracks with the globally minimal total distance, instead of greedily.
+    The gating graph is split into connected components first, so a crowded frame becomes many small independent
+    assignment problems.
+    """
+    def assign(self, det, track, cost):
+        """
+        :param det: array of detection indices, one per candidate pair
+        :param track: array of track ids, one per candidate pair
+        :param cost: array of squared distances, one per candidate pair
+        :return: tuple (array of detection indices, array of track ids) of assigned pairs
+        """
+        if det.size == 0:
+            return det, track
+        cost = np.sqrt(cost)
+        labels = connected_components(det, track)
+        order = np.argsort(labels, kind="stable")
+        starts = np.flatnonzero(np.r_[True, labels[order][1:] != labels[order][:-1]])
+        ends = np.r_[starts[1:], order.size]
+
+        det_matched = []
+        track_matched = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            pairs = order[start:end]
+            # with a single detection or a single track the cheapest pair is the optimal assignment
+            if pairs.size == 1 or np.all(det[pairs] == det[pairs[0]]) or np.all(track[pairs] == track[pairs[0]]):
+                best = pairs[np.argmin(cost[pairs])]
+                det_matched.append(det[best:best + 1])
+                track_matched.append(track[best:best + 1])
+                continue
+            rows, row_index = np.unique(det[pairs], return_inverse=True)
+            cols, col_index = np.unique(track[pairs], return_inverse=True)
+            # pairs outside the gate get a cost no assignment of gated pairs can reach
+            unreachable = cost[pairs].sum() + 1
+            matrix = np.full((rows.size, cols.size), unreachable)
+            matrix[row_index, col_index] = cost[pairs]
+            if linear_sum_assignment is not None:
+                r, c = linear_sum_assignment(matrix)
+            else:
+                r, c = hungarian(matrix)
+            gated = matrix[r, c] < unreachable
+            det_matched.append(rows[r[gated]])
+            track_matched.append(cols[c[gated]])
+        return np.concatenate(det_matched), np.concatenate(track_matched)
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class SpatialGrid:
+    """
+    Uniform grid over 2d points with integer keys, used by the tracker to only compare a detection against the tracks in
+    neighbouring cells. Points are kept in a dictionary, so moving a point costs a dictionary assignment. A query sorts
+    the points by cell and finds the points in the cells around every query point with NumPy, without a Python loop per
+    point.
+    """
+    def __init__(self, cell_size):
+        """
+        :param cell_size: smallest width and height of a cell in pixels, queries use cells as large as their radius
+        """
+        self.cell_size = cell_size
+        self.points = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    def __contains__(self, key):
+        return key in self.points
+
+    def insert(self, key, point):
+        """
+        Insert a point, or move it if key is already in the grid
+        :param key: int key of the point, e.g. a tracking id
+        :param point: tuple (x, y)
+        :return: None
+        """
+        self.points[key] = point
+
+    def remove(self, key):
+        """
+        Remove a point from the grid, does nothing if key is not in the grid
+        :param key: key of the point
+        :return: None
+        """
+        self.points.pop(key, None)
+
+    def query_pairs(self, points, radius):
+        """
+        Get all pairs of a query point and a point of the grid in a cell within radius of it. This is a superset of the
+        pairs within radius, callers compute exact distances themselves.
+        :param points: (n, 2) array of query points
+        :param radius: search radius in pixels
+        :return: tuple ((k,) int array of indices into points, (k,) int array of keys, (k, 2) float array of the grid
+        points), one entry per pair
+        """
+        keys = np.fromiter(self.points.keys(), dtype=np.int64, count=len(self.points))
+        grid_points = np.array(list(self.points.values()), dtype=np.float64).reshape(-1, 2)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(keys) == 0 or len(points) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, 2))
+
+        # with cells at least radius wide, all points within radius are in the 3x3 cells around a query point
+        size = max(self.cell_size, radius)
+        cells = np.floor(grid_points / size).astype(np.int64)
+        query_cells = np.floor(points / size).astype(np.int64)
+        # number every cell by column and row, with room for the rows next to the query points
+        low = min(cells[:, 1].min(), query_cells[:, 1].min() - 1)
+        rows = max(cells[:, 1].max(), query_cells[:, 1].max() + 1) - low + 1
+        order = np.argsort(cells[:, 0] * rows + cells[:, 1] - low, kind="stable")
+        sorted_cells = (cells[:, 0] * rows + cells[:, 1] - low)[order]
+
+        index = []
+        found = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cell = (query_cells[:, 0] + dx) * rows + query_cells[:, 1] + dy - low
+                first = np.searchsorted(sorted_cells, cell, side="left")
+                counts = np.searchsorted(sorted_cells, cell, side="right") - first
+                # the positions first, first + 1, ... first + count - 1 in the sorted points of every query point
+                starts = np.repeat(first - np.cumsum(counts) + counts, counts)
+                index.append(np.repeat(np.arange(len(points)), counts))
+                found.append(order[starts + np.arange(counts.sum())])
+        index = np.concatenate(index)
+        found = np.concatenate(found)
+        return index, keys[found], grid_points[found]
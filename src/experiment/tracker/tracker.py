@@ -1,12 +1,100 @@
-import math
+import numpy as np
+from experiment.tracker.spatial_grid import SpatialGrid
+from experiment.tracker.id_allocator import IdAllocator
+from experiment.tracker.motion import ConstantVelocityModel
+
+# Below this many detection and track pairs comparing against all tracks is cheaper than grid lookups
+_grid_min_pairs = 200000
+
+
+def gated_greedy_assignment(det, track, cost):
+    """
+    Assign detections to tracks greedily by cost, given the candidate pairs that passed gating. Every detection proposes
+    its cheapest pair, every track accepts the cheapest proposal it gets, and the rejected detections propose again
+    among the remaining tracks.
+    :param det: array of detection indices, one per candidate pair
+    :param track: array of track ids, one per candidate pair
+    :param cost: array of costs, e.g. squared distances, one per candidate pair
+    :return: tuple (array of detection indices, array of track ids) of assigned pairs
+    """
+    det_matched = []
+    track_matched = []
+    while det.size > 0:
+        # sort by detection, then cost: the first pair of every detection is its proposal
+        order = np.lexsort((cost, det))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = det[order][1:] != det[order][:-1]
+        proposals = order[first]
+
+        # sort proposals by track, then cost: the first proposal of every track wins
+        proposals = proposals[np.lexsort((cost[proposals], track[proposals]))]
+        first = np.ones(proposals.size, dtype=bool)
+        first[1:] = track[proposals][1:] != track[proposals][:-1]
+        winners = proposals[first]
+
+        det_matched.append(det[winners])
+        track_matched.append(track[winners])
+        remaining = ~np.isin(det, det[winners]) & ~np.isin(track, track[winners])
+        det, track, cost = det[remaining], track[remaining], cost[remaining]
+
+    if len(det_matched) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(det_matched), np.concatenate(track_matched)
+
+
+def distance_matrix(points_a, points_b):
+    """
+    :param points_a: (n, 2) array of points
+    :param points_b: (m, 2) array of points
+    :return: (n, m) float32 array of squared euclidean distances between every pair of points
+    """
+    points_a = np.asarray(points_a, dtype=np.float32)
+    points_b = np.asarray(points_b, dtype=np.float32)
+    dx = points_a[:, 0, None] - points_b[None, :, 0]
+    dy = points_a[:, 1, None] - points_b[None, :, 1]
+    return dx * dx + dy * dy
+
+
+def candidate_pairs(centers, det_indices, grid, gate, spatial_index=None):
+    """
+    Find all detection and track pairs closer than gate
+    :param centers: (n, 2) array of detection centers
+    :param det_indices: array of indices into centers of the detections to consider
+    :param grid: SpatialGrid holding the track points
+    :param gate: max distance of a pair in pixels
+    :param spatial_index: look up tracks in neighbouring grid cells when true, compare against all tracks when false,
+    None picks whichever is cheaper for the number of detections and tracks
+    :return: tuple (array of detection indices, array of track ids, array of squared distances)
+    """
+    if det_indices.size == 0 or len(grid) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+
+    if spatial_index is None:
+        spatial_index = det_indices.size * len(grid) >= _grid_min_pairs
+    if spatial_index:
+        index, track, track_points = grid.query_pairs(centers[det_indices], gate)
+        det = det_indices[index]
+        diff = centers[det].astype(np.float32) - track_points.astype(np.float32)
+        dist = (diff * diff).sum(axis=1)
+    else:
+        keys = np.array(list(grid.points.keys()), dtype=np.int64)
+        matrix = distance_matrix(centers[det_indices], [grid.points[k] for k in keys.tolist()])
+        rows, cols = np.nonzero(matrix < gate * gate)
+        det, track, dist = det_indices[rows], keys[cols], matrix[rows, cols]
+
+    gated = dist < gate * gate
+    return det[gated], track[gated], dist[gated]
+
 
 class init_tracker:
-    def __init__(self,pop_num,frames):
+    def __init__(self, pop_num, frames, lost_gate=20, match_gate=30, spatial_index=None, motion=False, first_id=0):
         # Store the center positions of the objects
         self.center_points = {}
 
-        #  A list with numbers 1-pop_num
-        self.population_id_list = list(range(0, pop_num))
+        # Hands out ids, starting with first_id to first_id + pop_num - 1 and growing beyond when more objects are
+        # tracked
+        self.id_allocator = IdAllocator(pop_num, first_id)
 
         # Dictionary to store lost id's
         self.lost_id = {}
@@ -14,75 +102,164 @@ class init_tracker:
         # the number of frames the object is allowed to disappear
         self.frames = frames
 
-    def update(self, objects_rect):
+        # Max distance in pixels per frame to recover a lost id, and to match a tracked id, they grow with the frames
+        # between updates
+        self.lost_gate = lost_gate
+        self.match_gate = match_gate
 
-        # Objects boxes and ids
-        objects_bbs_ids = []
+        # Grids over the center points of tracked and lost id's, kept in sync with center_points and lost_id
+        self.spatial_index = spatial_index
+        self.track_grid = SpatialGrid(max(lost_gate, match_gate))
+        self.lost_grid = SpatialGrid(max(lost_gate, match_gate))
+
+        # Optional constant velocity model, detections are then matched against predicted instead of last positions
+        self.motion = ConstantVelocityModel() if motion else None
+
+    def assign(self, det, track, cost):
+        """
+        Decide which detections continue which tracks, overridden by other tracker engines
+        :param det: array of detection indices, one per candidate pair
+        :param track: array of track ids, one per candidate pair
+        :param cost: array of squared distances, one per candidate pair
+        :return: tuple (array of detection indices, array of track ids) of assigned pairs
+        """
+        return gated_greedy_assignment(det, track, cost)
 
-        # Get center point of new object
-        for rect in objects_rect:
-            x, y, w, h = rect
-            cx = (x + x + w) // 2
-            cy = (y + y + h) // 2
+    def get_state(self):
+        """
+        :return: dictionary of tracked and lost id's and free ids, for checkpoints
+        """
+        return {"center_points": [[key, x, y] for key, (x, y) in self.center_points.items()],
+                "lost_id": [[key, x, y, frames] for key, ((x, y), frames) in self.lost_id.items()],
+                "free_ids": list(self.id_allocator.free_ids), "next_id": self.id_allocator.next_id,
+                "motion": None if self.motion is None else self.motion.get_state()}
 
-            same_object_detected = False
-            lost_retrieved = False
+    def set_state(self, state):
+        """
+        Continue tracking from a state returned by get_state
+        :param state: dictionary of tracker state
+        :return: None
+        """
+        self.center_points = {key: (x, y) for key, x, y in state["center_points"]}
+        self.lost_id = {key: ((x, y), frames) for key, x, y, frames in state["lost_id"]}
+        self.id_allocator.free_ids = list(state["free_ids"])
+        self.id_allocator.next_id = state["next_id"]
+        self.track_grid = SpatialGrid(self.track_grid.cell_size)
+        self.lost_grid = SpatialGrid(self.lost_grid.cell_size)
+        for key, point in self.center_points.items():
+            self.track_grid.insert(key, point)
+        for key, (point, _) in self.lost_id.items():
+            self.lost_grid.insert(key, point)
+        if self.motion is not None and state["motion"] is not None:
+            self.motion.set_state(state["motion"])
 
-            # Checking to see if the new bject is in the same spot as one of the lost objects
-            for id, centerp in self.lost_id.items():
-                cxl, cyl = centerp[0]
-                dist = math.hypot(cx - cxl, cy - cyl)
-                if dist < 20:
-                    self.center_points[id] = (cx, cy)
-                    objects_bbs_ids.append([x, y, w, h, id])
-                    self.lost_id.pop(id, None)
-                    lost_retrieved = True
-                    break
+    def predict(self, dt):
+        """
+        Move tracked and lost id's to their predicted positions in the grids
+        :param dt: number of frames since the previous update
+        :return: None
+        """
+        self.motion.predict(dt)
+        for grid in (self.track_grid, self.lost_grid):
+            keys = list(grid.points.keys())
+            if len(keys) > 0:
+                for key, point in zip(keys, self.motion.positions(keys).tolist()):
+                    grid.insert(key, tuple(point))
 
+    def gate_predicted(self, det, track, dist, gate):
+        """
+        Keep only the candidate pairs whose detection lies within gate plus three standard deviations of the
+        predicted position of the track, see update
+        :param det: array of detection indices, one per candidate pair
+        :param track: array of track ids, one per candidate pair
+        :param dist: array of squared distances, one per candidate pair
+        :param gate: float distance in pixels allowed beyond the uncertainty of the prediction
+        :return: tuple (array of detection indices, array of track ids, array of squared distances) of the kept pairs
+        """
+        if track.size == 0:
+            return det, track, dist
+        radius = gate + 3 * self.motion.position_std(track.tolist())
+        kept = dist < radius * radius
+        return det[kept], track[kept], dist[kept]
 
-            # Find out if that object was detected already
-            # print(self.center_points)
-            if lost_retrieved is False:
+    def update(self, objects_rect, dt=1):
+        """
+        :param objects_rect: list of [x, y, w, h] detections
+        :param dt: number of frames since the previous update, more than 1 when detection skips frames
+        :return: list of [x, y, w, h, id] per detection
+        """
+
+        # Objects boxes and ids
+        objects_bbs_ids = []
 
-                for id, pt in self.center_points.items():
-                    dist = math.hypot(cx - pt[0], cy - pt[1])
+        if self.motion is not None:
+            self.predict(dt)
 
-                    ### change distance if id increase from flicker is detected
-                    if dist < 30:
-                        self.center_points[id] = (cx, cy)
-                        #print(self.center_points)
-                        objects_bbs_ids.append([x, y, w, h, id])
-                        same_object_detected = True
-                        break
+        rects = np.asarray(objects_rect, dtype=np.int64).reshape(-1, 4)
+        centers = np.column_stack(((2 * rects[:, 0] + rects[:, 2]) // 2, (2 * rects[:, 1] + rects[:, 3]) // 2))
+        ids = np.full(len(rects), -1, dtype=np.int64)
 
+        # With a motion model, tracked id's take the objects close to their predicted positions first. Gates scaled by
+        # the frames between updates are then only used for objects that moved unexpectedly, and do not let tracks
+        # take the objects of their neighbours. Matched id's leave the grid until their new centers are inserted.
+        if self.motion is not None:
+            det, track, dist = candidate_pairs(centers, np.arange(len(rects)), self.track_grid, self.match_gate * dt,
+                                               self.spatial_index)
+            det, track, dist = self.gate_predicted(det, track, dist, self.match_gate)
+            det, track = self.assign(det, track, dist)
+            ids[det] = track
+            for matched in track.tolist():
+                self.track_grid.remove(matched)
 
+        # Checking to see if the new objects are in the same spot as one of the lost objects
+        det, track, dist = candidate_pairs(centers, np.flatnonzero(ids < 0), self.lost_grid, self.lost_gate * dt,
+                                           self.spatial_index)
+        det, track = self.assign(det, track, dist)
+        ids[det] = track
+        for lost in track.tolist():
+            self.lost_id.pop(lost, None)
+            self.lost_grid.remove(lost)
+
+        # Find out if the remaining objects were detected already
+        det, track, dist = candidate_pairs(centers, np.flatnonzero(ids < 0), self.track_grid, self.match_gate * dt,
+                                           self.spatial_index)
+        det, track = self.assign(det, track, dist)
+        ids[det] = track
+
+        if self.motion is not None:
+            matched = np.flatnonzero(ids >= 0)
+            self.motion.correct(ids[matched].tolist(), centers[matched])
+
+        for rect, center, object_id in zip(rects.tolist(), centers.tolist(), ids.tolist()):
             # New object is detected we assign the ID to that object
-            if same_object_detected is False and lost_retrieved is False:
-                self.center_points[self.population_id_list[0]] = (cx, cy)
-                objects_bbs_ids.append([x, y, w, h, self.population_id_list[0]])
-                self.population_id_list.pop(0)
+            if object_id < 0:
+                object_id = self.id_allocator.allocate()
+                if self.motion is not None:
+                    self.motion.add(object_id, center)
+            self.center_points[object_id] = tuple(center)
+            self.track_grid.insert(object_id, self.center_points[object_id])
+            objects_bbs_ids.append(rect + [object_id])
 
         # Clean the dictionary by center points to remove IDS not used anymore
         new_center_points = {}
-        #self.population_id_list = (range(1, pop_num))
         for obj_bb_id in objects_bbs_ids:
             _, _, _, _, object_id = obj_bb_id
             center = self.center_points[object_id]
             new_center_points[object_id] = center
 
-
-        # Adding lost id's to population id array.
+        # Moving id's not seen this frame to the lost id's, they stay reserved until recovered or cleared
         for key in self.center_points.keys():
 
-            if key not in new_center_points.keys():
-                self.population_id_list.append(key)
+            if key not in new_center_points:
                 self.lost_id[key] = (self.center_points[key], 0)
+                self.track_grid.remove(key)
+                self.lost_grid.insert(key, self.center_points[key])
 
         # Counting up frames that the id has been lost
         for keys in self.lost_id.keys():
-            self.lost_id[keys] = (self.lost_id[keys][0], self.lost_id[keys][1]+1)
+            self.lost_id[keys] = (self.lost_id[keys][0], self.lost_id[keys][1]+dt)
 
-        # Removing and appending lost id's
+        # Removing lost id's and releasing them for reuse
         clear_ids = list()
         for p in self.lost_id.keys():
 
@@ -91,10 +268,11 @@ class init_tracker:
 
         for x in clear_ids:
             self.lost_id.pop(x,None)
-            self.population_id_list.append(x)
-
+            self.lost_grid.remove(x)
+            self.id_allocator.release(x)
+            if self.motion is not None:
+                self.motion.remove(x)
 
         self.center_points = new_center_points.copy()
 
-
         return objects_bbs_ids